@@ -46,6 +46,7 @@ from ap.common.constants import (
     NO_CACHING_ENDPOINTS,
     PORT,
     PROCESS_QUEUE,
+    REQUEST_PROFILE_ID_HEADER,
     REQUEST_THREAD_ID,
     SERVER_ADDR,
     SHUTDOWN,
@@ -66,6 +67,7 @@ from ap.common.ga import GA, GA_TRACKING_ID, VERSION_FILE_NAME, AppGroup, AppSou
 from ap.common.jobs.scheduler import CustomizeScheduler
 from ap.common.logger import log_execution_time
 from ap.common.path_utils import count_file_in_folder, make_dir, resource_path
+from ap.common.request_profile import RequestProfiles
 from ap.common.services.http_content import json_dumps
 from ap.common.services.request_time_out_handler import RequestTimeOutAPI, set_request_g_dict
 from ap.common.trace_data_log import TraceErrKey, get_log_attr
@@ -442,6 +444,8 @@ def create_app(object_name=None, is_main=False):
     @app.before_request
     def before_request_callback():
         g.request_start_time = time.time()
+        if RequestProfiles.is_enabled(request):
+            g.setdefault(FlaskGKey.REQUEST_PROFILE, RequestProfiles.start(request.endpoint or request.path))
         # get the last time user request
         global dic_request_info
 
@@ -456,6 +460,12 @@ def create_app(object_name=None, is_main=False):
 
     @app.after_request
     def after_request_callback(response: Response):
+        request_profile = g.pop(FlaskGKey.REQUEST_PROFILE, None)
+        if request_profile:
+            RequestProfiles.finish(*request_profile)
+            profile_id, *_ = request_profile
+            response.headers[REQUEST_PROFILE_ID_HEADER] = profile_id
+
         if 'event-stream' in str(request.accept_mimetypes):
             return response
 
@@ -557,6 +567,13 @@ def create_app(object_name=None, is_main=False):
         response = json_dumps(e.parse())
         return Response(response=response, status=status)
 
+    @app.teardown_request
+    def teardown_request_callback(exception=None):
+        # request failed before `after_request`, do not leave its profile in this thread
+        request_profile = g.pop(FlaskGKey.REQUEST_PROFILE, None)
+        if request_profile:
+            RequestProfiles.finish(*request_profile)
+
     @app.teardown_appcontext
     def shutdown_session(exception=None):
         # close app db session
@@ -1,7 +1,10 @@
+import logging
+
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
 from sklearn.preprocessing import StandardScaler
+from sklearn.utils.extmath import randomized_svd, svd_flip
 
 from ap.api.common.services.show_graph_services import (
     convert_datetime_to_ct,
@@ -58,6 +61,8 @@ from ap.common.trace_data_log import (
 # ------------------------------------START TRACING DATA TO SHOW ON GRAPH-----------------------------
 from ap.trace_data.schemas import DicParam
 
+logger = logging.getLogger(__name__)
+
 
 @log_execution_time('[PCA]')
 @request_timeout_handling()
@@ -499,13 +504,13 @@ def run_pca_and_calc_t2q(X_train, X_test, varnames: list, dic_selected_vars: dic
             json_pca_biplot
 
     """
-    pca = PCA()
+    threshold = 80
+    pca = PCA(svd_solver='auto', cum_explained_threshold=threshold)
     pca.fit(X_train)
     pca.x = pca.transform(X_train)
     pca.newx = pca.transform(X_test)
     dic_biplot = _calc_biplot_data(pca, varnames=varnames, dic_selected_vars=dic_selected_vars)
 
-    threshold = 80
     num_pc = np.where(pca.cum_explained >= threshold)[0][0] + 1
     dic_t2q_lrn = _calc_mspc_t2q(pca, X_train, num_pc)
     dic_t2q_tst = _calc_mspc_t2q(pca, X_test, num_pc)
@@ -522,6 +527,20 @@ class PCA:
 
     Note that sklearn's PCA function does not return rotation matrix.
 
+    Parameters
+    ----------
+    scale: bool
+        If True, scale date to zero mean unit variance.
+    svd_solver: str
+        'full': eigen decomposition of the full covariance matrix.
+        'randomized': randomized truncated SVD of the data matrix. Only the leading components are computed,
+            enough to reach `cum_explained_threshold` (or `n_components` if given).
+        'auto': 'randomized' if number of variables >= RANDOMIZED_MIN_VARS, otherwise 'full'.
+    n_components: int
+        Number of components computed by randomized solver. If None, determined by `cum_explained_threshold`.
+    cum_explained_threshold: float
+        Ratio[%] of cumulative variance that computed components must explain (randomized solver only).
+
     Attributes
     ----------
     sdev: ndarray
@@ -532,18 +551,27 @@ class PCA:
         1D array of ratio[%] of variance explained in each principle components.
     cum_explained: ndarray
         1D array of ratio[%] of cumulative variance explained.
-    scale: bool
-        If True, scale date to zero mean unit variance.
+    feature_var: ndarray
+        1D array of variance of each (scaled) variable, i.e. diagonal of covariance matrix.
     scaler: StandardScaler instance
         Scaler fitted with data given to fit().
     """
 
-    def __init__(self, scale=True):
+    RANDOMIZED_MIN_VARS = 1000
+    RANDOMIZED_INIT_COMPONENTS = 20
+    # max relative residual |C v - lambda v| / lambda of randomized components, else fallback to 'full'
+    RANDOMIZED_TOLERANCE = 1e-3
+
+    def __init__(self, scale=True, svd_solver='full', n_components=None, cum_explained_threshold=100):
         self.sdev = None
         self.rotation = None
         self.var_explained = None
         self.cum_explained = None
+        self.feature_var = None
         self.scale = scale
+        self.svd_solver = svd_solver
+        self.n_components = n_components
+        self.cum_explained_threshold = cum_explained_threshold
         self.scaler = None
         self.x = None
         self.newx = None
@@ -552,6 +580,18 @@ class PCA:
         if self.scale:
             self.scaler = StandardScaler().fit(X)
             X = self.scaler.transform(X)
+        X = np.asarray(X, dtype=np.float64)
+
+        svd_solver = self.svd_solver
+        if svd_solver == 'auto':
+            svd_solver = 'randomized' if X.shape[1] >= self.RANDOMIZED_MIN_VARS else 'full'
+
+        if svd_solver == 'randomized' and self._fit_randomized(X):
+            return
+
+        self._fit_full(X)
+
+    def _fit_full(self, X):
         covmat = np.cov(X.T)
 
         # note that eig() does not return eigen values in descending order
@@ -564,6 +604,48 @@ class PCA:
         self.sdev = np.sqrt(eig_vals)
         self.var_explained = eig_vals / np.sum(eig_vals) * 100
         self.cum_explained = np.cumsum(self.var_explained)
+        self.feature_var = np.diag(covmat)
+
+    def _fit_randomized(self, X) -> bool:
+        """Compute leading components only, by randomized SVD of centered data matrix.
+        Return False if the result is not accurate enough, so that caller falls back to full decomposition.
+        """
+        num_rows, num_vars = X.shape
+        X = X - X.mean(axis=0)
+        # total variance (= sum of all eigen values) is known without decomposition
+        feature_var = np.einsum('ij,ij->j', X, X) / (num_rows - 1)
+        total_var = np.sum(feature_var)
+
+        n_components = self.n_components or min(self.RANDOMIZED_INIT_COMPONENTS, num_vars)
+        while True:
+            if n_components * 2 > num_vars:
+                # no gain from randomized solver
+                return False
+
+            u, s, vt = randomized_svd(X, n_components, n_iter=4, random_state=0)
+            u, vt = svd_flip(u, vt)
+            eig_vals = s**2 / (num_rows - 1)
+            cum_explained = np.cumsum(eig_vals / total_var * 100)
+            if self.n_components or cum_explained[-1] >= self.cum_explained_threshold:
+                break
+
+            n_components *= 2
+
+        # accuracy check against exact eigen problem: C v = lambda v, C = X.T @ X / (n - 1)
+        rotation = vt.T
+        cov_v = X.T @ (X @ rotation) / (num_rows - 1)
+        residuals = np.linalg.norm(cov_v - rotation * eig_vals, axis=0) / np.maximum(eig_vals, np.finfo(float).eps)
+        num_checked = np.searchsorted(cum_explained, min(self.cum_explained_threshold, cum_explained[-1])) + 1
+        if np.max(residuals[:num_checked]) > self.RANDOMIZED_TOLERANCE:
+            logger.info('Randomized PCA is not accurate enough. Use full eigen decomposition.')
+            return False
+
+        self.rotation = rotation
+        self.sdev = np.sqrt(eig_vals)
+        self.var_explained = eig_vals / total_var * 100
+        self.cum_explained = cum_explained
+        self.feature_var = feature_var
+        return True
 
     def transform(self, X):
         if self.scale:
@@ -581,7 +663,12 @@ def _calc_biplot_data(pca: dict, varnames: list, dic_selected_vars: dict, tgt_pc
     Data for scatter plot, arrows, circles (and axis labels)
     """
     dic_radius = _calc_biplot_circle_radius(pca.x)
-    dic_arrows = _calc_biplot_arrows(rotation=pca.rotation, sdev=pca.sdev, max_train=dic_radius['max'])
+    dic_arrows = _calc_biplot_arrows(
+        rotation=pca.rotation,
+        sdev=pca.sdev,
+        max_train=dic_radius['max'],
+        feature_var=None if pca.rotation.shape[1] == pca.rotation.shape[0] else pca.feature_var,
+    )
     df_circles = _gen_biplot_circles_dataframe(dic_radius)
     axislabs = _gen_biplot_axislabs(pca.var_explained)
     idx_tgt_pc = [x - 1 for x in tgt_pc]
@@ -643,13 +730,20 @@ def _gen_biplot_circles_dataframe(dic_radius: dict):
     return df_circles
 
 
-def _calc_biplot_arrows(rotation, sdev, max_train, var_name_adjust=1.5, tgt_pc=[1, 2]) -> dict:
-    """Calculate direction of arrows (loadings) for biplot"""
+def _calc_biplot_arrows(rotation, sdev, max_train, var_name_adjust=1.5, tgt_pc=[1, 2], feature_var=None) -> dict:
+    """Calculate direction of arrows (loadings) for biplot
+
+    If rotation is truncated (randomized PCA), `feature_var` (diagonal of covariance matrix) must be given,
+    since the sum of squared loadings over all components equals to the variance of each variable.
+    """
     dic_arrows = {'xval': None, 'yval': None, 'angle': None, 'hjust': None, 'varname': None}
 
     # x,y direction for arrows (length corresponds to eigen values)
     scaled_eig_vecs = rotation * sdev
-    max_len = np.sqrt(np.max(np.sum(scaled_eig_vecs**2, axis=1)))
+    if feature_var is None:
+        max_len = np.sqrt(np.max(np.sum(scaled_eig_vecs**2, axis=1)))
+    else:
+        max_len = np.sqrt(np.max(feature_var))
 
     idx_tgt_pc = [x - 1 for x in tgt_pc]
     direc = scaled_eig_vecs[:, idx_tgt_pc] * (max_train / max_len)
@@ -676,14 +770,21 @@ def _gen_biplot_axislabs(var_explained, tgt_pc=[1, 2]) -> list:
 
 
 def _calc_mspc_t2q(pca, X, num_pc=2) -> dict:
-    """PCA-MSPC: Calculate T2/Q statics and contributions"""
+    """PCA-MSPC: Calculate T2/Q statics and contributions
+    Contributions to T2 are taken from all components of full decomposition.
+    Rotation of randomized PCA is truncated, its trailing components are not computed,
+    so only the leading `num_pc` components (same as T2 stats) are taken.
+    """
     dic_t2q = {'stats': None, 'contr_t2': None, 'contr_q': None}
 
     # calculate T2 stats and contributions
     pc_score = pca.transform(X)
     sigma = np.std(pc_score, axis=0)
     t2_stats = np.sum((pc_score[:, :num_pc] ** 2) / sigma[:num_pc] ** 2, axis=1)
-    t2_contr = (pc_score / sigma) @ pca.rotation.T
+    rotation = pca.rotation
+    if rotation.shape[1] < rotation.shape[0]:
+        pc_score, sigma, rotation = pc_score[:, :num_pc], sigma[:num_pc], rotation[:, :num_pc]
+    t2_contr = (pc_score / sigma) @ rotation.T
 
     # calculate Q stats and contributions
     xstd = pca.scaler.transform(X)
@@ -7,13 +7,12 @@ from ap.api.co_occurrence.services import (
     calc_csv_graph_data,
     calc_pareto,
     filter_edge_by_threshold,
-    validate_csv_data,
+    gen_content_hash,
+    gen_cooccurrence_counts,
 )
-from ap.api.setting_module.services.csv_import import csv_to_df
 from ap.common.common_utils import get_csv_delimiter
 from ap.common.constants import AggregateBy
 from ap.common.services.http_content import orjson_dumps
-from ap.setting_module.models import CfgDataSourceCSV
 
 api_co_occurrence_blueprint = Blueprint('api_co_occurrence', __name__, url_prefix='/ap/api/cog')
 
@@ -54,35 +53,20 @@ def show_graph():
     layout = request.form.get('layout')
     aggregate_by = AggregateBy(aggregate_by)
 
-    data_src: CfgDataSourceCSV = CfgDataSourceCSV()
-    data_src.delimiter = delimiter
-
     # csv delimiter
     csv_delimiter = get_csv_delimiter(delimiter)
 
-    # read csv file
-    data_first_row = 1
-    skip_row = 0
-    df = csv_to_df(
-        file_path,
-        data_src,
-        [],
-        data_first_row,
-        skip_row,
-        csv_delimiter,
-        default_csv_param={},
-        from_file=from_file,
-    )
-
-    validate_result = validate_csv_data(df)
-    if isinstance(validate_result, Exception):
-        return validate_result, 200
+    # read csv file, counts are cached per file content
+    content_hash = gen_content_hash(file_path, csv_delimiter)
+    counts = gen_cooccurrence_counts(file_path, csv_delimiter, from_file, content_hash=content_hash)
+    if counts.error is not None:
+        return counts.error, 200
 
     # calc pareto data
-    pareto = calc_pareto(df)
+    pareto = calc_pareto(counts.df_hourly.reset_index())
 
     # calc_data
-    nodes, edges = calc_csv_graph_data(df, aggregate_by, pareto)
+    nodes, edges = calc_csv_graph_data(counts, aggregate_by, pareto)
     nodes = add_node_coordinate(nodes, layout=layout)
     edges = filter_edge_by_threshold(edges, threshold)
 
@@ -1,12 +1,22 @@
-import itertools
+from __future__ import annotations
+
+import dataclasses
+import hashlib
 import logging
+from io import BytesIO
+from typing import Optional
 
 import numpy as np
 import pandas as pd
 from flask_babel import gettext as _
 from pandas import DataFrame
 
-from ap.common.constants import CUM_RATIO_VALUE, AggregateBy
+from ap.api.setting_module.services.data_import import NA_VALUES
+from ap.common.common_utils import detect_encoding, detect_file_encoding
+from ap.common.constants import CUM_RATIO_VALUE, AggregateBy, CacheType
+from ap.common.logger import log_execution_time
+from ap.common.memoize import CustomCache
+from ap.common.services.normalization import normalize_str
 from ap.common.services.request_time_out_handler import abort_process_handler
 from ap.common.services.sse import MessageAnnouncer
 from ap.common.trace_data_log import EventAction, EventType, Target, TraceErrKey, trace_log
@@ -21,6 +31,30 @@ dic_colors = {
     'chart_title': '#3385b7',  # blue, same as other charts
 }
 
+# number of csv rows aggregated at once when building co-occurrence counts
+CSV_CHUNK_SIZE = 100_000
+HASH_BLOCK_SIZE = 2**20  # 1mb
+
+AGGREGATE_FREQS = {AggregateBy.HOUR: 'h', AggregateBy.DAY: 'D'}
+
+
+@dataclasses.dataclass
+class CooccurrenceCounts:
+    """Compact co-occurrence counts of an uploaded csv, cached per file content
+
+    df_hourly: hourly sums of each data column, indexed by hour (first column of csv)
+    dic_edge_sizes: per aggregate type, matrix of sum of min(count_i, count_j) over each term
+    error: validation error of csv data
+    """
+
+    df_hourly: Optional[DataFrame] = None
+    dic_edge_sizes: dict[AggregateBy, np.ndarray] = dataclasses.field(default_factory=dict)
+    error: Optional[Exception] = None
+
+    @property
+    def data_cols(self):
+        return self.df_hourly.columns.tolist()
+
 
 def validate_csv_data(df: DataFrame):
     if df is None or df.size == 0:
@@ -70,35 +104,126 @@ def validate_csv_data(df: DataFrame):
     return True
 
 
+def gen_content_hash(file_path, csv_delimiter) -> str:
+    """Hash of csv content (uploaded bytes or file on disk) and parsing option"""
+    hasher = hashlib.sha1(usedforsecurity=False)
+    hasher.update(str(csv_delimiter).encode())
+    if isinstance(file_path, bytes):
+        hasher.update(file_path)
+    else:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                hasher.update(block)
+
+    return hasher.hexdigest()
+
+
+def gen_encoding_params(file_path, from_file=False) -> list[dict]:
+    """Encoding options to read csv, in the same fallback order as `csv_to_df` does on UnicodeDecodeError"""
+    encoding = detect_file_encoding(file_path) if from_file else detect_encoding(file_path)
+    return [
+        {'encoding': encoding},
+        {'encoding': 'unicode_escape'},
+        # after pandas 1.3, default of `encoding_errors` is `raise`, before that it was `replace`
+        {'encoding': None, 'encoding_errors': 'replace'},
+    ]
+
+
+def read_csv_by_chunks(file_path, csv_delimiter, from_file=False, chunk_size=CSV_CHUNK_SIZE, **encoding_param):
+    """Read co-occurrence csv by chunks, with the same reading options as `csv_to_df`"""
+    if from_file:
+        file_path = BytesIO(file_path)
+
+    with pd.read_csv(
+        file_path,
+        sep=csv_delimiter,
+        na_values=NA_VALUES,
+        on_bad_lines='skip',
+        skip_blank_lines=True,
+        index_col=False,
+        chunksize=chunk_size,
+        **encoding_param,
+    ) as reader:
+        for df_chunk in reader:
+            df_chunk = df_chunk.dropna(how='all')
+            yield df_chunk.rename(columns={col: normalize_str(col) for col in df_chunk.columns})
+
+
+@log_execution_time()
+@abort_process_handler()
+@CustomCache.memoize(cache_type=CacheType.OTHER, custom_key_arg='content_hash')
+def gen_cooccurrence_counts(file_path, csv_delimiter, from_file=False, content_hash=None) -> CooccurrenceCounts:
+    """Build co-occurrence counts of a csv by streaming it chunk by chunk.
+    Only hourly sums are kept in memory, other aggregations are derived from them.
+    Result is cached by `content_hash`, so that changing aggregation or pareto does not re-read the file.
+    """
+    *fallback_params, last_param = gen_encoding_params(file_path, from_file)
+    for encoding_param in fallback_params:
+        try:
+            return count_cooccurrence(file_path, csv_delimiter, from_file, **encoding_param)
+        except UnicodeDecodeError:
+            # decoding can fail at any chunk, read whole file again because column names may differ by encoding
+            pass
+
+    return count_cooccurrence(file_path, csv_delimiter, from_file, **last_param)
+
+
+def count_cooccurrence(file_path, csv_delimiter, from_file=False, **encoding_param) -> CooccurrenceCounts:
+    hourly_sums = []
+    for df_chunk in read_csv_by_chunks(file_path, csv_delimiter, from_file, **encoding_param):
+        validate_result = validate_csv_data(df_chunk)
+        if isinstance(validate_result, Exception):
+            return CooccurrenceCounts(error=validate_result)
+
+        date_time_col, *data_cols = df_chunk.columns.tolist()
+        hours = pd.to_datetime(df_chunk[date_time_col]).dt.floor(AGGREGATE_FREQS[AggregateBy.HOUR])
+        hourly_sums.append(df_chunk[data_cols].groupby(hours.rename(date_time_col)).sum())
+
+    if not hourly_sums:
+        return CooccurrenceCounts(error=validate_csv_data(None))
+
+    df_hourly = pd.concat(hourly_sums).groupby(level=0).sum()
+    dic_edge_sizes = {}
+    for aggregate_by, freq in AGGREGATE_FREQS.items():
+        df_sum = df_hourly.groupby(df_hourly.index.floor(freq)).sum()
+        dic_edge_sizes[aggregate_by] = calc_edge_sizes(df_sum.to_numpy())
+
+    return CooccurrenceCounts(df_hourly=df_hourly, dic_edge_sizes=dic_edge_sizes)
+
+
+def calc_edge_sizes(sums: np.ndarray) -> np.ndarray:
+    """Co-occurrence matrix: sum of min(count_i, count_j) over each aggregated term, for every pair of columns"""
+    num_cols = sums.shape[1]
+    edge_sizes = np.zeros((num_cols, num_cols), dtype=sums.dtype)
+    for i in range(num_cols - 1):
+        edge_sizes[i, i + 1 :] = np.minimum(sums[:, i : i + 1], sums[:, i + 1 :]).sum(axis=0)
+
+    return edge_sizes
+
+
 @MessageAnnouncer.notify_progress(60)
 @abort_process_handler()
-def calc_csv_graph_data(df: DataFrame, aggregate_by: AggregateBy, pareto=None):
+def calc_csv_graph_data(counts: CooccurrenceCounts, aggregate_by: AggregateBy, pareto=None):
     if pareto is None:
         pareto = {}
-    cols = df.columns.tolist()
-    date_time_col = cols[0]
-    data_cols = cols[1:]
-
-    # fix could not group_by failed without datetimeindex since upgrade to pd2.2
-    df[date_time_col] = pd.to_datetime(df[date_time_col])
-    df = df.set_index(date_time_col)
-
-    freq = 'H' if aggregate_by is AggregateBy.HOUR else 'D'
+    data_cols = counts.data_cols
+    edge_sizes = counts.dic_edge_sizes[aggregate_by]
 
-    df_sum = df.groupby(pd.Grouper(freq=freq)).sum()
     nodes_cum_rate_80 = YamlConfig.get_node(pareto, ['bar', 'highlight_bars'], set()) or set()
     nodes = []
-    for key, val in df_sum.sum().to_dict().items():
+    for key, val in counts.df_hourly.sum().to_dict().items():
         color = dic_colors['bar_highlight'] if key in nodes_cum_rate_80 else ''
         nodes.append({'id': key, 'label': key, 'size': int(val), 'color': color})
 
     edges = []
-    for source, target in itertools.combinations(data_cols, 2):
-        edge = [source, target]
-        size = int(df_sum[edge].min(axis=1).sum())
-        edge_id = '-'.join([str(node_id) for node_id in edge])
-        dic_edge = {'id': edge_id, 'label': size, 'source': source, 'target': target}
-        edges.append(dic_edge)
+    for i, source in enumerate(data_cols):
+        for j in range(i + 1, len(data_cols)):
+            target = data_cols[j]
+            edge = [source, target]
+            size = int(edge_sizes[i, j])
+            edge_id = '-'.join([str(node_id) for node_id in edge])
+            dic_edge = {'id': edge_id, 'label': size, 'source': source, 'target': target}
+            edges.append(dic_edge)
 
     return nodes, edges
 
@@ -17,6 +17,7 @@ from ap.common.constants import (
     CSVExtTypes,
 )
 from ap.common.jobs.utils import get_update_transaction_table_job
+from ap.common.request_profile import RequestProfiles
 from ap.common.services.csv_content import zip_file_to_response
 from ap.common.services.form_env import (
     bind_dic_param_to_class,
@@ -42,6 +43,28 @@ def abort_process():
     return {}, 200
 
 
+@api_common_blueprint.route('/request_profile', methods=['GET'])
+def get_request_profile_ids():
+    """
+        Ids of latest profiled requests
+    :return: {'ids': [...]}
+    """
+    return {'ids': RequestProfiles.get_ids()}, 200
+
+
+@api_common_blueprint.route('/request_profile/<profile_id>', methods=['GET'])
+def get_request_profile(profile_id):
+    """
+        Nested span tree of a profiled request
+    :return: {'id': ..., 'created_at': ..., 'span': {...}}
+    """
+    profile = RequestProfiles.get(profile_id)
+    if profile is None:
+        return {}, 404
+
+    return profile, 200
+
+
 @api_common_blueprint.route('/draw_plot_excuted_time', methods=['GET'])
 def save_draw_plot_executed_time():
     """
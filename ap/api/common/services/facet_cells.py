@@ -0,0 +1,394 @@
+from __future__ import annotations
+
+import math
+from collections import Counter
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ap import max_graph_config
+from ap.common.common_utils import gen_sql_label
+from ap.common.constants import (
+    ARRAY_X,
+    ARRAY_Y,
+    COLORS,
+    CYCLE_IDS,
+    END_DT,
+    H_LABEL,
+    IS_EMPTY_GRAPH,
+    N_TOTAL,
+    ROWID,
+    SORT_KEY,
+    START_DT,
+    TIME_COL,
+    TIME_MAX,
+    TIME_MIN,
+    TIMES,
+    V_LABEL,
+    X_SERIAL,
+    Y_SERIAL,
+    ChartType,
+    MaxGraphNumber,
+)
+from ap.common.logger import log_execution_time
+from ap.common.services.request_time_out_handler import abort_process_handler
+from ap.setting_module.models import CfgProcessColumn
+
+
+@log_execution_time()
+@abort_process_handler()
+def split_df_by_terms(df: DataFrame, terms, time_col=TIME_COL):
+    """
+    Split df into chunks of [start_dt, end_dt) terms.
+    Rows are bucketed by one sort of time column and two binary searches per term,
+    instead of comparing all rows with each term. Terms can overlap (cyclic terms).
+    Each chunk keeps original row order and is indexed by time column.
+    :param df:
+    :param terms: list of dict with START_DT, END_DT
+    :param time_col:
+    :return: dict of (start_dt, end_dt): df_chunk
+    """
+    df = df.set_index(time_col, drop=False)
+    times = df.index.to_series().reset_index(drop=True).dropna()
+    if pd.api.types.is_string_dtype(times):
+        # fixed width unicode array is much faster to sort and search than python string objects
+        times = pd.Series(times.to_numpy(dtype=str), index=times.index)
+
+    sorted_times = times.sort_values(kind='stable')
+    sorted_positions = sorted_times.index.to_numpy()
+    sorted_times = sorted_times.to_numpy() if pd.api.types.is_string_dtype(sorted_times) else sorted_times
+
+    dic_df_chunks = {}
+    for term in terms:
+        start_dt = term[START_DT]
+        end_dt = term[END_DT]
+        start_idx = sorted_times.searchsorted(start_dt, side='left')
+        end_idx = sorted_times.searchsorted(end_dt, side='left')
+        positions = np.sort(sorted_positions[start_idx : max(start_idx, end_idx)])
+        dic_df_chunks[(start_dt, end_dt)] = df.iloc[positions]
+
+    return dic_df_chunks
+
+
+@log_execution_time()
+@abort_process_handler()
+def gen_facet_cells(dic_df_chunks, v_group_cols, matrix_col):
+    """
+    Assign each term chunk rows to facet cells
+    :param dic_df_chunks: dict of term key: df_chunk
+    :param v_group_cols: facet columns
+    :param matrix_col: number of graphs per row
+    :return: dict of term key: (dict of facet key: df_cell), most common facet keys
+    """
+    # graph number is depend on facet
+    max_graph = matrix_col if v_group_cols else max_graph_config[MaxGraphNumber.SCP_MAX_GRAPH.name]
+    dic_groups = split_df_by_time_range(dic_df_chunks, max_graph)
+
+    # facet
+    dic_groups = {key: group_by_df(df_group, v_group_cols) for key, df_group in dic_groups.items()}
+    row_count = math.ceil(max_graph_config[MaxGraphNumber.SCP_MAX_GRAPH.name] / matrix_col)
+    facet_keys = [
+        key for key, _ in Counter([val for vals in dic_groups.values() for val in vals]).most_common(row_count)
+    ]
+    return dic_groups, facet_keys
+
+
+@log_execution_time()
+@abort_process_handler()
+def group_by_df(
+    df: DataFrame,
+    cols,
+    max_group=None,
+    max_record_per_group=None,
+    sort_key_func=None,
+    reverse=True,
+    get_from_last=None,
+):
+    dic_groups = {}
+    if df is None or not len(df):
+        return dic_groups
+
+    if not cols:
+        dic_groups[None] = df.head(max_record_per_group)
+        return dic_groups
+
+    df_groups = df.groupby(cols)
+    max_group = max_group or len(df_groups.groups)
+
+    # sort desc
+    if sort_key_func:
+
+        def sort_func(x):
+            return sort_key_func(x[0])
+
+    else:
+        all_numeric = all(str(key).isnumeric() for key, df_group in df_groups)
+        sort_func = (lambda x: int(x[0])) if all_numeric else lambda x: str(x[0])
+
+    groups = sorted(df_groups, key=sort_func, reverse=reverse)
+    groups = groups[:max_group]
+    if get_from_last:
+        groups.reverse()
+
+    for key, df_group in groups:
+        dic_groups[key] = df_group.head(max_record_per_group)
+
+    return dic_groups
+
+
+@log_execution_time()
+@abort_process_handler()
+def split_df_by_time_range(dic_df_chunks, max_group=None, max_record_per_group=None):
+    dic_groups = {}
+    max_group = max_group or len(dic_df_chunks)
+
+    for count, (key, df_group) in enumerate(dic_df_chunks.items()):
+        # for key, df_group in df_groups.groups.items():
+        if count >= max_group:
+            break
+        dic_groups[key] = df_group.head(max_record_per_group)
+
+    return dic_groups
+
+
+@log_execution_time()
+def drop_missing_data(df: DataFrame, cols):
+    if df is not None and len(df):
+        df = df.dropna(subset=[col for col in cols if col]).convert_dtypes()
+    return df
+
+
+@log_execution_time()
+def get_v_keys_str(v_keys):
+    if v_keys is None:
+        v_keys_str = None
+    elif isinstance(v_keys, (list, tuple)):
+        v_keys_str = '|'.join([str(key) for key in v_keys])
+    else:
+        v_keys_str = v_keys
+    return v_keys_str
+
+
+@log_execution_time()
+@abort_process_handler()
+def get_proc_serials(df: DataFrame, serial_cols: list[CfgProcessColumn]) -> list[dict[str, Any]]:
+    if not serial_cols:
+        return []
+
+    if df is None or len(df) == 0:
+        return []
+
+    # serials
+    serials = []
+    for col in serial_cols:
+        sql_label = gen_sql_label(col.id, col.column_name)
+        if sql_label in df.columns:
+            dic_serial = {'col_name': col.shown_name, 'data': df[sql_label]}
+            serials.append(dic_serial)
+
+    return serials
+
+
+@log_execution_time()
+@abort_process_handler()
+def gen_empty_dic_graphs(facet_keys, h_keys_str, v_keys_str, time_min, time_max, sort_key=None):
+    dic_data = {
+        H_LABEL: h_keys_str,
+        V_LABEL: v_keys_str,
+        ARRAY_X: pd.Series(),
+        ARRAY_Y: pd.Series(),
+        COLORS: pd.Series(),
+        TIMES: pd.Series(),
+        TIME_MIN: time_min,
+        TIME_MAX: time_max,
+        N_TOTAL: 0,
+        SORT_KEY: h_keys_str if sort_key is None else sort_key,
+        X_SERIAL: pd.Series(),
+        Y_SERIAL: pd.Series(),
+        CYCLE_IDS: pd.Series(),
+        IS_EMPTY_GRAPH: True,
+    }
+    output_time = ([], [])
+    dic_graphs = [{**dic_data.copy(), V_LABEL: get_v_keys_str(v_key)} for v_key in facet_keys]
+    output_times = [output_time for _ in facet_keys]
+    return dic_graphs, output_times
+
+
+@log_execution_time()
+@abort_process_handler()
+def gen_scatter_by_cyclic(
+    dic_proc_cfgs,
+    matrix_col,
+    df: DataFrame,
+    x_proc_id,
+    y_proc_id,
+    x,
+    y,
+    terms,
+    color=None,
+    levels=None,
+    chart_type=None,
+    *,
+    gen_dic_graphs,
+    get_proc_times,
+):
+    """
+    split by terms
+    :param matrix_col:
+    :param df:
+    :param x_proc_id:
+    :param y_proc_id:
+    :param x:
+    :param y:
+    :param terms:
+    :param color:
+    :param levels:
+    :param gen_dic_graphs: graph data of a cell, depends on chart page
+    :param get_proc_times: times of a process in a cell, depends on chart page
+    :return:
+    """
+    if levels is None:
+        levels = []
+
+    # remove missing data
+    df = drop_missing_data(df, [x, y, color] + levels)
+
+    dic_df_chunks = split_df_by_terms(df, terms, TIME_COL)
+
+    v_group_cols = [col for col in levels if col]
+
+    # facet
+    dic_groups, facet_keys = gen_facet_cells(dic_df_chunks, v_group_cols, matrix_col)
+    term_groups = [(f'{h_key[0]}', f'{h_key[1]}', dic_group) for h_key, dic_group in dic_groups.items()]
+    return gen_term_cell_graphs(
+        dic_proc_cfgs,
+        term_groups,
+        facet_keys,
+        x_proc_id,
+        y_proc_id,
+        x,
+        y,
+        gen_dic_graphs,
+        get_proc_times,
+        color,
+        chart_type,
+    )
+
+
+@log_execution_time()
+@abort_process_handler()
+def gen_scatter_by_direct_term(
+    dic_proc_cfgs,
+    matrix_col,
+    dic_df_chunks,
+    x_proc_id,
+    y_proc_id,
+    x,
+    y,
+    color=None,
+    levels=None,
+    chart_type=None,
+    *,
+    gen_dic_graphs,
+    get_proc_times,
+):
+    """
+    split by terms
+    :param matrix_col:
+    :param dic_df_chunks
+    :param x_proc_id:
+    :param y_proc_id:
+    :param x:
+    :param y:
+    :param color:
+    :param levels:
+    :param gen_dic_graphs: graph data of a cell, depends on chart page
+    :param get_proc_times: times of a process in a cell, depends on chart page
+    :return:
+    """
+    if levels is None:
+        levels = []
+
+    # remove missing data
+    for key, df in dic_df_chunks.items():
+        dic_df_chunks[key] = drop_missing_data(df, [x, y, color] + levels)
+
+    v_group_cols = [col for col in levels if col]
+
+    # facet
+    dic_groups, facet_keys = gen_facet_cells(dic_df_chunks, v_group_cols, matrix_col)
+    term_groups = [
+        (f'{h_key[0]} {h_key[1]}', f'{h_key[2]} {h_key[3]}', dic_group) for h_key, dic_group in dic_groups.items()
+    ]
+    return gen_term_cell_graphs(
+        dic_proc_cfgs,
+        term_groups,
+        facet_keys,
+        x_proc_id,
+        y_proc_id,
+        x,
+        y,
+        gen_dic_graphs,
+        get_proc_times,
+        color,
+        chart_type,
+    )
+
+
+@log_execution_time()
+@abort_process_handler()
+def gen_term_cell_graphs(
+    dic_proc_cfgs,
+    term_groups,
+    facet_keys,
+    x_proc_id,
+    y_proc_id,
+    x,
+    y,
+    gen_dic_graphs,
+    get_proc_times,
+    color=None,
+    chart_type=None,
+):
+    """
+    Graph data of each facet cell of terms
+    :param term_groups: list of (time_min, time_max, dict of facet key: df_cell) of each term
+    :param facet_keys: shown facet keys
+    :return: graphs and times of x, y processes of each graph
+    """
+    # serials
+    x_serial_cols = dic_proc_cfgs[x_proc_id].get_serials(column_name_only=False)
+    y_serial_cols = [] if y_proc_id == x_proc_id else dic_proc_cfgs[y_proc_id].get_serials(column_name_only=False)
+
+    output_graphs = []
+    output_times = []
+    for time_min, time_max, dic_group in term_groups:
+        h_keys_str = f'{time_min} – {time_max}'
+        # show empty graphs when toggle ON [Arrange Div] switch
+        if not dic_group:
+            empty_dic_data, empty_output_time = gen_empty_dic_graphs(facet_keys, h_keys_str, None, time_min, time_max)
+            output_times.extend(empty_output_time)
+            output_graphs.extend(empty_dic_data)
+        for v_keys, df_data in dic_group.items():
+            if v_keys not in facet_keys:
+                continue
+
+            v_keys_str = get_v_keys_str(v_keys)
+
+            # v_label : name ( not id )
+            dic_data = gen_dic_graphs(df_data, x, y, h_keys_str, v_keys_str, color, TIME_COL)
+
+            # serial
+            dic_data[X_SERIAL] = get_proc_serials(df_data, x_serial_cols)
+            dic_data[Y_SERIAL] = get_proc_serials(df_data, y_serial_cols)
+            if ROWID in df_data.columns and chart_type == ChartType.SCATTER.value:
+                dic_data[CYCLE_IDS] = df_data.rowid
+            else:
+                dic_data[CYCLE_IDS] = pd.Series()
+
+            output_times.append((get_proc_times(df_data, x_proc_id), get_proc_times(df_data, y_proc_id)))
+            output_graphs.append(dic_data)
+
+    return output_graphs, output_times
@@ -190,13 +190,13 @@ from ap.common.path_utils import gen_sqlite3_file_name
 from ap.common.pydn.dblib.db_proxy import DbProxy, gen_data_source_of_universal_db
 from ap.common.services.ana_inf_data import calculate_kde_trace_data, detect_abnormal_count_values
 from ap.common.services.form_env import bind_dic_param_to_class
-from ap.common.services.request_time_out_handler import abort_process_handler
+from ap.common.services.request_time_out_handler import abort_process_handler, check_abort_process
 from ap.common.services.sse import MessageAnnouncer
 from ap.common.services.statistics import convert_series_to_number, get_mode
 from ap.common.services.trace_graph import ConnectedTraceKeys, TraceGraph
 from ap.common.sigificant_digit import get_fmt_from_array, signify_digit
 from ap.common.trace_data_log import EventAction, Target, save_df_to_file, trace_log
-from ap.equations.utils import get_function_class_by_id
+from ap.equations.plan import FunctionColumnPlan
 
 # TODO: filter check
 from ap.setting_module.models import (
@@ -1094,13 +1094,16 @@ def gen_graph_df(
 
     # get equation data
     for end_proc in end_procs:
+        check_abort_process()
         df = get_equation_data(df, end_proc)
 
+    check_abort_process()
     df = judge_data_conversion(df, judge_columns)
     df = boolean_data_conversion(df, boolean_columns)
     # filter function column
     for end_proc in end_procs:
         for condition_proc in cond_procs:
+            check_abort_process()
             df = filter_function_column(df, condition_proc, end_proc)
 
     return df, actual_record_number, unique_serial
@@ -1204,6 +1207,7 @@ def gen_trace_procs_df(
 
         # Sort by time before emitting out df, so the result will be the same with edge server
         if is_order_by_time:
+            check_abort_process()
             df = df.sort_values(sorted(time_cols))
 
         actual_record_number = len(df)
@@ -3666,9 +3670,13 @@ def gen_trace_procs_df_detail(
     df = None
 
     for sql_objs in list_sql_objs:
+        check_abort_process()
         sql, params = gen_proc_link_from_sql(sql_objs, cond_procs, duplicate_serial_show, for_count=for_count)
+        # statement is interrupted by `DbProxy` if request is aborted while it runs
         cols, rows = db_instance.run_sql(sql, params=params, row_is_dict=False)
+        check_abort_process()
         _df = pd.DataFrame(rows, columns=cols)
+        del rows
         keep = 'last'
         if duplicate_serial_show is DuplicateSerialShow.SHOW_FIRST:
             keep = 'first'
@@ -3677,6 +3685,7 @@ def gen_trace_procs_df_detail(
         _df = _df.drop_duplicates(subset=_filter_subset, keep=keep)
 
         if duplicate_serial_show is not DuplicateSerialShow.SHOW_BOTH and not for_count:
+            check_abort_process()
             # TODO: drop_duplicates_by_link_keys MUST delete per end proc
             dropped_duplicates_df = DropDuplicatesTraceProcs.drop_duplicates_by_link_keys(
                 _df,
@@ -3825,54 +3834,43 @@ def check_path_exist(end_proc_id, start_proc_id):
     return trace_graph.has_path(start_proc=start_proc_id, end_proc=end_proc_id)
 
 
-def add_equation_column_to_df(df, function_detail, graph_config_data: CfgProcess):
-    cfg_col = graph_config_data.get_col(function_detail.process_column_id)
-    equation_class = get_function_class_by_id(function_detail.function_id)
-    equation = equation_class.from_kwargs(**function_detail.as_dict())
-
-    # get column_x and column_y
-    cfg_col_x = graph_config_data.get_col(function_detail.var_x)
-    cfg_col_y = graph_config_data.get_col(function_detail.var_y)
-
-    column_out = gen_sql_label(cfg_col.id, cfg_col.column_name)
-    column_x = gen_sql_label(cfg_col_x.id, cfg_col_x.column_name) if cfg_col_x else None
-    column_y = gen_sql_label(cfg_col_y.id, cfg_col_y.column_name) if cfg_col_y else None
-
-    x_dtype = cfg_col_x.raw_data_type if cfg_col_x else None
-    y_dtype = cfg_col_y.raw_data_type if cfg_col_y else None
-
-    df = equation.evaluate(df, out_col=column_out, x_col=column_x, y_col=column_y, x_dtype=x_dtype, y_dtype=y_dtype)
-    # update data type
-    cfg_col.raw_data_type = function_detail.return_type
-    return df
-
-
 def sorted_function_details(cfg_process_columns: list[CfgProcessColumn]) -> list[CfgProcessFunctionColumn]:
     cfg_function_cols = itertools.chain.from_iterable(cfg_col.function_details for cfg_col in cfg_process_columns)
     return sorted(cfg_function_cols, key=lambda col: col.order)
 
 
+@log_execution_time()
 def get_equation_data(df, end_proc: EndProc):
-    sorted_cfg_function_cols = sorted_function_details(end_proc.cfg_proc.get_cols(col_ids=end_proc.col_ids))
-    for cfg_func_col in sorted_cfg_function_cols:
-        df = add_equation_column_to_df(df, cfg_func_col, end_proc.cfg_proc)
+    cfg_proc = end_proc.cfg_proc
+    plan = FunctionColumnPlan.compile(
+        {cfg_col.id: cfg_col for cfg_col in cfg_proc.columns},
+        end_proc.col_ids,
+        lambda cfg_col: gen_sql_label(cfg_col.id, cfg_col.column_name),
+    )
+    # time column of start process has no suffix
+    time_col = gen_proc_time_label(cfg_proc.id)
+    df = plan.evaluate_with_cache(df, cfg_proc.id, time_col if time_col in df.columns else TIME_COL)
 
-    for col in df.columns:
-        if '__SHOW_NAME__' in col:
-            df = df.drop(columns=col)
+    # update data type
+    dic_return_types = plan.get_return_types()
+    for col_id, return_type in dic_return_types.items():
+        cfg_proc.get_col(col_id).raw_data_type = return_type
+
+    df = df.drop(columns=[col for col in df.columns if '__SHOW_NAME__' in col])
 
     # cast equation function to string if its `data-type` is string
-    for cfg_func_col in sorted_cfg_function_cols:
-        cfg_col = end_proc.cfg_proc.get_col(cfg_func_col.process_column_id)
-        if cfg_col.data_type == DataType.TEXT.value:
-            label = gen_sql_label(cfg_col.id, cfg_col.column_name)
+    for col_id in dic_return_types:
+        cfg_col = cfg_proc.get_col(col_id)
+        label = gen_sql_label(cfg_col.id, cfg_col.column_name)
+        if cfg_col.data_type != DataType.TEXT.value:
+            continue
 
-            original_type = df[label].dtype
-            df[label] = df[label].astype(pd.StringDtype())
+        original_type = df[label].dtype
+        df[label] = df[label].astype(pd.StringDtype())
 
-            # handle for case of boolean True False -> true false
-            if pd.api.types.is_bool_dtype(original_type):
-                df[label] = df[label].str.lower()
+        # handle for case of boolean True False -> true false
+        if pd.api.types.is_bool_dtype(original_type):
+            df[label] = df[label].str.lower()
 
     return df
 
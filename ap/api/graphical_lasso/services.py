@@ -1,5 +1,7 @@
 import colorsys
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
@@ -48,6 +50,15 @@ from ap.common.trace_data_log import EventAction, EventType, Target, TraceErrKey
 
 logger = logging.getLogger(__name__)
 
+try:
+    # public `graphical_lasso` has no warm start, `cov_init` is only accepted by private function of scikit-learn==1.5.2
+    from sklearn.covariance._graph_lasso import _graphical_lasso
+except ImportError:
+    _graphical_lasso = None
+
+# alphas are fitted in this number of segments, so that results do not depend on number of CPUs of server
+ALPHA_PATH_SEGMENTS = 3
+
 
 @log_execution_time('[TRACE DATA]')
 @request_timeout_handling()
@@ -295,6 +306,12 @@ class GaussianGraphicalModel:
     idx_target: int
         Column index of target variable (optional).
 
+    n_jobs: int, default=None
+        Number of threads used to fit the alpha path. The sorted alphas are split into `ALPHA_PATH_SEGMENTS`
+        contiguous segments, the first alpha of each segment is fitted from scratch and the others are fitted
+        with warm start from their previous (larger) alpha.
+        If None, use the number of CPUs (at most the number of segments).
+
     Attributes:
     ----------
     results: dict
@@ -304,10 +321,11 @@ class GaussianGraphicalModel:
             ebic: EBIC, list of float values
     """
 
-    def __init__(self, alphas=None, idx_target=None):
+    def __init__(self, alphas=None, idx_target=None, n_jobs=None):
         self.alphas = [alphas] if not isinstance(alphas, list) else alphas
         self.results = None
         self.idx_target = idx_target
+        self.n_jobs = n_jobs
 
     def fit(self, X):
         """Fit GraphcialLASSO
@@ -322,24 +340,62 @@ class GaussianGraphicalModel:
         # shrink eigenvalue for ill-conditioned data.
         # https://stats.stackexchange.com/questions/172911/graphical-lasso-numerical-problem-not-spd-matrix-result
         emp_cov = empirical_covariance(X)
-        eigenvals, _ = np.linalg.eig(emp_cov)
+        eigenvals = np.linalg.eigvalsh(emp_cov)
         if np.max(eigenvals) - np.min(eigenvals) > 1:
             logger.info('Shrink covariance, as detected broad eigenvalue range of covariance matrix.')
             emp_cov = shrunk_covariance(emp_cov, shrinkage=0.8)
 
-        # fit glasso along specified alphas
+        # fit glasso along specified alphas, from sparse (large alpha) to dense (small alpha)
+        sample_size = X.shape[0]
+        segments = self._split_alpha_path(sorted(set(self.alphas), reverse=True))
+        n_jobs = self.n_jobs or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=min(n_jobs, len(segments))) as executor:
+            futures = [executor.submit(self._fit_alpha_path, segment, emp_cov, sample_size) for segment in segments]
+            dic_fitted = {}
+            for future in futures:
+                dic_fitted.update(future.result())
+
+        # keep the results in the order of given alphas
         dic_res = {'alpha': [], 'parcor': [], 'ebic': []}
         for alpha in self.alphas:
+            if alpha not in dic_fitted:
+                continue
+            parcor, ebic = dic_fitted[alpha]
+            dic_res['alpha'].append(alpha)
+            dic_res['parcor'].append(parcor)
+            dic_res['ebic'].append(ebic)
+
+        self.results = dic_res
+
+    @staticmethod
+    def _split_alpha_path(alphas):
+        """Split sorted alphas into contiguous segments, which are fitted in parallel"""
+        n_segments = max(1, min(ALPHA_PATH_SEGMENTS, len(alphas)))
+        return [segment.tolist() for segment in np.array_split(np.array(alphas), n_segments) if len(segment)]
+
+    def _fit_alpha_path(self, alphas, emp_cov, sample_size: int):
+        """Fit glasso along sorted alphas, warm-starting each fit from the previous covariance estimate"""
+        dic_fitted = {}
+        cov_init = None
+        for alpha in alphas:
             try:
-                _, pmat = graphical_lasso(emp_cov, alpha)
-                dic_res['alpha'].append(alpha)
-                dic_res['parcor'].append(self._precision2parcor(pmat))
-                dic_res['ebic'].append(self._calc_extended_bic(pmat, emp_cov, X.shape[0]))
+                if cov_init is None or _graphical_lasso is None:
+                    cov_init, pmat = graphical_lasso(emp_cov, alpha)
+                else:
+                    try:
+                        cov_init, pmat, *_ = _graphical_lasso(emp_cov, alpha, cov_init=cov_init)
+                    except FloatingPointError:
+                        # warm start can be unstable for ill-conditioned data, retry from scratch
+                        cov_init, pmat = graphical_lasso(emp_cov, alpha)
+                dic_fitted[alpha] = (
+                    self._precision2parcor(pmat),
+                    self._calc_extended_bic(pmat, emp_cov, sample_size),
+                )
             except Exception as e:
+                cov_init = None
                 logger.exception(e)
                 logger.info(f'Poorly conditioned on alpha={alpha}. Skip')
-
-        self.results = dic_res
+        return dic_fitted
 
     def _precision2parcor(self, pmat):
         """Convert precision matrix to partial correlation matrix"""
@@ -356,7 +412,12 @@ class GaussianGraphicalModel:
         https://arxiv.org/abs/1011.6640
         """
         # log-likelihood (eq.2)
-        loglik = 0.5 * sample_size * (np.log(np.linalg.det(pmat)) - np.trace(np.dot(covmat, pmat)))
+        # use slogdet, det(pmat) overflows/underflows for large number of variables
+        sign, logdet = np.linalg.slogdet(pmat)
+        if sign < 0:
+            # log of negative determinant, same as before slogdet was used. NaN is selected by `argmin` of EBIC
+            return np.nan
+        loglik = 0.5 * sample_size * (logdet - np.sum(covmat * pmat))
         # number of edges
         num_nodes = pmat.shape[0]
         E = 0.5 * (np.sum(pmat != 0, axis=(0, 1)) - num_nodes)
@@ -435,17 +435,15 @@ def calc_coef_and_group_order(
     # preprocessing
     # Categoricals: labelencode with stats (similar to target encoding)
     # Others: Standardization
-    # X_preprocessor = SkdXPreprocessor(dic_groups["cat_cols"], nominal_variables)
-    # X = X_preprocessor.fit_transform(X, y)
-    # y_preprocessor = SkdYPreprocessor(is_categorical)
-    # y = y_preprocessor.fit_transform(y)
+    # categories are factorized once here, every model below only encodes them with its own y
+    X = SkdDesign.from_df(X, dic_groups['cat_cols'], dic_groups['nominal_variables'])
 
     # groups lasso (if 2 or more groups are given)
     # this is to determine group order
     idx_for_lasso = np.arange(X.shape[1])
     if dic_groups['num_grps'] > 1:
         # fit group lasso with various penalty factors (no L1 penalty)
-        coef_history, bic = fit_grplasso(X.copy(), y.copy(), dic_groups, penalty_factors, is_categorical, verbose)
+        coef_history, bic = fit_grplasso(X, y.copy(), dic_groups, penalty_factors, is_categorical, verbose)
         # determine order of groups
         group_order = determine_group_order(coef_history, dic_groups)
         # use selected columns ffor ridge regression
@@ -456,7 +454,7 @@ def calc_coef_and_group_order(
 
     # L1 penalty for further variable selection
     if strengthen_selection:
-        idx_for_ridge = idx_for_lasso[fit_lasso(X.iloc[:, idx_for_lasso], y, dic_groups, is_categorical=is_categorical)]
+        idx_for_ridge = idx_for_lasso[fit_lasso(X.take(idx_for_lasso), y, dic_groups, is_categorical=is_categorical)]
     else:
         idx_for_ridge = idx_for_lasso
 
@@ -467,7 +465,7 @@ def calc_coef_and_group_order(
 
     # re-calculate coefficients with ridge regression
     coef[idx_for_ridge, :], fitted_values, fitted_probs = fit_ridge(
-        X.iloc[:, idx_for_ridge],
+        X.take(idx_for_ridge),
         y,
         dic_groups,
         is_categorical=is_categorical,
@@ -486,23 +484,55 @@ Coef: {coef}
     return coef, group_order, fitted_values, fitted_probs
 
 
+class SkdDesign:
+    """
+    Explanatory variables prepared once for every model fitted in a request.
+    Categorical columns are kept as codes of their sorted categories, so that encoding them by statistics of
+    the objective variable is a lookup, however many categories they have.
+    """
+
+    def __init__(self, columns, features, n_rows):
+        self.columns = columns
+        # float values of numerical columns, (codes, is_nominal_scale) of categorical columns
+        self.features = features
+        self.shape = (n_rows, len(columns))
+
+    @classmethod
+    def from_df(cls, X, cat_cols, nominal_variables):
+        features = []
+        for col in X.columns.to_numpy():
+            if col in cat_cols:
+                codes, _ = factorize_category(X[col].astype(str).to_numpy().flatten())
+                features.append((codes, col in nominal_variables))
+            else:
+                features.append(X[col].to_numpy().astype(float))
+
+        return cls(X.columns.to_numpy(), features, X.shape[0])
+
+    def take(self, idx_cols):
+        """Design of a subset of columns, arrays are shared"""
+        return SkdDesign(self.columns[idx_cols], [self.features[i] for i in idx_cols], self.shape[0])
+
+    def transform(self, y):
+        """Categoricals: labelencode with stats of y, then standardization of every column"""
+        X = np.empty(self.shape)
+        for i, feature in enumerate(self.features):
+            if isinstance(feature, tuple):
+                codes, is_nominal_scale = feature
+                feature = encode_codes_by_stat(codes, y.flatten(), is_nominal_scale=is_nominal_scale)
+            X[:, i] = StandardScaler().fit_transform(feature.astype(float).reshape(-1, 1)).flatten()
+        return X
+
+
 class SkdXPreprocessor:
     def __init__(self, cat_cols, nominal_variables):
         self.cat_cols = cat_cols
         self.nominal_variables = nominal_variables
 
     def fit_transform(self, X, y):
-        for col in X.columns.to_numpy():
-            if col in self.cat_cols:
-                is_nominal_scale = col in self.nominal_variables
-                X.loc[:, col] = labelencode_by_stat(
-                    X[col].astype(str).to_numpy().flatten(),
-                    y.flatten(),
-                    is_nominal_scale=is_nominal_scale,
-                )
-            X.loc[:, col] = StandardScaler().fit_transform(X[col].to_numpy().astype(float).reshape(-1, 1))
-        X = X.to_numpy()
-        return X
+        if not isinstance(X, SkdDesign):
+            X = SkdDesign.from_df(X, self.cat_cols, self.nominal_variables)
+        return X.transform(y)
 
 
 class SkdYPreprocessor:
@@ -524,22 +554,42 @@ class SkdYPreprocessor:
 
 def labelencode_by_stat(x, y, how='mean', is_nominal_scale=True):
     """Label encode x by the mean/median of corresponding y"""
-    df = pd.DataFrame({'y': y, 'x': x})
-    df['y'] = df['y'].astype('float64')
+    codes, _ = factorize_category(x)
+    x_encoded = encode_codes_by_stat(codes, y, how=how, is_nominal_scale=is_nominal_scale)
+    if np.any(codes < 0):
+        # missing values are kept as they are
+        x_encoded = np.where(codes < 0, x, x_encoded)
+    return x_encoded
 
-    if how == 'mean':
-        vals = df.groupby(by='x').mean().reset_index()
-    elif how == 'median':
-        vals = df.groupby(by='x').median().reset_index()
-    else:
+
+def factorize_category(x):
+    """
+    :return: codes of x, categories sorted like keys of groupby. Missing values are coded as -1
+    """
+    return pd.factorize(x, sort=True)
+
+
+def encode_codes_by_stat(codes, y, how='mean', is_nominal_scale=True):
+    """
+    Label encode categories by the mean/median of corresponding y
+    :param codes: codes of sorted categories, from `factorize_category`
+    :return: order of category of each row from 1, 0 for missing values
+    """
+    if how not in ('mean', 'median'):
         logger.warning('Invalid value for argument "how". mean is used.')
-        vals = df.groupby(by='x').mean().reset_index()
+        how = 'mean'
 
-    factor_orders = vals['x'].to_numpy()
+    has_category = codes >= 0
+    vals = pd.Series(y, dtype='float64')[has_category].groupby(codes[has_category]).agg(how)
+
+    factor_orders = vals.index.to_numpy()
     if is_nominal_scale:
-        factor_orders = vals.sort_values(by='y', ascending=True)['x'].to_numpy()
-    x_encoded = df['x'].replace(factor_orders, np.arange(0, len(factor_orders)) + 1)
-    return x_encoded.to_numpy()
+        factor_orders = vals.sort_values(ascending=True).index.to_numpy()
+
+    # the last one is for code -1
+    ranks = np.zeros(len(factor_orders) + 1, dtype=np.int64)
+    ranks[factor_orders] = np.arange(0, len(factor_orders)) + 1
+    return ranks[codes]
 
 
 def fit_grplasso(X, y, dic_groups, penalty_factors=[0.01, 0.1, 1.0, 10.0, 100.0], is_categorical=False, verbose=False):
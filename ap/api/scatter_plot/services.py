@@ -2,7 +2,6 @@ import math
 import re
 from collections import Counter
 from copy import deepcopy
-from typing import Any
 
 import numpy as np
 import pandas as pd
@@ -15,6 +14,15 @@ from ap.api.categorical_plot.services import (
     gen_time_conditions,
     produce_cyclic_terms,
 )
+from ap.api.common.services.facet_cells import (
+    drop_missing_data,
+    gen_empty_dic_graphs,
+    gen_scatter_by_cyclic,
+    gen_scatter_by_direct_term,
+    get_proc_serials,
+    get_v_keys_str,
+    group_by_df,
+)
 from ap.api.common.services.show_graph_services import (
     calc_raw_common_scale_y,
     calc_scale_info,
@@ -45,13 +53,11 @@ from ap.common.constants import (
     ELAPSED_TIME,
     END_COL_ID,
     END_DATE,
-    END_DT,
     END_PROC_ID,
     END_TM,
     H_LABEL,
     HEATMAP_MATRIX,
     IS_DATA_LIMITED,
-    IS_EMPTY_GRAPH,
     IS_RESAMPLING,
     MATCHED_FILTER_IDS,
     N_TOTAL,
@@ -69,7 +75,6 @@ from ap.common.constants import (
     SERIALS,
     SORT_KEY,
     START_DATE,
-    START_DT,
     START_PROC,
     START_TM,
     SUMMARIES,
@@ -106,7 +111,6 @@ from ap.common.services.sse import MessageAnnouncer
 from ap.common.services.statistics import calc_summary_elements
 from ap.common.sigificant_digit import get_fmt_from_array, get_fmt_from_color_setting
 from ap.common.trace_data_log import EventAction, EventType, Target, TraceErrKey, trace_log
-from ap.setting_module.models import CfgProcessColumn
 from ap.trace_data.schemas import DicParam
 
 DATA_COUNT_COL = '__data_count_col__'
@@ -262,6 +266,8 @@ def gen_scatter_plot(root_graph_param: DicParam, dic_param, df=None):
             color_label,
             level_labels,
             chart_type,
+            gen_dic_graphs=gen_dic_graphs,
+            get_proc_times=get_proc_times,
         )
     else:
         # query data and gen df
@@ -321,6 +327,8 @@ def gen_scatter_plot(root_graph_param: DicParam, dic_param, df=None):
                 color_label,
                 level_labels,
                 chart_type,
+                gen_dic_graphs=gen_dic_graphs,
+                get_proc_times=get_proc_times,
             )
         else:
             cat_div_type = dic_cols[cat_div_id].data_type if cat_div_id else None
@@ -778,82 +786,6 @@ def sort_data_count_key(key):
     return key
 
 
-@log_execution_time()
-@abort_process_handler()
-def group_by_df(
-    df: DataFrame,
-    cols,
-    max_group=None,
-    max_record_per_group=None,
-    sort_key_func=None,
-    reverse=True,
-    get_from_last=None,
-):
-    dic_groups = {}
-    if df is None or not len(df):
-        return dic_groups
-
-    if not cols:
-        dic_groups[None] = df.head(max_record_per_group)
-        return dic_groups
-
-    df_groups = df.groupby(cols)
-    max_group = max_group or len(df_groups.groups)
-
-    # sort desc
-    if sort_key_func:
-
-        def sort_func(x):
-            return sort_key_func(x[0])
-
-    else:
-        all_numeric = all(str(key).isnumeric() for key, df_group in df_groups)
-        sort_func = (lambda x: int(x[0])) if all_numeric else lambda x: str(x[0])
-
-    groups = sorted(df_groups, key=sort_func, reverse=reverse)
-    groups = groups[:max_group]
-    if get_from_last:
-        groups.reverse()
-
-    for key, df_group in groups:
-        dic_groups[key] = df_group.head(max_record_per_group)
-
-    return dic_groups
-
-
-@log_execution_time()
-@abort_process_handler()
-def split_df_by_time_range(dic_df_chunks, max_group=None, max_record_per_group=None):
-    dic_groups = {}
-    max_group = max_group or len(dic_df_chunks)
-
-    for count, (key, df_group) in enumerate(dic_df_chunks.items()):
-        # for key, df_group in df_groups.groups.items():
-        if count >= max_group:
-            break
-        dic_groups[key] = df_group.head(max_record_per_group)
-
-    return dic_groups
-
-
-@log_execution_time()
-def drop_missing_data(df: DataFrame, cols):
-    if df is not None and len(df):
-        df = df.dropna(subset=[col for col in cols if col]).convert_dtypes()
-    return df
-
-
-@log_execution_time()
-def get_v_keys_str(v_keys):
-    if v_keys is None:
-        v_keys_str = None
-    elif isinstance(v_keys, (list, tuple)):
-        v_keys_str = '|'.join([str(key) for key in v_keys])
-    else:
-        v_keys_str = v_keys
-    return v_keys_str
-
-
 @log_execution_time()
 def calc_elapsed_times(df_data, time_col):
     elapsed_times = pd.to_datetime(df_data[time_col]).sort_values()
@@ -980,103 +912,6 @@ def get_proc_times(df, proc_id):
     return pd.Series()
 
 
-@log_execution_time()
-@abort_process_handler()
-def gen_scatter_by_cyclic(
-    dic_proc_cfgs,
-    matrix_col,
-    df: DataFrame,
-    x_proc_id,
-    y_proc_id,
-    x,
-    y,
-    terms,
-    color=None,
-    levels=None,
-    chart_type=None,
-):
-    """
-    split by terms
-    :param matrix_col:
-    :param df:
-    :param x_proc_id:
-    :param y_proc_id:
-    :param x:
-    :param y:
-    :param terms:
-    :param color:
-    :param levels:
-    :return:
-    """
-    if levels is None:
-        levels = []
-
-    # time column
-    time_col = TIME_COL
-    # time_col = [col for col in df.columns if col.startswith(TIME_COL)][0]
-
-    # remove missing data
-    df = drop_missing_data(df, [x, y, color] + levels)
-
-    dic_df_chunks = {}
-    df = df.set_index(TIME_COL, drop=False)
-    for term_id, term in enumerate(terms):
-        start_dt = term[START_DT]
-        end_dt = term[END_DT]
-        df_chunk = df[(df.index >= start_dt) & (df.index < end_dt)]
-        dic_df_chunks[(start_dt, end_dt)] = df_chunk
-
-    v_group_cols = [col for col in levels if col]
-
-    # graph number is depend on facet
-    max_graph = matrix_col if v_group_cols else max_graph_config[MaxGraphNumber.SCP_MAX_GRAPH.name]
-    dic_groups = split_df_by_time_range(dic_df_chunks, max_graph)
-
-    # facet
-    dic_groups = {key: group_by_df(df_group, v_group_cols) for key, df_group in dic_groups.items()}
-    row_count = math.ceil(max_graph_config[MaxGraphNumber.SCP_MAX_GRAPH.name] / matrix_col)
-    facet_keys = [
-        key for key, _ in Counter([val for vals in dic_groups.values() for val in vals]).most_common(row_count)
-    ]
-
-    # serials
-    x_serial_cols = dic_proc_cfgs[x_proc_id].get_serials(column_name_only=False)
-    y_serial_cols = [] if y_proc_id == x_proc_id else dic_proc_cfgs[y_proc_id].get_serials(column_name_only=False)
-
-    output_graphs = []
-    output_times = []
-    for h_key, dic_group in dic_groups.items():
-        time_min = f'{h_key[0]}'
-        time_max = f'{h_key[1]}'
-        h_keys_str = f'{time_min} – {time_max}'
-        if not dic_group:
-            empty_dic_data, empty_output_time = gen_empty_dic_graphs(facet_keys, h_keys_str, None, time_min, time_max)
-            output_times.extend(empty_output_time)
-            output_graphs.extend(empty_dic_data)
-        for v_keys, df_data in dic_group.items():
-            if v_keys not in facet_keys:
-                continue
-
-            v_keys_str = get_v_keys_str(v_keys)
-            # elapsed_times = calc_elapsed_times(df_data, time_col)
-
-            # v_label : name ( not id )
-            dic_data = gen_dic_graphs(df_data, x, y, h_keys_str, v_keys_str, color, time_col)
-
-            # serial
-            dic_data[X_SERIAL] = get_proc_serials(df_data, x_serial_cols)
-            dic_data[Y_SERIAL] = get_proc_serials(df_data, y_serial_cols)
-            if ROWID in df_data.columns and chart_type == ChartType.SCATTER.value:
-                dic_data[CYCLE_IDS] = df_data.rowid
-            else:
-                dic_data[CYCLE_IDS] = pd.Series()
-
-            output_times.append((get_proc_times(df_data, x_proc_id), get_proc_times(df_data, y_proc_id)))
-            output_graphs.append(dic_data)
-
-    return output_graphs, output_times
-
-
 @log_execution_time()
 @abort_process_handler()
 def gen_scatter_cat_div(
@@ -1186,93 +1021,6 @@ def gen_scatter_cat_div(
     return output_graphs, output_times
 
 
-@log_execution_time()
-@abort_process_handler()
-def gen_scatter_by_direct_term(
-    dic_proc_cfgs,
-    matrix_col,
-    dic_df_chunks,
-    x_proc_id,
-    y_proc_id,
-    x,
-    y,
-    color=None,
-    levels=None,
-    chart_type=None,
-):
-    """
-    split by terms
-    :param matrix_col:
-    :param dic_df_chunks
-    :param x_proc_id:
-    :param y_proc_id:
-    :param x:
-    :param y:
-    :param color:
-    :param levels:
-    :return:
-    """
-    if levels is None:
-        levels = []
-
-    # time column
-    time_col = TIME_COL
-
-    # remove missing data
-    for key, df in dic_df_chunks.items():
-        dic_df_chunks[key] = drop_missing_data(df, [x, y, color] + levels)
-
-    v_group_cols = [col for col in levels if col]
-
-    # graph number is depend on facet
-    max_graph = matrix_col if v_group_cols else max_graph_config[MaxGraphNumber.SCP_MAX_GRAPH.name]
-    dic_groups = split_df_by_time_range(dic_df_chunks, max_graph)
-
-    # facet
-    dic_groups = {key: group_by_df(df_group, v_group_cols) for key, df_group in dic_groups.items()}
-    row_count = math.ceil(max_graph_config[MaxGraphNumber.SCP_MAX_GRAPH.name] / matrix_col)
-    facet_keys = [
-        key for key, _ in Counter([val for vals in dic_groups.values() for val in vals]).most_common(row_count)
-    ]
-    # serials
-    x_serial_cols = dic_proc_cfgs[x_proc_id].get_serials(column_name_only=False)
-    y_serial_cols = [] if y_proc_id == x_proc_id else dic_proc_cfgs[y_proc_id].get_serials(column_name_only=False)
-
-    output_graphs = []
-    output_times = []
-    for h_key, dic_group in dic_groups.items():
-        time_min = f'{h_key[0]} {h_key[1]}'
-        time_max = f'{h_key[2]} {h_key[3]}'
-        h_keys_str = f'{time_min} – {time_max}'
-        # show empty graphs when toggle ON [Arrange Div] switch
-        if not dic_group:
-            empty_dic_data, empty_output_time = gen_empty_dic_graphs(facet_keys, h_keys_str, None, time_min, time_max)
-            output_times.extend(empty_output_time)
-            output_graphs.extend(empty_dic_data)
-        for v_keys, df_data in dic_group.items():
-            if v_keys not in facet_keys:
-                continue
-
-            v_keys_str = get_v_keys_str(v_keys)
-            # elapsed_times = calc_elapsed_times(df_data, time_col)
-
-            # v_label : name ( not id )
-            dic_data = gen_dic_graphs(df_data, x, y, h_keys_str, v_keys_str, color, time_col)
-
-            # serial
-            dic_data[X_SERIAL] = get_proc_serials(df_data, x_serial_cols)
-            dic_data[Y_SERIAL] = get_proc_serials(df_data, y_serial_cols)
-            if ROWID in df_data.columns and chart_type == ChartType.SCATTER.value:
-                dic_data[CYCLE_IDS] = df_data.rowid
-            else:
-                dic_data[CYCLE_IDS] = pd.Series()
-
-            output_times.append((get_proc_times(df_data, x_proc_id), get_proc_times(df_data, y_proc_id)))
-            output_graphs.append(dic_data)
-
-    return output_graphs, output_times
-
-
 @log_execution_time()
 @abort_process_handler()
 def gen_dic_graphs(df_data, x, y, h_keys_str, v_keys_str, color, time_col, sort_key=None):
@@ -1296,31 +1044,6 @@ def gen_dic_graphs(df_data, x, y, h_keys_str, v_keys_str, color, time_col, sort_
     return dic_data
 
 
-@log_execution_time()
-@abort_process_handler()
-def gen_empty_dic_graphs(facet_keys, h_keys_str, v_keys_str, time_min, time_max, sort_key=None):
-    dic_data = {
-        H_LABEL: h_keys_str,
-        V_LABEL: v_keys_str,
-        ARRAY_X: pd.Series(),
-        ARRAY_Y: pd.Series(),
-        COLORS: pd.Series(),
-        TIMES: pd.Series(),
-        TIME_MIN: time_min,
-        TIME_MAX: time_max,
-        N_TOTAL: 0,
-        SORT_KEY: h_keys_str if sort_key is None else sort_key,
-        X_SERIAL: pd.Series(),
-        Y_SERIAL: pd.Series(),
-        CYCLE_IDS: pd.Series(),
-        IS_EMPTY_GRAPH: True,
-    }
-    output_time = ([], [])
-    dic_graphs = [{**dic_data.copy(), V_LABEL: get_v_keys_str(v_key)} for v_key in facet_keys]
-    output_times = [output_time for _ in facet_keys]
-    return dic_graphs, output_times
-
-
 @log_execution_time()
 @abort_process_handler()
 def gen_df_limit_data(graph, keys, limit=None):
@@ -1374,26 +1097,6 @@ def filter_violin_df(df, cols, most_vals):
     return df_result
 
 
-@log_execution_time()
-@abort_process_handler()
-def get_proc_serials(df: DataFrame, serial_cols: list[CfgProcessColumn]) -> list[dict[str, Any]]:
-    if not serial_cols:
-        return []
-
-    if df is None or len(df) == 0:
-        return []
-
-    # serials
-    serials = []
-    for col in serial_cols:
-        sql_label = gen_sql_label(col.id, col.column_name)
-        if sql_label in df.columns:
-            dic_serial = {'col_name': col.shown_name, 'data': df[sql_label]}
-            serials.append(dic_serial)
-
-    return serials
-
-
 @log_execution_time()
 @abort_process_handler()
 def reduce_data_by_number(df, max_graph, recent_flg=None):
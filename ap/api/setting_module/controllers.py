@@ -121,6 +121,7 @@ from ap.common.constants import (
     ProcessColumnConst,
 )
 from ap.common.datetime_format_utils import convert_datetime_format
+from ap.common.jobs.conflict import ResourceLocks
 from ap.common.memoize import clear_cache
 from ap.common.multiprocess_sharing import EventAddJob, EventBackgroundAnnounce, EventQueue, EventRemoveJobs
 from ap.common.multiprocess_sharing.events import EventKillJobs
@@ -540,9 +541,19 @@ def listen_background_job(uuid: str):
     because only one-client (one target browser) can communicate with this at a time.
     """
     streamer = MessageAnnouncer.create_streamer(uuid)
+    if MessageAnnouncer.dispatch_streamer(streamer, request.environ):
+        # connection is served by dispatcher thread, this response is never sent
+        return Response(mimetype='text/event-stream')
+
     return Response(streamer.stream(), mimetype='text/event-stream')
 
 
+@api_setting_module_blueprint.route('/listen_background_job_stats', methods=['GET'])
+def get_listen_background_job_stats():
+    """Number of connected clients, published, coalesced and dropped messages of background job streamers"""
+    return jsonify(MessageAnnouncer.get_stats()), 200
+
+
 @api_setting_module_blueprint.route('/check_folder', methods=['POST'])
 def check_folder():
     try:
@@ -606,6 +617,12 @@ def check_folder_or_file():
         )
 
 
+@api_setting_module_blueprint.route('/job_resource_lock_stats', methods=['GET'])
+def get_job_resource_lock_stats():
+    """Holders, number of acquired and contended locks of each resource used by jobs"""
+    return jsonify(ResourceLocks.get_stats()), 200
+
+
 @api_setting_module_blueprint.route('/job_detail/<job_id>', methods=['GET'])
 def get_job_detail(job_id):
     """[Summary] Get get job details
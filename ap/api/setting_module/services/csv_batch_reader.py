@@ -0,0 +1,249 @@
+"""Read csv files for importing in record batches, in a background thread.
+
+A file is cut into byte ranges of about `BATCH_BYTES` at record ends (newlines outside quoted values),
+each range is parsed by `pyarrow.csv.read_csv` with several threads, a few ranges ahead of the importing thread.
+So parsing of the next batch or the next file overlaps with writing the current one to database,
+and memory is bounded by the batch size instead of the file size.
+A sentinel row is parsed after each range, it proves that the range did not end inside a quoted value.
+Every column is read as text, like `csv_to_df` does for importing.
+Rows pyarrow cannot read the same way as pandas (a different number of fields, undecodable text)
+stop the batches of that file with `CsvBatchFallback`, the rest of the file is then read by pandas.
+"""
+
+from __future__ import annotations
+
+import codecs
+import logging
+import queue
+import threading
+from typing import Iterator, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+from pandas._libs.parsers import STR_NA_VALUES
+from pyarrow import csv as pa_csv
+
+from ap.api.efa.services.etl import detect_file_path_delimiter
+from ap.api.setting_module.services.data_import import NA_VALUES
+from ap.common.path_utils import open_with_zip
+
+logger = logging.getLogger(__name__)
+
+# bytes of csv text parsed at once, a batch has about this size
+BATCH_BYTES = 8 * 1024 * 1024
+
+# a record longer than this many batches is not cut, the rest of the file is read by pandas
+MAX_BATCH_GROWTH = 8
+
+# bytes parsed by each thread of pyarrow
+BATCH_BLOCK_SIZE = 1024 * 1024
+
+# bytes read to get column names, header must fit in it
+HEADER_BLOCK_SIZE = 1024 * 1024
+
+# number of parsed record batches waiting for importing thread
+PREFETCH_BATCHES = 2
+
+# same n/a strings as `pd.read_csv(na_values=NA_VALUES)`
+CSV_NULL_VALUES = sorted(STR_NA_VALUES | NA_VALUES)
+
+# pyarrow decodes utf-8 itself, other encodings are transcoded
+UTF8_ENCODINGS = {'utf-8', 'utf_8', 'utf8', 'utf-8-sig', 'utf_8_sig'}
+
+# newline and quote bytes of these encodings are not always ascii ones, text cannot be cut at them
+UNSPLITTABLE_ENCODING_PREFIXES = ('utf-16', 'utf-32', 'utf-7', 'iso2022', 'hz')
+
+# value of sentinel row, it is not a n/a string and has no delimiter or quote
+SENTINEL_VALUE = '\x01ap_batch_end\x01'
+
+
+class CsvBatchFallback(Exception):
+    """The rest of the file must be read by pandas"""
+
+
+def find_record_end(data: bytes) -> int:
+    """
+    Position after the last newline which is not in a quoted value, data must start at a record start
+    :return: -1 if there is no such newline
+    """
+    # a newline is in a quoted value if an odd number of quotes are before it
+    in_quote = data.count(b'"') % 2
+    pos = len(data)
+    while True:
+        newline_pos = data.rfind(b'\n', 0, pos)
+        if newline_pos < 0:
+            return -1
+
+        in_quote ^= data.count(b'"', newline_pos, pos) % 2
+        if not in_quote:
+            return newline_pos + 1
+
+        pos = newline_pos
+
+
+class CsvBatchPrefetcher:
+    """Parse import target files in order, in a background thread.
+    The importing thread asks for batches of each file with `read`, files which it does not ask for are skipped.
+    """
+
+    def __init__(self, files: list[tuple[int, str]], skip_rows: int, csv_delimiter: str):
+        """
+        :param files: index and path of files which can be read in batches, in importing order
+        :param skip_rows: number of rows before header
+        :param csv_delimiter: default delimiter, it is detected for each file like importing does
+        """
+        self.files = files
+        self.skip_rows = skip_rows
+        self.csv_delimiter = csv_delimiter
+        self._queue: queue.Queue = queue.Queue(maxsize=PREFETCH_BATCHES)
+        # index of file which importing thread reads, files before it are skipped
+        self._wanted_idx = -1
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='CsvBatchPrefetcher', daemon=True)
+
+    def __enter__(self) -> CsvBatchPrefetcher:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        # unblock background thread which waits for a free slot
+        while self._thread.is_alive():
+            self._drain()
+            self._thread.join(timeout=0.1)
+
+    def has_file(self, idx: int) -> bool:
+        return any(file_idx == idx for file_idx, _ in self.files)
+
+    def read(self, idx: int) -> Iterator[Union[pa.Schema, pa.Table]]:
+        """
+        Batches of a file, the schema comes first
+        :param idx: index of file, must be larger than the ones read before
+        :raise CsvBatchFallback: the file cannot be read in batches from here
+        """
+        self._wanted_idx = idx
+        while True:
+            item_idx, item = self._queue.get()
+            if item_idx < idx:
+                continue
+
+            if isinstance(item, Exception):
+                raise CsvBatchFallback(str(item)) from item
+
+            if item is None:
+                return
+
+            yield item
+
+    def _drain(self):
+        with self._queue.mutex:
+            self._queue.queue.clear()
+            self._queue.not_full.notify_all()
+
+    def _put(self, idx: int, item: Optional[Union[pa.Schema, pa.Table, Exception]]) -> bool:
+        """Wait for a free slot, False if the file is not needed anymore"""
+        while not self._stop.is_set() and idx >= self._wanted_idx:
+            try:
+                self._queue.put((idx, item), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _run(self):
+        for idx, file_path in self.files:
+            if self._stop.is_set():
+                return
+
+            if idx < self._wanted_idx:
+                continue
+
+            try:
+                for item in self._iter_file(file_path):
+                    if not self._put(idx, item):
+                        break
+                else:
+                    self._put(idx, None)
+            except Exception as e:
+                # pandas reads the rest of this file
+                logger.info(f'Read {file_path} by pandas: {e}')
+                self._put(idx, e)
+
+    def _iter_file(self, file_path: str) -> Iterator[Union[pa.Schema, pa.Table]]:
+        delimiter, encoding = detect_file_path_delimiter(file_path, self.csv_delimiter, with_encoding=True)
+        encoding = (encoding or 'utf-8').lower()
+        if codecs.lookup(encoding).name.startswith(UNSPLITTABLE_ENCODING_PREFIXES):
+            raise ValueError(f'Cannot read {encoding} text in batches')
+
+        read_options = pa_csv.ReadOptions(
+            use_threads=True,
+            block_size=HEADER_BLOCK_SIZE,
+            skip_rows=self.skip_rows,
+            encoding='utf8' if encoding in UTF8_ENCODINGS else encoding,
+        )
+        # rows with a different number of fields raise error, pandas pads or drops them
+        parse_options = pa_csv.ParseOptions(delimiter=delimiter, newlines_in_values=True, ignore_empty_lines=True)
+
+        # get column names from the first block only
+        with open_with_zip(file_path, 'rb') as f:
+            names = pa_csv.open_csv(f, read_options=read_options, parse_options=parse_options).schema.names
+
+        # every column as text
+        schema = pa.schema([(name, pa.string()) for name in names])
+        yield schema
+
+        read_options.block_size = BATCH_BLOCK_SIZE
+        convert_options = pa_csv.ConvertOptions(
+            column_types=schema,
+            null_values=CSV_NULL_VALUES,
+            strings_can_be_null=True,
+        )
+        sentinel = '\n' + delimiter.join([SENTINEL_VALUE] * len(names)) + '\n'
+        sentinel = sentinel.encode('utf-8' if encoding in UTF8_ENCODINGS else encoding)
+        with open_with_zip(file_path, 'rb') as f:
+            data = b''
+            is_eof = False
+            while not is_eof:
+                if self._stop.is_set():
+                    return
+
+                # cut at the last record end, the rest is parsed with the next range
+                batch_bytes = BATCH_BYTES
+                while True:
+                    chunk = f.read(max(batch_bytes - len(data), BATCH_BLOCK_SIZE))
+                    data += chunk
+                    is_eof = not chunk
+                    end = len(data) if is_eof else find_record_end(data)
+                    if end >= 0:
+                        break
+
+                    if batch_bytes >= BATCH_BYTES * MAX_BATCH_GROWTH:
+                        raise ValueError('A record is too long to be read in batches')
+
+                    batch_bytes *= 2
+
+                if not data[:end].strip(b'\r\n'):
+                    break
+
+                table = pa_csv.read_csv(
+                    pa.py_buffer(data[:end] + sentinel),
+                    read_options=read_options,
+                    parse_options=parse_options,
+                    convert_options=convert_options,
+                )
+                data = data[end:]
+                # header and rows before it are in the first range only
+                read_options.skip_rows = 0
+                read_options.column_names = names
+
+                # sentinel is absorbed by a quoted value if the range did not end at a record end
+                if not table.num_rows or table.column(0)[-1].as_py() != SENTINEL_VALUE:
+                    raise ValueError('A batch does not end at a record end')
+
+                yield table.slice(0, table.num_rows - 1)
+
+
+def batch_to_df(batch: Union[pa.RecordBatch, pa.Table], columns: list[str]) -> pd.DataFrame:
+    """Columns of a batch as text columns, in the same dtype as `pd.read_csv(dtype='string')`"""
+    return batch.select(columns).to_pandas(types_mapper={pa.string(): pd.StringDtype()}.get)
@@ -0,0 +1,276 @@
+"""Persistent index of csv files under the folder of a process data source.
+
+Finding import targets used to list the whole folder tree and check every file against import history.
+The index keeps modified time of each folder, and size, modified time and import status of its files.
+A folder is listed again only when its modified time changed, files of other folders come from the index.
+Writing into an existing file does not change modified time of its folder, so append candidates (files which are not
+imported yet or were modified within `ACTIVE_FILE_PERIOD_NS`) are checked by `stat` on every scan.
+Other files are checked when the whole tree is listed again, once in `FULL_SCAN_INTERVAL_NS`.
+Cost of a scan grows with changed folders and append candidates, not with all files.
+The index is saved only when it changed, and reused without loading while its file is not changed by other processes.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from ap.common.logger import log_execution_time
+from ap.common.path_utils import check_exist, get_file_index_path, make_dir
+
+logger = logging.getLogger(__name__)
+
+# files modified in this period may still be written, they are checked even if their folder is not changed
+ACTIVE_FILE_PERIOD_NS = 24 * 60 * 60 * 10**9
+
+# every folder is listed again after this period, in case its modified time is not updated (e.g. some network shares)
+FULL_SCAN_INTERVAL_NS = 60 * 60 * 10**9
+
+# a folder modified this close to the previous scan may change again within the same timestamp
+RACY_PERIOD_NS = 2 * 10**9
+
+# same depth as `get_files(depth_from=1, depth_to=100)`
+MAX_DEPTH = 100
+
+# saved index of other version is built again
+INDEX_VERSION = 2
+
+
+# size, modified time and start time of import history which is newer than the file (None if it is not imported yet)
+# plain tuple, because loading index of hundreds of thousands of files is several times slower with objects
+IndexedFile = tuple[int, int, Optional[str]]
+
+
+@dataclass
+class IndexedFolder:
+    mtime_ns: int
+    # sub folder names, in listing order like `os.walk`
+    folders: list[str] = field(default_factory=list)
+    # target file names, in listing order like `os.walk`
+    files: dict[str, IndexedFile] = field(default_factory=dict)
+    # names of append candidates, checked on every scan
+    active_files: set[str] = field(default_factory=set)
+
+
+class CsvFileIndex:
+    """Target files of a process, updated incrementally by `scan`"""
+
+    # index of each process saved or loaded by this process, with modified time and size of its file
+    _loaded: dict[int, tuple[tuple[int, int], CsvFileIndex]] = {}
+
+    def __init__(self, proc_id: int, directory: str, extensions: list[str]):
+        self.proc_id = proc_id
+        self.directory = directory
+        self.extensions = extensions
+        self.folders: dict[str, IndexedFolder] = {}
+        self.scanned_at_ns = 0
+        self.full_scanned_at_ns = 0
+        # folder of each target file of the last scan, not saved
+        self.files: dict[str, IndexedFolder] = {}
+        # whether folders or files are changed since the index was loaded or saved, not saved
+        self.changed = True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['files']
+        del state['changed']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.files = {}
+        self.changed = False
+
+    @staticmethod
+    def get_index_file(proc_id: int) -> str:
+        return os.path.join(get_file_index_path(), f'{proc_id}.pickle')
+
+    @classmethod
+    def load(cls, proc_id: int, directory: str, extensions: list[str]) -> CsvFileIndex:
+        """
+        Saved index of process
+        :return: a new index if there is no saved index, or data source folder is changed
+        """
+        index_file = cls.get_index_file(proc_id)
+        try:
+            stat = os.stat(index_file)
+            file_stat = (stat.st_mtime_ns, stat.st_size)
+            loaded_file_stat, file_index = cls._loaded.get(proc_id, (None, None))
+            if loaded_file_stat != file_stat:
+                with open(index_file, 'rb') as f:
+                    version, file_index = pickle.load(f)
+                if version != INDEX_VERSION:
+                    file_index = None
+                cls._loaded[proc_id] = (file_stat, file_index)
+
+            if file_index and file_index.directory == directory and file_index.extensions == extensions:
+                return file_index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f'Build csv file index of process {proc_id} again: {e}')
+
+        cls._loaded.pop(proc_id, None)
+        return cls(proc_id, directory, extensions)
+
+    def save(self):
+        """Save index if it is changed"""
+        if not self.changed:
+            return
+
+        index_file = self.get_index_file(self.proc_id)
+        make_dir(os.path.dirname(index_file))
+        temp_file = f'{index_file}.tmp'
+        with open(temp_file, 'wb') as f:
+            pickle.dump((INDEX_VERSION, self), f, pickle.HIGHEST_PROTOCOL)
+
+        # an interrupted save keeps the previous index
+        os.replace(temp_file, index_file)
+        self.changed = False
+        stat = os.stat(index_file)
+        self._loaded[self.proc_id] = ((stat.st_mtime_ns, stat.st_size), self)
+
+    @log_execution_time()
+    def scan(self) -> list[str]:
+        """
+        Target files under data source folder, same as `get_files(directory, 1, 100, extensions)`
+        :return: file paths
+        """
+        if not check_exist(self.directory):
+            raise FileNotFoundError('Folder not found!')
+
+        started_at_ns = time.time_ns()
+        is_full_scan = started_at_ns - self.full_scanned_at_ns > FULL_SCAN_INTERVAL_NS
+        folders: dict[str, IndexedFolder] = {}
+        files: dict[str, IndexedFolder] = {}
+        max_depth = self.directory.count(os.path.sep) + MAX_DEPTH
+
+        # top-down like `os.walk`
+        stack = [self.directory]
+        while stack:
+            folder_path = stack.pop()
+            if folder_path.count(os.path.sep) + 1 > max_depth:
+                continue
+
+            folder = self._scan_folder(folder_path, started_at_ns, is_full_scan)
+            if folder is None:
+                continue
+
+            folders[folder_path] = folder
+            for file_name in folder.files:
+                files[os.path.join(folder_path, file_name)] = folder
+
+            stack.extend(os.path.join(folder_path, name) for name in reversed(folder.folders))
+
+        if folders.keys() != self.folders.keys():
+            self.changed = True
+        self.folders = folders
+        self.files = files
+        self.scanned_at_ns = started_at_ns
+        if is_full_scan:
+            self.full_scanned_at_ns = started_at_ns
+
+        return list(files)
+
+    def _scan_folder(self, folder_path: str, started_at_ns: int, is_full_scan: bool) -> Optional[IndexedFolder]:
+        """
+        :return: None if folder cannot be listed, it is skipped like `os.walk` does
+        """
+        try:
+            mtime_ns = os.stat(folder_path).st_mtime_ns
+        except OSError:
+            return None
+
+        folder = self.folders.get(folder_path)
+        if (
+            is_full_scan
+            or folder is None
+            or folder.mtime_ns != mtime_ns
+            or mtime_ns >= self.scanned_at_ns - RACY_PERIOD_NS
+        ):
+            return self._list_folder(folder_path, started_at_ns, mtime_ns, folder)
+
+        # no file is added or removed, but append candidates may be written
+        for file_name in list(folder.active_files):
+            size, file_mtime_ns, imported_tm = folder.files[file_name]
+            try:
+                stat = os.stat(os.path.join(folder_path, file_name))
+            except OSError:
+                return self._list_folder(folder_path, started_at_ns, mtime_ns, folder)
+
+            if (stat.st_size, stat.st_mtime_ns) != (size, file_mtime_ns):
+                folder.files[file_name] = (stat.st_size, stat.st_mtime_ns, None)
+                self.changed = True
+            elif imported_tm is not None and not is_active_file(file_mtime_ns, started_at_ns):
+                folder.active_files.discard(file_name)
+                self.changed = True
+
+        return folder
+
+    def _list_folder(
+        self,
+        folder_path: str,
+        started_at_ns: int,
+        mtime_ns: int,
+        old_folder: Optional[IndexedFolder],
+    ) -> Optional[IndexedFolder]:
+        self.changed = True
+        old_files = old_folder.files if old_folder else {}
+        folder = IndexedFolder(mtime_ns=mtime_ns)
+        try:
+            with os.scandir(folder_path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+
+                    if is_dir:
+                        # symbolic links to folders are not followed, like `os.walk`
+                        if not entry.is_symlink():
+                            folder.folders.append(entry.name)
+                        continue
+
+                    if not any(entry.name.lower().endswith(ext) for ext in self.extensions):
+                        continue
+
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+
+                    # keep import status of unchanged files
+                    indexed_file = old_files.get(entry.name)
+                    if indexed_file is None or indexed_file[:2] != (stat.st_size, stat.st_mtime_ns):
+                        indexed_file = (stat.st_size, stat.st_mtime_ns, None)
+
+                    folder.files[entry.name] = indexed_file
+                    if indexed_file[2] is None or is_active_file(stat.st_mtime_ns, started_at_ns):
+                        folder.active_files.add(entry.name)
+        except OSError:
+            return None
+
+        return folder
+
+    def is_imported(self, file_path: str, imported_tm: str) -> bool:
+        """Whether the file was already found imported by this import history, and has not changed since"""
+        folder = self.files.get(file_path)
+        return folder is not None and folder.files[os.path.basename(file_path)][2] == imported_tm
+
+    def set_imported(self, file_path: str, imported_tm: str):
+        folder = self.files.get(file_path)
+        if folder is not None:
+            file_name = os.path.basename(file_path)
+            size, mtime_ns, old_imported_tm = folder.files[file_name]
+            if old_imported_tm != imported_tm:
+                folder.files[file_name] = (size, mtime_ns, imported_tm)
+                self.changed = True
+
+
+def is_active_file(mtime_ns: int, now_ns: int) -> bool:
+    """Whether a file was modified recently, so that it may still be written"""
+    return mtime_ns >= now_ns - ACTIVE_FILE_PERIOD_NS
@@ -7,13 +7,15 @@ import re
 import uuid
 from datetime import datetime
 from io import BytesIO
-from typing import Optional
+from typing import Iterator, Optional
 
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
 from ap.api.efa.services.etl import csv_transform, detect_file_path_delimiter
+from ap.api.setting_module.services.csv_batch_reader import CsvBatchFallback, CsvBatchPrefetcher, batch_to_df
+from ap.api.setting_module.services.csv_file_index import CsvFileIndex
 from ap.api.setting_module.services.data_import import (
     FILE_IDX_COL,
     INDEX_COL,
@@ -85,7 +87,7 @@ from ap.common.datetime_format_utils import convert_datetime_format
 from ap.common.disk_usage import get_ip_address
 from ap.common.logger import log_execution_time
 from ap.common.multiprocess_sharing import EventBackgroundAnnounce, EventQueue
-from ap.common.path_utils import get_basename, get_files
+from ap.common.path_utils import get_basename
 from ap.common.pydn.dblib.db_proxy import DbProxy, gen_data_source_of_universal_db
 from ap.common.scheduler import scheduler_app_context
 from ap.common.services.csv_content import (
@@ -118,6 +120,9 @@ from ap.trace_data.transaction_model import TransactionData
 
 logger = logging.getLogger(__name__)
 
+# rows read at once when pandas reads the rest of a file which cannot be read in batches
+CSV_FALLBACK_CHUNK_ROWS = 200_000
+
 
 @scheduler_app_context
 def import_csv_job(
@@ -292,96 +297,231 @@ def import_csv(proc_id, record_per_commit=RECORD_PER_COMMIT, register_by_file_re
     chunk_size = record_per_commit * 100
     origin_default_csv_param = default_csv_param.copy()
     total_imported_row = 0
-    for idx, (csv_file_name, transformed_file) in enumerate(import_targets):
-        # Because each file has a different structure, it will read according to different parameters
-        default_csv_param = origin_default_csv_param.copy()
-        job_info.target = csv_file_name
+    # files which can be read in batches are parsed ahead in background, while importing the previous ones
+    batch_files = []
+    if not (is_v2_datasource or is_abnormal or use_dummy_datetime) and can_read_csv_in_batches(data_src):
+        batch_files = [(idx, file) for idx, (_, file) in enumerate(import_targets) if not isinstance(file, Exception)]
+
+    with CsvBatchPrefetcher(batch_files, len(head_skips), csv_delimiter) as prefetcher:
+        for idx, (csv_file_name, transformed_file) in enumerate(import_targets):
+            # Because each file has a different structure, it will read according to different parameters
+            default_csv_param = origin_default_csv_param.copy()
+            job_info.target = csv_file_name
+
+            if not dic_imported_row:
+                job_info.start_tm = get_current_timestamp()
+
+            # R error check
+            if isinstance(transformed_file, Exception):
+                yield from yield_job_info(job_info, csv_file_name, err_msgs=str(transformed_file))
+                continue
 
-        if not dic_imported_row:
-            job_info.start_tm = get_current_timestamp()
+            # delimiter check
+            transformed_file_delimiter, encoding = detect_file_path_delimiter(
+                transformed_file,
+                csv_delimiter,
+                with_encoding=True,
+            )
+            # check missing columns
+            partial_dummy_header = False
+            if is_abnormal is False:
+                dic_csv_cols = None
+                dic_org_csv_cols = None
+                csv_cols = headers
+                # in case if v2, assume that there is not missing columns from v2 files
+                if not is_v2_datasource:
+                    # check missing columns
+                    # TODO: Tuan refactor
+                    check_file = read_data(
+                        transformed_file,
+                        skip_head=data_src.skip_head,
+                        n_rows=data_src.n_rows,
+                        is_transpose=data_src.is_transpose,
+                        delimiter=transformed_file_delimiter,
+                        do_normalize=False,
+                    )
+                    org_csv_cols = next(check_file)
+                    if data_src.dummy_header:
+                        # generate column name if there is not header in file
+                        org_csv_cols, csv_cols, *_ = gen_dummy_header(org_csv_cols, skip_head=data_src.skip_head)
+                        csv_cols, _ = gen_colsname_for_duplicated(csv_cols)
+                    else:
+                        # need to convert header in case of transposed
+                        if data_src.is_transpose:
+                            _, csv_cols, *_ = gen_dummy_header(org_csv_cols)
+                            csv_cols, _ = gen_colsname_for_duplicated(csv_cols)
+                        else:
+                            # for the column names with only spaces, we need to generate dummy headers for them
+                            _, csv_cols, _, partial_dummy_header, *_ = gen_dummy_header(org_csv_cols)
+                            csv_cols = normalize_list(csv_cols)
+                        # try to convert ➊ irregular number from csv columns
+                        csv_cols = [normalize_str(col) for col in csv_cols]
+
+                    # add file for add suffix same show latest record
+                    if proc_cfg.is_show_file_name:
+                        csv_cols.append(FILE_NAME)
+                        org_csv_cols.append(FILE_NAME)
+                    if use_dummy_datetime:
+                        csv_cols.append(DATETIME_DUMMY)
+                        org_csv_cols.append(DATETIME_DUMMY)
+
+                    csv_cols, with_dupl_cols, _is_gen_col = add_suffix_if_duplicated(csv_cols)
+                    if not partial_dummy_header:
+                        partial_dummy_header = _is_gen_col
+                    dic_csv_cols = dict(zip(csv_cols, with_dupl_cols))
+                    # add suffix to origin csv cols
+                    org_csv_cols, *_ = add_suffix_if_duplicated(org_csv_cols)
+                    dic_org_csv_cols = dict(zip(csv_cols, org_csv_cols))
+
+                    check_file.close()
+                # missing_cols = set(dic_use_cols).difference(csv_cols)
+                # find same columns between csv file and db
+                valid_columns = list(set(dic_use_cols).intersection(csv_cols))
+                # re-arrange cols
+                valid_columns = [col for col in csv_cols if col in valid_columns]
+                dic_valid_csv_cols = dict(zip(valid_columns, [False] * len(valid_columns)))
+                missing_cols = [] if valid_columns else list(dic_use_cols.keys())
+
+                if not is_v2_datasource:
+                    valid_with_dupl_cols = [dic_csv_cols[col] for col in valid_columns]
+                    dic_valid_csv_cols = dict(zip(valid_columns, valid_with_dupl_cols))
+
+                if dummy_datetime_col in missing_cols:
+                    # remove dummy col before check
+                    missing_cols.remove(dummy_datetime_col)
+
+                if missing_cols and not is_v2_datasource:
+                    err_msg = f"File {transformed_file} doesn't contain expected columns: {list(set(dic_use_cols))}"
+
+                    df_one_file = csv_to_df(
+                        transformed_file,
+                        data_src,
+                        head_skips,
+                        data_first_row,
+                        0,
+                        transformed_file_delimiter,
+                        dic_use_cols=dic_use_cols,
+                        encoding=encoding,
+                    )
+
+                    if df_db_latest_records is None:
+                        df_db_latest_records = get_latest_records(proc_cfg)
+                    df_error_trace = gen_error_output_df(
+                        csv_file_name,
+                        dic_use_cols,
+                        get_df_first_n_last(df_one_file),
+                        df_db_latest_records,
+                        err_msg,
+                    )
+
+                    write_error_trace(df_error_trace, proc_cfg.name, csv_file_name)
+                    write_error_import(
+                        df_one_file,
+                        proc_cfg.name,
+                        csv_file_name,
+                        transformed_file_delimiter,
+                        data_src.directory,
+                    )
+
+                    yield from yield_job_info(job_info, csv_file_name, err_msgs=err_msg)
+                    continue
+
+                # default_csv_param['usecols'] = [i for i, col in enumerate(valid_columns) if col]
+                if not data_src.dummy_header and not partial_dummy_header:
+                    default_csv_param['usecols'] = transform_duplicated_col_suffix_to_pandas_col(
+                        dic_valid_csv_cols,
+                        dic_org_csv_cols,
+                    )
+                    use_col_names = [col for col in valid_columns if col]
+                    # remove file name in usecols after add suffix
+                    if use_dummy_datetime:
+                        default_csv_param['usecols'] = default_csv_param['usecols'][:-1]
+                        if dummy_datetime_col in use_col_names:
+                            use_col_names.remove(dummy_datetime_col)
+
+                    if proc_cfg.is_show_file_name:
+                        default_csv_param['usecols'] = default_csv_param.get('usecols')[:-1]
+                        use_col_names = use_col_names[:-1]
+                else:
+                    # dummy header
+                    default_csv_param['names'] = csv_cols
+                    if use_dummy_datetime:
+                        default_csv_param['names'] = default_csv_param['names'][:-1]
+                    if proc_cfg.is_show_file_name:
+                        default_csv_param['names'] = default_csv_param.get('names')[:-1]
+
+            # read csv file
+            default_csv_param['dtype'] = {
+                col: 'string'
+                for col, col_cfg in dic_use_cols.items()
+                if col in use_col_names
+                and col_cfg.data_type
+                in [
+                    DataType.TEXT.name,
+                    DataType.DATETIME.name,
+                    DataType.DATE.name,
+                    DataType.TIME.name,
+                ]
+            }
 
-        # R error check
-        if isinstance(transformed_file, Exception):
-            yield from yield_job_info(job_info, csv_file_name, err_msgs=str(transformed_file))
-            continue
+            # add more dtype columns in usecols
+            if 'usecols' in default_csv_param:
+                for col_name in default_csv_param['usecols']:
+                    if col_name not in default_csv_param['dtype']:
+                        default_csv_param['dtype'][col_name] = 'string'
+
+            # add more dtype columns in names
+            if 'names' in default_csv_param:
+                for col_name in default_csv_param['names']:
+                    if col_name not in default_csv_param['dtype']:
+                        default_csv_param['dtype'][col_name] = 'string'
+
+            if is_v2_datasource:
+                datasource_type, is_abnormal_v2, is_en_cols = get_v2_datasource_type_from_file(transformed_file)
+                if datasource_type == DBType.V2_HISTORY:
+                    df_one_file = get_df_v2_process_single_file(
+                        transformed_file,
+                        process_name=data_src.process_name,
+                        datasource_type=datasource_type,
+                        is_abnormal_v2=is_abnormal_v2,
+                    )
+                elif datasource_type in [DBType.V2, DBType.V2_MULTI]:
+                    df_one_file = get_vertical_df_v2_process_single_file(
+                        transformed_file,
+                        process_name=data_src.process_name,
+                        datasource_type=datasource_type,
+                        is_abnormal_v2=is_abnormal_v2,
+                        is_en_cols=is_en_cols,
+                    )
+                else:
+                    continue
+                    # raise NotImplementedError
 
-        # delimiter check
-        transformed_file_delimiter, encoding = detect_file_path_delimiter(
-            transformed_file,
-            csv_delimiter,
-            with_encoding=True,
-        )
-        # check missing columns
-        partial_dummy_header = False
-        if is_abnormal is False:
-            dic_csv_cols = None
-            dic_org_csv_cols = None
-            csv_cols = headers
-            # in case if v2, assume that there is not missing columns from v2 files
-            if not is_v2_datasource:
-                # check missing columns
-                # TODO: Tuan refactor
-                check_file = read_data(
+                if df_one_file.empty:
+                    continue
+
+                df_one_file, has_remaining_cols = prepare_to_import_v2_df(df_one_file, proc_cfg, datasource_type)
+
+                if has_remaining_cols:
+                    dic_use_cols = get_config_sensor(proc_cfg)
+
+                df_batches = [(df_one_file, True)]
+            elif prefetcher.has_file(idx) and 'usecols' in default_csv_param and not partial_dummy_header:
+                df_batches = iter_csv_to_dfs(
+                    prefetcher,
+                    idx,
                     transformed_file,
-                    skip_head=data_src.skip_head,
-                    n_rows=data_src.n_rows,
-                    is_transpose=data_src.is_transpose,
-                    delimiter=transformed_file_delimiter,
-                    do_normalize=False,
+                    data_src,
+                    head_skips,
+                    data_first_row,
+                    transformed_file_delimiter,
+                    default_csv_param,
+                    dic_use_cols=dic_use_cols,
+                    col_names=use_col_names,
+                    encoding=encoding,
                 )
-                org_csv_cols = next(check_file)
-                if data_src.dummy_header:
-                    # generate column name if there is not header in file
-                    org_csv_cols, csv_cols, *_ = gen_dummy_header(org_csv_cols, skip_head=data_src.skip_head)
-                    csv_cols, _ = gen_colsname_for_duplicated(csv_cols)
-                else:
-                    # need to convert header in case of transposed
-                    if data_src.is_transpose:
-                        _, csv_cols, *_ = gen_dummy_header(org_csv_cols)
-                        csv_cols, _ = gen_colsname_for_duplicated(csv_cols)
-                    else:
-                        # for the column names with only spaces, we need to generate dummy headers for them
-                        _, csv_cols, _, partial_dummy_header, *_ = gen_dummy_header(org_csv_cols)
-                        csv_cols = normalize_list(csv_cols)
-                    # try to convert ➊ irregular number from csv columns
-                    csv_cols = [normalize_str(col) for col in csv_cols]
-
-                # add file for add suffix same show latest record
-                if proc_cfg.is_show_file_name:
-                    csv_cols.append(FILE_NAME)
-                    org_csv_cols.append(FILE_NAME)
-                if use_dummy_datetime:
-                    csv_cols.append(DATETIME_DUMMY)
-                    org_csv_cols.append(DATETIME_DUMMY)
-
-                csv_cols, with_dupl_cols, _is_gen_col = add_suffix_if_duplicated(csv_cols)
-                if not partial_dummy_header:
-                    partial_dummy_header = _is_gen_col
-                dic_csv_cols = dict(zip(csv_cols, with_dupl_cols))
-                # add suffix to origin csv cols
-                org_csv_cols, *_ = add_suffix_if_duplicated(org_csv_cols)
-                dic_org_csv_cols = dict(zip(csv_cols, org_csv_cols))
-
-                check_file.close()
-            # missing_cols = set(dic_use_cols).difference(csv_cols)
-            # find same columns between csv file and db
-            valid_columns = list(set(dic_use_cols).intersection(csv_cols))
-            # re-arrange cols
-            valid_columns = [col for col in csv_cols if col in valid_columns]
-            dic_valid_csv_cols = dict(zip(valid_columns, [False] * len(valid_columns)))
-            missing_cols = [] if valid_columns else list(dic_use_cols.keys())
-
-            if not is_v2_datasource:
-                valid_with_dupl_cols = [dic_csv_cols[col] for col in valid_columns]
-                dic_valid_csv_cols = dict(zip(valid_columns, valid_with_dupl_cols))
-
-            if dummy_datetime_col in missing_cols:
-                # remove dummy col before check
-                missing_cols.remove(dummy_datetime_col)
-
-            if missing_cols and not is_v2_datasource:
-                err_msg = f"File {transformed_file} doesn't contain expected columns: {list(set(dic_use_cols))}"
-
+            else:
+                # skip_rows = 0 if (is_abnormal or len(head_skips)) else data_src.skip_head
                 df_one_file = csv_to_df(
                     transformed_file,
                     data_src,
@@ -389,242 +529,145 @@ def import_csv(proc_id, record_per_commit=RECORD_PER_COMMIT, register_by_file_re
                     data_first_row,
                     0,
                     transformed_file_delimiter,
+                    default_csv_param=default_csv_param,
                     dic_use_cols=dic_use_cols,
+                    col_names=use_col_names,
                     encoding=encoding,
+                    is_partial_dummy_header=partial_dummy_header,
                 )
-
-                if df_db_latest_records is None:
-                    df_db_latest_records = get_latest_records(proc_cfg)
-                df_error_trace = gen_error_output_df(
-                    csv_file_name,
+                df_batches = [(df_one_file, True)]
+
+            file_record_count = 0
+            for df_one_file, is_last_batch in df_batches:
+                if not is_v2_datasource:
+                    # validate column name
+                    validate_columns(dic_use_cols, df_one_file.columns, use_dummy_datetime, dummy_datetime_col)
+
+                file_record_count += len(df_one_file)
+                if proc_cfg.is_import_file_name:
+                    df_one_file = add_column_file_name(df_one_file, transformed_file, file_name_col=file_name_col)
+
+                # Save history even if the file is empty
+                # a large file can be imported in several chunks, its history is saved with its last batch only
+                dic_imported_row[idx] = (csv_file_name, file_record_count if is_last_batch else None)
+
+                if is_last_batch:
+                    # no records
+                    if not file_record_count:
+                        # Proceed to read the next file without showing a toast message.
+                        if csv_file_name in toast_skip:
+                            continue
+
+                        job_info.status = JobStatus.DONE
+                        job_info.empty_files = [csv_file_name]
+                        yield from yield_job_info(job_info, csv_file_name)
+                        job_info.empty_files = []
+                        continue
+
+                if not len(df_one_file):
+                    continue
+
+                # add 3 columns machine, line, process for efa 1,2,4
+                if is_abnormal and not is_v2_datasource:
+                    cols, vals = csv_data_with_headers(csv_file_name, data_src)
+                    df_one_file[cols] = vals
+                    dic_use_cols_for_abnormal = dic_use_cols.copy()
+                    if use_dummy_datetime and dummy_datetime_col in dic_use_cols_for_abnormal:
+                        dic_use_cols_for_abnormal.pop(dummy_datetime_col)
+                    # remove unused columns
+                    df_one_file = df_one_file[list(dic_use_cols_for_abnormal)]
+
+                if use_dummy_datetime and dummy_datetime_col not in df_one_file.columns:
+                    df_one_file = gen_dummy_datetime(
+                        df_one_file, dummy_datetime_from, dummy_datetime_col=dummy_datetime_col
+                    )
+                    dummy_datetime_from = get_next_datetime_value(df_one_file.shape[0], dummy_datetime_from)
+
+                # mark file
+                df_one_file[FILE_IDX_COL] = idx
+
+                # merge df
+                df = pd.concat([df, df_one_file], ignore_index=True)
+
+                # 10K records
+                if df.size < chunk_size:
+                    continue
+
+                # calc percent
+                finished_file_count = sum(imported_row is not None for _, imported_row in dic_imported_row.values())
+                percent_per_commit = percent_per_file * finished_file_count
+
+                job_info.dic_imported_row = dic_imported_row
+                job_info.import_type = JobType.CSV_IMPORT.name
+                # do import
+                save_res, df_error, df_duplicate = import_df(
+                    proc_cfg,
+                    df,
                     dic_use_cols,
-                    get_df_first_n_last(df_one_file),
-                    df_db_latest_records,
-                    err_msg,
-                )
-
-                write_error_trace(df_error_trace, proc_cfg.name, csv_file_name)
-                write_error_import(
-                    df_one_file,
-                    proc_cfg.name,
-                    csv_file_name,
-                    transformed_file_delimiter,
-                    data_src.directory,
+                    get_date_col,
+                    job_info,
+                    trans_data,
+                    parent_cfg_process=cfg_parent_proc,
                 )
-
-                yield from yield_job_info(job_info, csv_file_name, err_msgs=err_msg)
-                continue
-
-            # default_csv_param['usecols'] = [i for i, col in enumerate(valid_columns) if col]
-            if not data_src.dummy_header and not partial_dummy_header:
-                default_csv_param['usecols'] = transform_duplicated_col_suffix_to_pandas_col(
-                    dic_valid_csv_cols,
-                    dic_org_csv_cols,
-                )
-                use_col_names = [col for col in valid_columns if col]
-                # remove file name in usecols after add suffix
-                if use_dummy_datetime:
-                    default_csv_param['usecols'] = default_csv_param['usecols'][:-1]
-                    if dummy_datetime_col in use_col_names:
-                        use_col_names.remove(dummy_datetime_col)
-
-                if proc_cfg.is_show_file_name:
-                    default_csv_param['usecols'] = default_csv_param.get('usecols')[:-1]
-                    use_col_names = use_col_names[:-1]
-            else:
-                # dummy header
-                default_csv_param['names'] = csv_cols
-                if use_dummy_datetime:
-                    default_csv_param['names'] = default_csv_param['names'][:-1]
-                if proc_cfg.is_show_file_name:
-                    default_csv_param['names'] = default_csv_param.get('names')[:-1]
-
-        # read csv file
-        default_csv_param['dtype'] = {
-            col: 'string'
-            for col, col_cfg in dic_use_cols.items()
-            if col in use_col_names
-            and col_cfg.data_type
-            in [
-                DataType.TEXT.name,
-                DataType.DATETIME.name,
-                DataType.DATE.name,
-                DataType.TIME.name,
-            ]
-        }
-
-        # add more dtype columns in usecols
-        if 'usecols' in default_csv_param:
-            for col_name in default_csv_param['usecols']:
-                if col_name not in default_csv_param['dtype']:
-                    default_csv_param['dtype'][col_name] = 'string'
-
-        # add more dtype columns in names
-        if 'names' in default_csv_param:
-            for col_name in default_csv_param['names']:
-                if col_name not in default_csv_param['dtype']:
-                    default_csv_param['dtype'][col_name] = 'string'
-
-        if is_v2_datasource:
-            datasource_type, is_abnormal_v2, is_en_cols = get_v2_datasource_type_from_file(transformed_file)
-            if datasource_type == DBType.V2_HISTORY:
-                df_one_file = get_df_v2_process_single_file(
-                    transformed_file,
-                    process_name=data_src.process_name,
-                    datasource_type=datasource_type,
-                    is_abnormal_v2=is_abnormal_v2,
-                )
-            elif datasource_type in [DBType.V2, DBType.V2_MULTI]:
-                df_one_file = get_vertical_df_v2_process_single_file(
-                    transformed_file,
-                    process_name=data_src.process_name,
-                    datasource_type=datasource_type,
-                    is_abnormal_v2=is_abnormal_v2,
-                    is_en_cols=is_en_cols,
-                )
-            else:
-                continue
-                # raise NotImplementedError
-
-            if df_one_file.empty:
-                continue
-
-            df_one_file, has_remaining_cols = prepare_to_import_v2_df(df_one_file, proc_cfg, datasource_type)
-
-            if has_remaining_cols:
-                dic_use_cols = get_config_sensor(proc_cfg)
-
-        else:
-            # skip_rows = 0 if (is_abnormal or len(head_skips)) else data_src.skip_head
-            df_one_file = csv_to_df(
-                transformed_file,
-                data_src,
-                head_skips,
-                data_first_row,
-                0,
-                transformed_file_delimiter,
-                default_csv_param=default_csv_param,
-                dic_use_cols=dic_use_cols,
-                col_names=use_col_names,
-                encoding=encoding,
-                is_partial_dummy_header=partial_dummy_header,
-            )
-            # validate column name
-            validate_columns(dic_use_cols, df_one_file.columns, use_dummy_datetime, dummy_datetime_col)
-
-        file_record_count = len(df_one_file)
-        if proc_cfg.is_import_file_name:
-            df_one_file = add_column_file_name(df_one_file, transformed_file, file_name_col=file_name_col)
-
-        # Save history even if the file is empty
-        dic_imported_row[idx] = (csv_file_name, file_record_count)
-
-        # no records
-        if not file_record_count:
-            # Proceed to read the next file without showing a toast message.
-            if csv_file_name in toast_skip:
-                continue
-
-            job_info.status = JobStatus.DONE
-            job_info.empty_files = [csv_file_name]
-            yield from yield_job_info(job_info, csv_file_name)
-            job_info.empty_files = []
-            continue
-
-        # add 3 columns machine, line, process for efa 1,2,4
-        if is_abnormal and not is_v2_datasource:
-            cols, vals = csv_data_with_headers(csv_file_name, data_src)
-            df_one_file[cols] = vals
-            dic_use_cols_for_abnormal = dic_use_cols.copy()
-            if use_dummy_datetime and dummy_datetime_col in dic_use_cols_for_abnormal:
-                dic_use_cols_for_abnormal.pop(dummy_datetime_col)
-            # remove unused columns
-            df_one_file = df_one_file[list(dic_use_cols_for_abnormal)]
-
-        if use_dummy_datetime and dummy_datetime_col not in df_one_file.columns:
-            df_one_file = gen_dummy_datetime(df_one_file, dummy_datetime_from, dummy_datetime_col=dummy_datetime_col)
-            dummy_datetime_from = get_next_datetime_value(df_one_file.shape[0], dummy_datetime_from)
-
-        # mark file
-        df_one_file[FILE_IDX_COL] = idx
-
-        # merge df
-        df = pd.concat([df, df_one_file], ignore_index=True)
-
-        # 10K records
-        if df.size < chunk_size:
-            continue
-
-        # calc percent
-        percent_per_commit = percent_per_file * len(dic_imported_row)
-
-        job_info.dic_imported_row = dic_imported_row
-        job_info.import_type = JobType.CSV_IMPORT.name
-        # do import
-        save_res, df_error, df_duplicate = import_df(
-            proc_cfg,
-            df,
-            dic_use_cols,
-            get_date_col,
-            job_info,
-            trans_data,
-            parent_cfg_process=cfg_parent_proc,
-        )
-        total_imported_row += save_res
-        if is_first_chunk:
-            if register_by_file_request_id:
-                data_register_data = {
-                    'RegisterByFileRequestID': register_by_file_request_id,
-                    'status': JobStatus.PROCESSING.name,
-                    'process_id': proc_id,
-                    'is_first_imported': True,
-                    'use_dummy_datetime': use_dummy_datetime,
-                }
-                EventQueue.put(
-                    EventBackgroundAnnounce(
-                        job_id=f'{AnnounceEvent.DATA_REGISTER.name}_{proc_id}',
-                        data=data_register_data,
-                        event=AnnounceEvent.DATA_REGISTER,
-                    ),
-                )
-            is_first_chunk = False
-
-        df_error_cnt = len(df_error)
-        if df_error_cnt:
-            if df_db_latest_records is None:
-                df_db_latest_records = get_latest_records(proc_cfg)
-            write_invalid_records_to_file(
-                df_error,
-                dic_imported_row,
-                dic_use_cols,
-                df_db_latest_records,
-                proc_cfg,
-                transformed_file_delimiter,
-                data_src.directory,
-            )
-            error_type = DATA_TYPE_ERROR_MSG
-
-        if df_duplicate is not None and len(df_duplicate):
-            error_type = DATA_TYPE_DUPLICATE_MSG
-            write_duplicate_records_to_file(df_duplicate, dic_imported_row, dic_use_cols, proc_cfg.name, job_id)
-
-        total_percent = set_csv_import_percent(job_info, total_percent, percent_per_commit)
-        for _idx, (_csv_file_name, _imported_row) in dic_imported_row.items():
-            # if _idx in `dic_imported_row` equal idx in `import_targets`, it means `_csv_file_name` item is the last
-            # item in `dic_imported_row` in last loop => ready to interrupt without remain item
-            is_safe_interrupt = _idx == idx
-            yield from yield_job_info(
-                job_info,
-                _csv_file_name,
-                _imported_row,
-                save_res,
-                df_error_cnt,
-                is_safe_interrupt=is_safe_interrupt,
-            )
-
-        # reset df (important!!!)
-        df = pd.DataFrame()
-        dic_imported_row = {}
+                total_imported_row += save_res
+                if is_first_chunk:
+                    if register_by_file_request_id:
+                        data_register_data = {
+                            'RegisterByFileRequestID': register_by_file_request_id,
+                            'status': JobStatus.PROCESSING.name,
+                            'process_id': proc_id,
+                            'is_first_imported': True,
+                            'use_dummy_datetime': use_dummy_datetime,
+                        }
+                        EventQueue.put(
+                            EventBackgroundAnnounce(
+                                job_id=f'{AnnounceEvent.DATA_REGISTER.name}_{proc_id}',
+                                data=data_register_data,
+                                event=AnnounceEvent.DATA_REGISTER,
+                            ),
+                        )
+                    is_first_chunk = False
+
+                df_error_cnt = len(df_error)
+                if df_error_cnt:
+                    if df_db_latest_records is None:
+                        df_db_latest_records = get_latest_records(proc_cfg)
+                    write_invalid_records_to_file(
+                        df_error,
+                        dic_imported_row,
+                        dic_use_cols,
+                        df_db_latest_records,
+                        proc_cfg,
+                        transformed_file_delimiter,
+                        data_src.directory,
+                    )
+                    error_type = DATA_TYPE_ERROR_MSG
+
+                if df_duplicate is not None and len(df_duplicate):
+                    error_type = DATA_TYPE_DUPLICATE_MSG
+                    write_duplicate_records_to_file(df_duplicate, dic_imported_row, dic_use_cols, proc_cfg.name, job_id)
+
+                total_percent = set_csv_import_percent(job_info, total_percent, percent_per_commit)
+                for _idx, (_csv_file_name, _imported_row) in dic_imported_row.items():
+                    # the rest of this file is not imported yet
+                    if _imported_row is None:
+                        continue
+
+                    # if _idx in `dic_imported_row` equal idx in `import_targets`, it means `_csv_file_name` item is the last
+                    # item in `dic_imported_row` in last loop => ready to interrupt without remain item
+                    is_safe_interrupt = _idx == idx
+                    yield from yield_job_info(
+                        job_info,
+                        _csv_file_name,
+                        _imported_row,
+                        save_res,
+                        df_error_cnt,
+                        is_safe_interrupt=is_safe_interrupt,
+                    )
+
+                # reset df (important!!!)
+                df = pd.DataFrame()
+                dic_imported_row = {}
 
     job_info.dic_imported_row = dic_imported_row
 
@@ -729,13 +772,21 @@ def get_file_metadata(file_name, dic_success_file: dict = None) -> tuple[any, an
 
 
 @log_execution_time()
-def filter_import_target_file(proc_id, all_files, dic_success_file: dict, dic_error_file: dict, etl_func=None):
+def filter_import_target_file(
+    proc_id,
+    all_files,
+    dic_success_file: dict,
+    dic_error_file: dict,
+    etl_func=None,
+    file_index: Optional[CsvFileIndex] = None,
+):
     """filter import target file base on last import job
 
     Arguments:
         all_files {[type]} -- [description]
         dic_success_file {dict} -- [description]
         dic_error_file {dict} -- [description]
+        file_index {CsvFileIndex} -- files which are known as imported are skipped without checking (default: None)
 
     Returns:
         [type] -- [description]
@@ -749,8 +800,13 @@ def filter_import_target_file(proc_id, all_files, dic_success_file: dict, dic_er
             pass
 
         if file_name in dic_success_file:
+            if file_index and file_index.is_imported(file_name, dic_success_file[file_name]):
+                continue
+
             modified_date, imported_datetime = get_file_metadata(file_name, dic_success_file)
             if modified_date <= imported_datetime:
+                if file_index:
+                    file_index.set_imported(file_name, dic_success_file[file_name])
                 continue
 
             # If a previously failed file is now marked as "modified",
@@ -878,6 +934,10 @@ def csv_to_df(
     if data_src.skip_tail and len(df):
         df = df.drop(df.tail(data_src.skip_tail).index)
 
+    return extract_use_cols(df, dic_use_cols)
+
+
+def extract_use_cols(df: DataFrame, dic_use_cols=None) -> DataFrame:
     if dic_use_cols:
         # extract columns of df same as data-source
         sub_cols = [col for col in dic_use_cols.keys() if col in df.columns]
@@ -885,21 +945,162 @@ def csv_to_df(
     return df
 
 
+def iter_csv_to_df_chunks(
+    transformed_file,
+    head_skips,
+    csv_delimiter,
+    default_csv_param,
+    dic_use_cols=None,
+    col_names=None,
+    encoding=None,
+    skip_rows=0,
+) -> Iterator[DataFrame]:
+    """Same rows as `csv_to_df` from `skip_rows`-th row, read by pandas in chunks.
+    Only for data sources which `can_read_csv_in_batches` (no dummy header, transpose, skip tail or n rows)
+    """
+    read_csv_param = {
+        **default_csv_param,
+        'skiprows': head_skips,
+        'sep': csv_delimiter,
+        'na_values': NA_VALUES,
+        'on_bad_lines': 'skip',
+        'skip_blank_lines': True,
+        'index_col': False,
+        'chunksize': CSV_FALLBACK_CHUNK_ROWS,
+    }
+    # same fallbacks as `csv_to_df`, rows which were already read are skipped when the file is read again
+    encoding_params = [
+        {'encoding': encoding},
+        {'encoding': 'unicode_escape'},
+        {'encoding': None, 'encoding_errors': 'replace'},
+    ]
+    for idx, encoding_param in enumerate(encoding_params):
+        try:
+            with pd.read_csv(transformed_file, **read_csv_param, **encoding_param) as reader:
+                skip = skip_rows
+                for df in reader:
+                    df = df.dropna(how='all')
+                    if skip:
+                        num_skip = min(skip, len(df))
+                        df = df.iloc[num_skip:]
+                        skip -= num_skip
+
+                    skip_rows += len(df)
+                    if col_names and len(col_names) == df.columns.size:
+                        df.columns = col_names
+
+                    df = df.rename(columns={col: normalize_str(col) for col in df.columns})
+                    yield extract_use_cols(df, dic_use_cols)
+
+            return
+        except UnicodeDecodeError:
+            if idx == len(encoding_params) - 1:
+                raise
+
+
+def can_read_csv_in_batches(data_src) -> bool:
+    """Whether files of data source can be read by `CsvBatchPrefetcher` the same way as `csv_to_df`"""
+    return (
+        not data_src.dummy_header
+        and not data_src.is_transpose
+        and not data_src.skip_tail
+        and get_limit_records(is_transpose=data_src.is_transpose, n_rows=data_src.n_rows) is None
+    )
+
+
+def iter_csv_to_dfs(
+    prefetcher: CsvBatchPrefetcher,
+    idx,
+    transformed_file,
+    data_src,
+    head_skips,
+    data_first_row,
+    csv_delimiter,
+    default_csv_param,
+    dic_use_cols=None,
+    col_names=None,
+    encoding=None,
+) -> Iterator[tuple[DataFrame, bool]]:
+    """Same rows as `csv_to_df`, in batches of bounded size
+    :return: dataframe of each batch, and whether it is the last batch of the file
+    """
+    use_cols = default_csv_param['usecols']
+    df_batch = None
+    read_row = 0
+    try:
+        batches = prefetcher.read(idx)
+        schema = next(batches)
+        if len(set(schema.names)) != len(schema.names) or not set(use_cols).issubset(schema.names):
+            # pandas renames duplicated columns
+            raise CsvBatchFallback('Column names are different from pandas')
+
+        # same order as file like pandas `usecols`
+        columns = [col for col in schema.names if col in use_cols]
+        for batch in batches:
+            if df_batch is not None:
+                yield df_batch, False
+                read_row += len(df_batch)
+
+            df = batch_to_df(batch, columns).dropna(how='all')
+            if col_names and len(col_names) == df.columns.size:
+                df.columns = col_names
+
+            df = df.rename(columns={col: normalize_str(col) for col in df.columns})
+            df_batch = extract_use_cols(df, dic_use_cols)
+
+        if df_batch is None:
+            df_batch = extract_use_cols(batch_to_df(schema.empty_table(), columns), dic_use_cols)
+    except CsvBatchFallback as e:
+        # the rest of the file is read in chunks, memory stays bounded
+        logger.info(f'Read {transformed_file} from row {read_row} by pandas: {e}')
+        df_batch = None
+        for df in iter_csv_to_df_chunks(
+            transformed_file,
+            head_skips,
+            csv_delimiter,
+            default_csv_param,
+            dic_use_cols=dic_use_cols,
+            col_names=col_names,
+            encoding=encoding,
+            skip_rows=read_row,
+        ):
+            if df_batch is not None:
+                yield df_batch, False
+
+            df_batch = df
+
+        if df_batch is None:
+            # no chunk without data rows
+            df = csv_to_df(
+                transformed_file,
+                data_src,
+                head_skips,
+                data_first_row,
+                0,
+                csv_delimiter,
+                default_csv_param=default_csv_param,
+                dic_use_cols=dic_use_cols,
+                col_names=col_names,
+                encoding=encoding,
+            )
+            df_batch = df.iloc[read_row:]
+
+    yield df_batch, True
+
+
 @log_execution_time()
 def get_import_target_files(proc_id, data_src, trans_data, db_instance):
     dic_success_file, dic_error_file = get_last_csv_import_info(trans_data, db_instance)
     valid_extensions = [CSVExtTypes.CSV.value, CSVExtTypes.TSV.value, CSVExtTypes.SSV.value, CSVExtTypes.ZIP.value]
     csv_files = []
+    file_index = None
     if data_src.is_file_path:
         if any(data_src.directory.lower().endswith(ext) for ext in valid_extensions):
             csv_files.append(data_src.directory)
     else:
-        csv_files = get_files(
-            data_src.directory,
-            depth_from=1,
-            depth_to=100,
-            extension=valid_extensions,
-        )
+        # only changed folders are listed again
+        file_index = CsvFileIndex.load(proc_id, data_src.directory, valid_extensions)
+        csv_files = file_index.scan()
 
     # filter target files
     has_trans_targets, no_trans_targets, toast_skip = filter_import_target_file(
@@ -908,7 +1109,11 @@ def get_import_target_files(proc_id, data_src, trans_data, db_instance):
         dic_success_file,
         dic_error_file,
         data_src.etl_func,
+        file_index=file_index,
     )
+    if file_index:
+        file_index.save()
+
     return has_trans_targets, no_trans_targets, toast_skip
 
 
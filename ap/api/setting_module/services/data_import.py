@@ -1315,6 +1315,26 @@ def save_proc_data_count_multiple_dfs(
     dfs_push_to_file: list[pd.DataFrame] | pd.DataFrame = None,
     dfs_pop_from_file: list[pd.DataFrame] | pd.DataFrame = None,
 ):
+    aggregated_df = gen_proc_data_count_multiple_dfs(
+        get_date_col=get_date_col,
+        dfs_push_to_db=dfs_push_to_db,
+        dfs_pop_from_db=dfs_pop_from_db,
+        dfs_push_to_file=dfs_push_to_file,
+        dfs_pop_from_file=dfs_pop_from_file,
+    )
+    save_proc_data_count_df(db_instance, proc_id=proc_id, count_df=aggregated_df)
+
+
+def gen_proc_data_count_multiple_dfs(
+    *,
+    get_date_col,
+    dfs_push_to_db: list[pd.DataFrame] | pd.DataFrame = None,
+    dfs_pop_from_db: list[pd.DataFrame] | pd.DataFrame = None,
+    dfs_push_to_file: list[pd.DataFrame] | pd.DataFrame = None,
+    dfs_pop_from_file: list[pd.DataFrame] | pd.DataFrame = None,
+) -> pd.DataFrame:
+    """Changes of data count per hour, it does not touch database so that it can be computed in worker threads"""
+
     def check_args(dfs):
         if dfs is None:
             return []
@@ -1351,12 +1371,19 @@ def save_proc_data_count_multiple_dfs(
         aggregated_df = pd.concat([aggregated_df, count_df])
 
     if aggregated_df.empty:
-        return
+        return aggregated_df
 
     agg_keys = {DataCountTable.count.name: 'sum', DataCountTable.count_file.name: 'sum'}
-    aggregated_df = aggregated_df.groupby(DataCountTable.datetime.name).agg(agg_keys).reset_index()
+    return aggregated_df.groupby(DataCountTable.datetime.name).agg(agg_keys).reset_index()
+
 
-    sql_vals = aggregated_df.to_records(index=False).tolist()
+def save_proc_data_count_df(db_instance, *, proc_id, count_df: pd.DataFrame):
+    """Save changes of data count generated by `gen_proc_data_count_multiple_dfs`"""
+    if count_df.empty:
+        return
+
+    # keep columns in order of data count table
+    sql_vals = count_df[list(DataCountTable.get_keys())].to_records(index=False).tolist()
     sql_params = get_insert_params(DataCountTable.get_keys())
     sql_insert = gen_bulk_insert_sql(DataCountTable.get_table_name(proc_id), *sql_params)
 
@@ -1385,6 +1412,10 @@ def save_import_history(proc_id, job_info):
     sql_params: list[list[Any]] = []
 
     for _, (target_file, imported_row) in job_info.dic_imported_row.items():
+        # csv file which is imported in several chunks, it is saved with its last chunk
+        if imported_row is None:
+            continue
+
         status = (
             job_info.status.name if isinstance(job_info.status, JobStatus) else job_info.status or JobStatus.DONE.name
         )
@@ -1,4 +1,3 @@
-import itertools
 import logging
 from collections.abc import Generator
 from datetime import datetime
@@ -17,7 +16,6 @@ from ap.api.setting_module.services.data_import import (
     get_insert_params,
     insert_data,
 )
-from ap.api.setting_module.services.equations import get_all_normal_columns_for_functions
 from ap.api.setting_module.services.polling_frequency import add_import_job, add_import_job_params
 from ap.api.trace_data.services.proc_link import add_restructure_indexes_job
 from ap.common.common_utils import generate_job_id
@@ -25,7 +23,7 @@ from ap.common.constants import CacheType, JobType
 from ap.common.multiprocess_sharing import EventExpireCache, EventQueue
 from ap.common.pydn.dblib.db_proxy import DbProxy, gen_data_source_of_universal_db
 from ap.common.scheduler import scheduler_app_context
-from ap.equations.utils import get_function_class_by_id
+from ap.equations.plan import FunctionColumnPlan
 from ap.setting_module.models import (
     CfgProcess,
     CfgProcessColumn,
@@ -60,52 +58,19 @@ def calculate_data_for_main_serial_function_column(
     def _get_column_name(cfg_col: CfgProcessColumn) -> str:
         return cfg_col.column_raw_name if is_use_column_raw_name else cfg_col.bridge_column_name
 
-    def _get_column_by_id(column_id: int) -> Optional[CfgProcessColumn]:
-        return next(filter(lambda x: x.id == column_id, cfg_process.columns), None)
-
-    def _add_missing_column(_df: pd.DataFrame, column_name: Optional[str]) -> pd.DataFrame:
-        if column_name and column_name not in _df.columns:
-            _df[column_name] = np.nan
-        return _df
-
     df_columns = df.columns.tolist()
 
-    # Get component columns that necessary for calculating value
-    relation_column_ids = get_all_normal_columns_for_functions([main_serial_cfg_process_column.id], cfg_process.columns)
-    relation_column_ids.append(main_serial_cfg_process_column.id)
-    relation_cfg_process_column_dict = {_id: _get_column_by_id(_id) for _id in relation_column_ids}
-    relation_cfg_process_columns: list[CfgProcessColumn] = list(
-        filter(lambda x: x.function_details, relation_cfg_process_column_dict.values()),
-    )
-    cfg_function_cols = itertools.chain.from_iterable(
-        cfg_col.function_details for cfg_col in relation_cfg_process_columns
+    # Only main::serial is written, other function columns are intermediate results of the plan
+    plan = FunctionColumnPlan.compile(
+        {cfg_col.id: cfg_col for cfg_col in cfg_process.columns},
+        [main_serial_cfg_process_column.id],
+        _get_column_name,
     )
-    sorted_cfg_function_cols = sorted(cfg_function_cols, key=lambda col: col.order)
-
-    # Calculate function data
-    for cfg_func_col in sorted_cfg_function_cols:  # type: CfgProcessFunctionColumn
-        equation_class = get_function_class_by_id(cfg_func_col.function_id)
-        equation = equation_class.from_kwargs(**cfg_func_col.as_dict())
-
-        # Get column_x and column_y
-        cfg_col_x: CfgProcessColumn = _get_column_by_id(cfg_func_col.var_x)
-        cfg_col_y: Optional[CfgProcessColumn] = _get_column_by_id(cfg_func_col.var_y) if cfg_func_col.var_y else None
+    missing_columns = [column for column in plan.input_cols if column not in df.columns]
+    if missing_columns:
+        df = df.assign(**{column: np.nan for column in missing_columns})
 
-        column_x, x_dtype = (_get_column_name(cfg_col_x), cfg_col_x.raw_data_type) if cfg_col_x else (None, None)  # type: str
-        column_y, y_dtype = (_get_column_name(cfg_col_y), cfg_col_y.raw_data_type) if cfg_col_y else (None, None)  # type: Optional[str]
-
-        df = _add_missing_column(df, column_x)
-        df = _add_missing_column(df, column_y)
-
-        cfg_col: CfgProcessColumn = relation_cfg_process_column_dict.get(cfg_func_col.process_column_id)
-        df = equation.evaluate(
-            df,
-            out_col=_get_column_name(cfg_col),
-            x_col=column_x,
-            y_col=column_y,
-            x_dtype=x_dtype,
-            y_dtype=y_dtype,
-        )
+    df = plan.evaluate(df)
 
     target_function_column = _get_column_name(main_serial_cfg_process_column)
     if target_function_column not in df_columns:
@@ -2,6 +2,7 @@ import logging
 import os
 import shutil
 
+from ap.api.setting_module.services.csv_file_index import CsvFileIndex
 from ap.common.constants import JobType
 from ap.common.logger import log_execution_time
 from ap.common.multiprocess_sharing import EventQueue, EventRemoveJobs
@@ -76,6 +77,8 @@ def delete_transaction_db_file(proc_id):
     try:
         file_name = gen_sqlite3_file_name(proc_id)
         delete_file(file_name)
+        # import status in file index belongs to deleted data
+        delete_file(CsvFileIndex.get_index_file(proc_id))
     except Exception:
         pass
 
@@ -5,6 +5,7 @@ import logging
 import os
 import re
 import time
+from collections import deque
 from contextlib import suppress
 from itertools import islice
 from typing import List, Optional
@@ -87,6 +88,7 @@ from ap.common.services import csv_header_wrapr as chw
 from ap.common.services.csv_content import (
     check_exception_case,
     get_delimiter_encoding,
+    get_top_rows,
     is_normal_csv,
     read_data,
 )
@@ -570,6 +572,27 @@ def save_master_vis_config(proc_id, cfg_jsons) -> CfgProcess | None:
     return None
 
 
+def get_column_index(header_names: list[str], column_name: str | None) -> int | None:
+    """Index of the last column named `column_name`, the same column which is shown for duplicated names"""
+    if column_name is None or column_name not in header_names:
+        return None
+
+    return len(header_names) - 1 - header_names[::-1].index(column_name)
+
+
+def drop_last_rows(rows, count: int):
+    """Yield all rows except the last `count` rows, holding only `count` rows in memory"""
+    if not count:
+        yield from rows
+        return
+
+    buffer = deque(maxlen=count)
+    for row in rows:
+        if len(buffer) == count:
+            yield buffer[0]
+        buffer.append(row)
+
+
 @log_execution_time()
 def get_csv_data_from_files(
     sorted_files,
@@ -580,7 +603,13 @@ def get_csv_data_from_files(
     csv_delimiter,
     max_records=5,
     is_file_checker=False,
+    sort_column: str | None = None,
+    ascending: bool = True,
 ):
+    """
+    Read header and first `max_records` rows of the first readable file.
+    If `sort_column` is given, the whole file is scanned and the first `max_records` rows in that order are kept.
+    """
     csv_file = sorted_files[0]
     skip_tail = 0
     encoding = None
@@ -619,7 +648,8 @@ def get_csv_data_from_files(
                         data = strip_special_symbol(data)
 
                     # get 5 rows
-                    data_details = list(islice(data, max_records))
+                    sort_index = get_column_index(header_names, sort_column)
+                    data_details = get_top_rows(data, max_records, sort_index, ascending)
                 finally:
                     if data:
                         data.close()
@@ -638,6 +668,8 @@ def get_csv_data_from_files(
             skip_head=skip_head,
             n_rows=n_rows,
             is_transpose=is_transpose,
+            sort_column=sort_column,
+            ascending=ascending,
         )
     else:
         # try to get file which has data to detect data types + get col names
@@ -666,10 +698,15 @@ def get_csv_data_from_files(
                     if i == 0:
                         data = strip_special_symbol(data)
 
-                    # get 5 rows
-                    get_limit = max_records + skip_tail if max_records else None
-                    data_details = list(islice(data, get_limit))
-                    data_details = data_details[: len(data_details) - skip_tail]
+                    sort_index = get_column_index(header_names, sort_column)
+                    if sort_index is None:
+                        # get 5 rows
+                        get_limit = max_records + skip_tail if max_records else None
+                        data_details = list(islice(data, get_limit))
+                        data_details = data_details[: len(data_details) - skip_tail]
+                    else:
+                        data = drop_last_rows(data, skip_tail)
+                        data_details = get_top_rows(data, max_records, sort_index, ascending)
                 finally:
                     if data:
                         data.close()
@@ -1438,6 +1475,8 @@ def retrieve_data_from_several_files(
     skip_head=None,
     n_rows: int | None = None,
     is_transpose: bool = False,
+    sort_column: str | None = None,
+    ascending: bool = True,
 ):
     header_names = []
     data_details = []
@@ -1463,7 +1502,8 @@ def retrieve_data_from_several_files(
             if i == 0:
                 data = strip_special_symbol(data)
 
-            data_details += list(islice(data, max_record))
+            sort_index = get_column_index(header_names, sort_column)
+            data_details += get_top_rows(data, max_record, sort_index, ascending)
         except UnicodeDecodeError:
             delimiter, encoding = get_delimiter_encoding(csv_file, preview=True)
             csv_delimiter = csv_delimiter or delimiter
@@ -1481,7 +1521,8 @@ def retrieve_data_from_several_files(
             if i == 0:
                 data = strip_special_symbol(data)
 
-            data_details += list(islice(data, max_record))
+            sort_index = get_column_index(header_names, sort_column)
+            data_details += get_top_rows(data, max_record, sort_index, ascending)
         finally:
             if data:
                 data.close()
@@ -123,6 +123,8 @@ def get_csv_data(csv_detail, sort_colum, sort_order, limit):
         with_encoding=True,
     )
     # TODO: Should we use preview_csv_data for this instead?
+    # only `limit` rows are kept while reading, sorted by raw values of sort column
+    asc = sort_order == 'ASC'
     (org_header, header_names, _, _, data_details, encoding, skip_tail, *_) = get_csv_data_from_files(
         [latest_file],
         skip_head=skip_head,
@@ -130,7 +132,9 @@ def get_csv_data(csv_detail, sort_colum, sort_order, limit):
         is_transpose=csv_detail.is_transpose,
         etl_func=csv_detail.etl_func,
         csv_delimiter=csv_delimiter,
-        max_records=None,
+        max_records=limit,
+        sort_column=sort_colum or None,
+        ascending=asc,
     )
 
     # display header names, add suffixes to duplicate header names (including dummy header case)
@@ -141,8 +145,8 @@ def get_csv_data(csv_detail, sort_colum, sort_order, limit):
         dict_column_name = dict(zip(org_header, header_names))
         sort_column_raw_name = dict_column_name[sort_colum]
         if sort_column_raw_name and sort_column_raw_name in df_data.columns:
-            asc = sort_order == 'ASC'
-            df_data = df_data.sort_values(by=[sort_column_raw_name], ascending=asc)
+            # header row can be added to data in dummy header case, sort again
+            df_data = df_data.sort_values(by=[sort_column_raw_name], ascending=asc, kind='stable')
 
     df_data = df_data.head(limit)
     cols = df_data.columns
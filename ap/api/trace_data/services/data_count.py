@@ -1,65 +1,59 @@
+import numpy as np
 import pandas as pd
 
-from ap.common.constants import DATE_FORMAT_SIMPLE, FREQ_FOR_RANGE, TERM_FORMAT, CacheType, DataCountType
+from ap.common.constants import FREQ_FOR_RANGE, TERM_FORMAT, CacheType, DataCountType
 from ap.common.logger import log_execution_time
 from ap.common.memoize import CustomCache
 from ap.common.pydn.dblib.db_proxy import DbProxy, gen_data_source_of_universal_db
-from ap.common.timezone_utils import from_utc_to_localtime
+from ap.common.timezone_utils import from_utc_to_localtime, from_utc_to_localtime_series
 from ap.trace_data.transaction_model import DataCountTable, TransactionData
 
 
-def gen_full_data_by_time(df, start_date, end_date, query_type):
-    data = {}
-    max_val = None
-    min_val = None
-    group_conditions = [
-        df[DataCountTable.datetime.name].dt.year,
-        df[DataCountTable.datetime.name].dt.month,
-    ]
+def get_term_parts(query_type) -> list[str]:
+    """Datetime parts which identify one cell of calendar"""
+    parts = ['year', 'month']
     if query_type != DataCountType.YEAR.value:
         # month and week
-        group_conditions.append(df[DataCountTable.datetime.name].dt.day)
+        parts.append('day')
     if query_type == DataCountType.WEEK.value:
         # week only
-        group_conditions.append(df[DataCountTable.datetime.name].dt.hour)
-    df_grouped = df.groupby(group_conditions)[[DataCountTable.count.name]].sum()
-    df_indexes = df_grouped.index.to_numpy().tolist()
-    date_range = pd.date_range(start_date, end_date, freq=FREQ_FOR_RANGE[query_type])
+        parts.append('hour')
+    return parts
+
 
-    term_format = TERM_FORMAT[query_type]
-    used_index = []
-    for term in date_range:
-        current_term = term.strftime(term_format)
-        current_index = (term.year, term.month)
-        if query_type != DataCountType.YEAR.value:
-            current_index += (term.day,)
-        if query_type == DataCountType.WEEK.value:
-            current_index += (term.hour,)
-        count_data = 0
-        # date_range range duplicated value
-        if current_index in used_index:
-            continue
-        used_index.append(current_index)
-        if current_index in df_indexes:
-            # set value if existing in list
-            count_data = df_grouped.loc[current_index][DataCountTable.count.name]
+def gen_full_data_by_time(df, start_date, end_date, query_type):
+    """Counts of every cell between start and end date, grouped by term (a row of calendar).
+    Cells without data are 0. Counts are summed by datetime parts and reindexed against the full range at once.
+    """
+    data = {}
+    parts = get_term_parts(query_type)
+    datetimes = df[DataCountTable.datetime.name].dt
+    df_grouped = df.groupby([getattr(datetimes, part).rename(part) for part in parts])[DataCountTable.count.name].sum()
+
+    date_range = pd.date_range(start_date, end_date, freq=FREQ_FOR_RANGE[query_type])
+    range_index = pd.MultiIndex.from_arrays([getattr(date_range, part) for part in parts], names=parts)
+    # date_range range duplicated value (when clock is turned back)
+    is_first = ~range_index.duplicated()
+    date_range = date_range[is_first]
+    range_index = range_index[is_first]
+    if not len(date_range):
+        return data, None, None
 
-        # set max min
-        if max_val is None or count_data > max_val:
-            max_val = count_data
-        if min_val is None or count_data < min_val:
-            min_val = count_data
+    counts = df_grouped.reindex(range_index, fill_value=0).to_numpy()
+    min_val = counts.min().item()
+    max_val = counts.max().item()
 
-        if current_term in data:
-            data[current_term][DataCountTable.count.name].append(count_data)
-        else:
-            data[current_term] = {DataCountTable.count.name: [count_data]}
+    # cells of the same term are next to each other
+    terms = date_range.strftime(TERM_FORMAT[query_type]).to_numpy()
+    term_starts = np.flatnonzero(np.r_[True, terms[1:] != terms[:-1]])
+    term_ends = np.r_[term_starts[1:], len(terms)]
+    count_list = counts.tolist()
+    for term_start, term_end in zip(term_starts.tolist(), term_ends.tolist()):
+        term_data = data.setdefault(terms[term_start], {DataCountTable.count.name: []})
+        term_data[DataCountTable.count.name].extend(count_list[term_start:term_end])
 
     if query_type == DataCountType.MONTH.value:
-        data_count = []
-        for k in data:
-            data_count += data[k][DataCountTable.count.name]
-        data[DataCountTable.count.name] = data_count
+        data[DataCountTable.count.name] = count_list
     return data, min_val, max_val
 
 
@@ -86,18 +80,9 @@ def get_data_count_by_time_range(proc_id, start_date, end_date, query_type, loca
             ],
         )
 
-        def local_datetime(t):
-            return from_utc_to_localtime(t, local_tz)
-
-        df[DataCountTable.datetime.name] = df[DataCountTable.datetime.name].apply(local_datetime)
-        # group data count by datetime and process id, to hours
-        df = df.groupby([DataCountTable.datetime.name], as_index=False).sum()
-        df[DataCountTable.datetime.name] = pd.to_datetime(
-            arg=df[DataCountTable.datetime.name],
-            format=DATE_FORMAT_SIMPLE,
-        )
+        df[DataCountTable.datetime.name] = from_utc_to_localtime_series(df[DataCountTable.datetime.name], local_tz)
         # convert to localtime to genen date_range and group data
-        start_date = local_datetime(start_date)
-        end_date = local_datetime(end_date)
+        start_date = from_utc_to_localtime(start_date, local_tz)
+        end_date = from_utc_to_localtime(end_date, local_tz)
         data, min_val, max_val = gen_full_data_by_time(df, start_date, end_date, query_type)
     return data, min_val, max_val
@@ -1,3 +1,10 @@
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+from collections.abc import Iterable
+
+import numpy as np
 import pandas as pd
 from pandas import DataFrame, Series
 
@@ -5,6 +12,11 @@ from ap.common.common_utils import gen_sql_label
 from ap.common.constants import DataType, FilterFunc
 from ap.trace_data.schemas import ConditionProc
 
+REGEX_META_CHARACTERS = frozenset('.^$*+?{}[]\\|()')
+
+# literal patterns longer than this are not merged into trie regex (recursion depth)
+MAX_TRIE_PATTERN_LENGTH = 256
+
 
 def filter_function_column(df: DataFrame, condition_proc: ConditionProc, end_proc):
     if df is None or not len(df):
@@ -29,65 +41,261 @@ def filter_function_column(df: DataFrame, condition_proc: ConditionProc, end_pro
         if data_type == DataType.INTEGER.name:
             series = series.astype('Int64')
 
-        series_str = series.astype(str)
-
-        # OR (same column)
-        dfs = []
-        for filter_detail in filter_details:
-            for cfg_filter_detail in filter_detail.cfg_filter_details:
-                val = cfg_filter_detail.filter_condition
-                if val is None:
-                    continue
-
-                if cfg_filter_detail.filter_function in [None, FilterFunc.MATCHES.name]:
-                    if data_type == DataType.INTEGER.name:
-                        # todo: handle this case
-                        # input: 1.2, column data-type: INT
-                        # -> int(1.2) = 1
-                        # df[df[col] == 1] NG
-                        # # df[df[col] == 1.2] OK
-                        # todo: handle exception
-                        val = int(val)
-                    elif data_type == DataType.REAL.name:
-                        val = float(val)
-                    else:
-                        val = str(val)
-
-                    idxs = series == val
-                elif cfg_filter_detail.filter_function == FilterFunc.STARTSWITH.name:
-                    idxs = filter_startswith(series_str, val)
-                elif cfg_filter_detail.filter_function == FilterFunc.ENDSWITH.name:
-                    idxs = filter_endswith(series_str, val)
-                elif cfg_filter_detail.filter_function == FilterFunc.CONTAINS.name:
-                    idxs = filter_contains(series_str, val)
-                elif cfg_filter_detail.filter_function == FilterFunc.REGEX.name:
-                    idxs = filter_regex(series_str, val)
-                elif cfg_filter_detail.filter_function == FilterFunc.SUBSTRING.name:
-                    idxs = filter_substring(series_str, cfg_filter_detail.filter_from_pos, val)
-                elif cfg_filter_detail.filter_function == FilterFunc.AND_SEARCH.name:
-                    idxs = filter_and(series_str, val)
-                elif cfg_filter_detail.filter_function == FilterFunc.OR_SEARCH.name:
-                    idxs = filter_or(series_str, val)
-                else:
-                    continue
-
-                # only search for remain data
-                df_res = series[idxs]
-                if len(df_res):
-                    dfs.append(series[idxs])
+        # conditions are evaluated once per distinct value, function columns are mostly categories
+        codes, positions = factorize_by_value(series)
+        if codes is None:
+            matched = match_function_conditions(series, data_type, filter_details)
+        else:
+            matched = match_function_conditions(series.iloc[positions], data_type, filter_details)[codes]
 
-                series = series[~idxs]
-                series_str = series_str[~idxs]
         # union or condition
-        if dfs:
-            df_cols = pd.concat(dfs)
-            df = df[df.index.isin(df_cols.index)]
+        if matched.any():
+            df = df[matched] if df.index.is_unique else df[df.index.isin(df.index[matched])]
         else:
             df = pd.DataFrame(columns=df.columns)
 
     return df
 
 
+def factorize_by_value(series: Series) -> tuple[np.ndarray | None, np.ndarray | None]:
+    """
+    Group rows by value
+    Rows of a group must have the same string representation. Float values are grouped by their bits
+    (0.0 and -0.0, NaN and NA are equal but printed differently), object columns are only grouped if all
+    values are strings (1 and 1.0 are equal).
+    :return: group code of each row and position of first row of each group, None if dtype is not supported
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        keys = series.cat.codes.to_numpy()
+    elif pd.api.types.is_float_dtype(dtype):
+        keys, _ = pd.factorize(series.to_numpy(dtype=np.float64, na_value=np.nan).view(np.int64))
+        keys[series.isna().to_numpy()] = -1
+    elif (
+        pd.api.types.is_integer_dtype(dtype)
+        or pd.api.types.is_bool_dtype(dtype)
+        or isinstance(dtype, pd.StringDtype)
+        or (pd.api.types.is_object_dtype(dtype) and pd.api.types.infer_dtype(series, skipna=False) == 'string')
+    ):
+        keys, _ = pd.factorize(series, use_na_sentinel=False)
+    else:
+        return None, None
+
+    codes, _ = pd.factorize(keys)
+    _, positions = np.unique(codes, return_index=True)
+    return codes, positions
+
+
+def match_function_conditions(series: Series, data_type: str, filter_details) -> np.ndarray:
+    """
+    Rows matching any filter condition of a column
+    :param series: column data
+    :param data_type: data type of column
+    :param filter_details: filter details of column
+    :return: boolean mask of rows
+    """
+    series = series.reset_index(drop=True)
+    series_str = series.astype(str)
+    matched = np.zeros(len(series), dtype=bool)
+
+    # OR (same column), conditions of the same function are matched at once
+    dic_conditions = defaultdict(list)
+    for filter_detail in filter_details:
+        for cfg_filter_detail in filter_detail.cfg_filter_details:
+            val = cfg_filter_detail.filter_condition
+            if val is None:
+                continue
+
+            filter_function = cfg_filter_detail.filter_function
+            from_pos = None
+            if filter_function in [None, FilterFunc.MATCHES.name]:
+                filter_function = FilterFunc.MATCHES.name
+                if data_type == DataType.INTEGER.name:
+                    # todo: handle this case
+                    # input: 1.2, column data-type: INT
+                    # -> int(1.2) = 1
+                    # df[df[col] == 1] NG
+                    # # df[df[col] == 1.2] OK
+                    # todo: handle exception
+                    val = int(val)
+                elif data_type == DataType.REAL.name:
+                    val = float(val)
+                else:
+                    val = str(val)
+            elif filter_function == FilterFunc.SUBSTRING.name:
+                from_pos = cfg_filter_detail.filter_from_pos
+            elif filter_function not in [*FILTER_ANY_FUNCTIONS, FilterFunc.AND_SEARCH.name]:
+                continue
+
+            dic_conditions[(filter_function, from_pos)].append(val)
+
+    for (filter_function, from_pos), vals in dic_conditions.items():
+        if filter_function == FilterFunc.MATCHES.name:
+            # `series == nan` is always False, but `isin` matches NaN rows
+            idxs = series.isin([val for val in vals if not pd.isna(val)])
+            if pd.api.types.is_extension_array_dtype(series.dtype):
+                # comparing with NA is NA, the same as `series == val`
+                idxs = idxs.mask(series.isna())
+        elif filter_function == FilterFunc.AND_SEARCH.name:
+            # every AND search condition is a conjunction, they can not be merged
+            idxs = pd.Series(False, index=series_str.index)
+            for val in vals:
+                idxs |= filter_and(series_str, val)
+        else:
+            idxs = FILTER_ANY_FUNCTIONS[filter_function](series_str, vals, from_pos)
+
+        # only search for remain data
+        matched[series.index[idxs.to_numpy(dtype=bool, na_value=False)]] = True
+        series = series[~idxs]
+        series_str = series_str[~idxs]
+
+    return matched
+
+
+def is_literal_pattern(pattern: str) -> bool:
+    return not REGEX_META_CHARACTERS.intersection(pattern)
+
+
+def gen_trie_regex(words: Iterable[str]) -> str:
+    """
+    Regex alternation of literal words merged by common prefix, e.g: [abc, abd, b] -> (?:ab(?:c|d)|b).
+    Regex engine tries each alternative at each position, a trie only tries alternatives of the next character.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        # empty key marks end of word, characters are never empty
+        node[''] = {}
+
+    def to_regex(node: dict) -> str:
+        branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+
+        is_end = '' in node
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+
+        regex = f'(?:{"|".join(branches)})'
+        return f'{regex}?' if is_end else regex
+
+    return to_regex(trie)
+
+
+class PatternSet:
+    """
+    Match a string series with many patterns in one scan per column instead of one scan per pattern.
+    Literal patterns (serials pasted by users do not have regex meta characters) are matched by hash set
+    (full match), by one hash set per pattern length (prefix, suffix) or by one trie regex (search).
+    Other regex patterns are matched one by one.
+    Results are the same as OR of pandas string methods of each pattern.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        patterns = list(dict.fromkeys(patterns))
+        self.literals = [pattern for pattern in patterns if is_literal_pattern(pattern)]
+        self.regexes = [pattern for pattern in patterns if not is_literal_pattern(pattern)]
+
+    @staticmethod
+    def to_result(series: Series, matched: np.ndarray) -> Series:
+        # pandas string methods return nullable boolean for string dtype
+        if isinstance(series.dtype, pd.StringDtype):
+            return pd.Series(pd.arrays.BooleanArray(matched, series.isna().to_numpy()), index=series.index)
+        return pd.Series(matched, index=series.index)
+
+    @staticmethod
+    def any_of(series: Series, pattern_func, patterns: list[str], matched: np.ndarray) -> np.ndarray:
+        for pattern in patterns:
+            matched |= pattern_func(series, pattern).to_numpy(dtype=bool, na_value=False)
+        return matched
+
+    @staticmethod
+    def isin_by_length(series: Series, words: list[str], from_end: bool = False) -> np.ndarray:
+        dic_words = defaultdict(set)
+        for word in words:
+            dic_words[len(word)].add(word)
+
+        matched = np.zeros(len(series), dtype=bool)
+        for length, same_length_words in dic_words.items():
+            if not length:
+                parts = series.str.slice(0, 0)
+            elif from_end:
+                parts = series.str.slice(-length)
+            else:
+                parts = series.str.slice(0, length)
+            matched |= parts.isin(same_length_words).to_numpy(dtype=bool, na_value=False)
+        return matched
+
+    def fullmatch(self, series: Series) -> Series:
+        if not self.literals and not self.regexes:
+            # empty alternation only matches empty string
+            return self.to_result(series, (series == '').to_numpy(dtype=bool, na_value=False))
+
+        matched = series.isin(self.literals).to_numpy(dtype=bool, na_value=False)
+        if self.regexes:
+            matched |= series.str.fullmatch('|'.join(self.regexes)).to_numpy(dtype=bool, na_value=False)
+        return self.to_result(series, matched)
+
+    def match(self, series: Series) -> Series:
+        matched = self.isin_by_length(series, self.literals)
+        matched = self.any_of(series, lambda _series, pattern: _series.str.match(pattern), self.regexes, matched)
+        return self.to_result(series, matched)
+
+    def contains(self, series: Series) -> Series:
+        matched = np.zeros(len(series), dtype=bool)
+        literals = [pattern for pattern in self.literals if len(pattern) <= MAX_TRIE_PATTERN_LENGTH]
+        if literals:
+            regex = gen_trie_regex(literals)
+            matched |= series.str.contains(regex).to_numpy(dtype=bool, na_value=False)
+
+        patterns = self.regexes + [pattern for pattern in self.literals if len(pattern) > MAX_TRIE_PATTERN_LENGTH]
+        matched = self.any_of(series, lambda _series, pattern: _series.str.contains(pattern), patterns, matched)
+        return self.to_result(series, matched)
+
+    def startswith(self, series: Series) -> Series:
+        # python startswith is not regex, all patterns are literals
+        return self.to_result(series, self.isin_by_length(series, self.literals + self.regexes))
+
+    def endswith(self, series: Series) -> Series:
+        return self.to_result(series, self.isin_by_length(series, self.literals + self.regexes, from_end=True))
+
+
+def filter_startswith_any(df_col: Series, conditions: list[str], from_position=None):
+    return PatternSet(conditions).startswith(df_col)
+
+
+def filter_endswith_any(df_col: Series, conditions: list[str], from_position=None):
+    return PatternSet(conditions).endswith(df_col)
+
+
+def filter_contains_any(df_col: Series, conditions: list[str], from_position=None):
+    return PatternSet(conditions).contains(df_col)
+
+
+def filter_regex_any(df_col: Series, conditions: list[str], from_position=None):
+    return PatternSet(conditions).match(df_col)
+
+
+def filter_substring_any(df_col: Series, conditions: list[str], from_position=None):
+    return PatternSet(conditions).startswith(df_col.str.slice(from_position - 1))
+
+
+def filter_or_any(df_col: Series, conditions: list[str], from_position=None):
+    return PatternSet(word for condition_str in conditions for word in condition_str.split()).fullmatch(df_col)
+
+
+FILTER_ANY_FUNCTIONS = {
+    FilterFunc.STARTSWITH.name: filter_startswith_any,
+    FilterFunc.ENDSWITH.name: filter_endswith_any,
+    FilterFunc.CONTAINS.name: filter_contains_any,
+    FilterFunc.REGEX.name: filter_regex_any,
+    FilterFunc.SUBSTRING.name: filter_substring_any,
+    FilterFunc.OR_SEARCH.name: filter_or_any,
+}
+
+
 def filter_startswith(df_col: Series, condition_str):
     idxs = df_col.str.startswith(condition_str)
     # return df_col[idxs]
@@ -140,14 +348,12 @@ def filter_and(df_col: Series, condition_str):
 
 
 def filter_or(df_col: Series, condition_str):
-    conditions = list(set(condition_str.split()))
-    idxs = df_col.str.fullmatch('|'.join(conditions))
+    idxs = PatternSet(condition_str.split()).fullmatch(df_col)
     return idxs
 
 
 def filter_or_values(df_col: Series, condition_values):
-    conditions = list(set(condition_values))
-    idxs = df_col.str.fullmatch('|'.join(conditions))
+    idxs = PatternSet(condition_values).fullmatch(df_col)
     return idxs
 
 
@@ -626,6 +626,8 @@ class FlaskGKey(Enum):
     DEBUG_SHOW_GRAPH = auto()
     MEMOIZE = auto()
     THREAD_ID = auto()
+    REQUEST_DEADLINE = auto()
+    REQUEST_PROFILE = auto()
 
 
 class DebugKey(Enum):
@@ -873,6 +875,12 @@ ErrorMsgFromDB = {
 AUTO_BACKUP = 'auto-backup-universal'
 ANALYSIS_INTERFACE_ENV = 'ANALYSIS_INTERFACE_ENV'
 APP_TYPE_ENV = 'APP_TYPE_ENV'
+# set to 1 to collect performance profile of every request
+REQUEST_PROFILE_ENV = 'AP_REQUEST_PROFILE'
+# send this header (value 1) to collect performance profile of one request
+REQUEST_PROFILE_HEADER = 'X-AP-Profile'
+# profile id of a profiled request is returned in this header
+REQUEST_PROFILE_ID_HEADER = 'X-AP-Profile-Id'
 
 
 class AppEnv(Enum):
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-import contextlib
 import logging
+import threading
+from enum import auto
 from multiprocessing.managers import DictProxy
+from typing import Any, Iterable, Optional
 
-from ap.common.constants import JobType
+from pydantic import BaseModel, Field
+
+from ap.common.constants import BaseEnum, JobType
 from ap.common.jobs.jobs import RunningJob, RunningJobStatus
 
 logger = logging.getLogger(__name__)
@@ -16,102 +20,206 @@ PRIORITY_JOBS = [
     JobType.FACTORY_PAST_IMPORT.name,
 ]
 
-# check parallel running
-# ex: (JobType.CSV_IMPORT, JobType.GEN_GLOBAL): False
-#       csv import and gen global can not run in the same time
-#       False: Don't need to check key between 2 job (key: job parameter).
-#       True: Need to check key between 2 job , if key is not the same , they can run parallel
-CONFLICT_PAIR = {
-    (JobType.GEN_GLOBAL.name, JobType.GEN_GLOBAL.name),
-    (JobType.GEN_GLOBAL.name, JobType.RESTRUCTURE_INDEXES.name),
-    # (JobType.GEN_GLOBAL.name, JobType.CSV_IMPORT.name),
-    # (JobType.GEN_GLOBAL.name, JobType.FACTORY_IMPORT.name),
-    # (JobType.GEN_GLOBAL.name, JobType.FACTORY_PAST_IMPORT.name),
-    # (JobType.RESTRUCTURE_INDEXES.name, JobType.CSV_IMPORT.name),
-    # (JobType.RESTRUCTURE_INDEXES.name, JobType.FACTORY_IMPORT.name),
-    # (JobType.RESTRUCTURE_INDEXES.name, JobType.FACTORY_PAST_IMPORT.name),
-}
-
-CONFLICT_PAIR_JOBS_WITH_IDS = {
-    (JobType.UPDATE_TRANSACTION_TABLE.name, JobType.IMPORT_DATA.name),
-    (JobType.UPDATE_TRANSACTION_TABLE.name, JobType.CSV_IMPORT.name),
-    (JobType.UPDATE_TRANSACTION_TABLE.name, JobType.FACTORY_IMPORT.name),
-    (JobType.UPDATE_TRANSACTION_TABLE.name, JobType.FACTORY_PAST_IMPORT.name),
-    (JobType.UPDATE_TRANSACTION_TABLE.name, JobType.RESTRUCTURE_INDEXES.name),
-    (JobType.UPDATE_TRANSACTION_TABLE.name, JobType.USER_BACKUP_DATABASE.name),
-    (JobType.UPDATE_TRANSACTION_TABLE.name, JobType.USER_RESTORE_DATABASE.name),
-    (JobType.UPDATE_TRANSACTION_TABLE.name, JobType.UPDATE_TRANSACTION_TABLE.name),
-}
 
-# jobs with `_id` suffixes
-EXCLUSIVE_JOBS_WITH_IDS = {
-    JobType.USER_BACKUP_DATABASE.name,
-    JobType.USER_RESTORE_DATABASE.name,
+class LockMode(BaseEnum):
+    # can run together with other jobs sharing the resource (read)
+    SHARED = auto()
+    # cannot run together with any other job locking the resource (write)
+    EXCLUSIVE = auto()
+
+
+class JobResource(BaseEnum):
+    # transaction data of a process in universal db, locked per process id
+    PROCESS_DATA = auto()
+    # global ids and proc link data of all processes
+    PROC_LINK = auto()
+    # whole databases, shared by jobs using their tables and exclusive for jobs replacing the database file
+    UNIVERSAL_DB = auto()
+    APP_DB = auto()
+
+
+PER_PROCESS_RESOURCES = {JobResource.PROCESS_DATA}
+
+_WRITE_PROCESS_DATA = ((JobResource.UNIVERSAL_DB, LockMode.SHARED), (JobResource.PROCESS_DATA, LockMode.EXCLUSIVE))
+_READ_PROCESS_DATA = ((JobResource.UNIVERSAL_DB, LockMode.SHARED), (JobResource.PROCESS_DATA, LockMode.SHARED))
+_USE_APP_DB = ((JobResource.APP_DB, LockMode.SHARED),)
+
+# resources locked by each job type while running (job management records in app db are not counted)
+JOB_RESOURCE_LOCKS: dict[str, tuple[tuple[JobResource, LockMode], ...]] = {
+    JobType.CSV_IMPORT.name: _WRITE_PROCESS_DATA,
+    JobType.FACTORY_IMPORT.name: _WRITE_PROCESS_DATA,
+    JobType.FACTORY_PAST_IMPORT.name: _WRITE_PROCESS_DATA,
+    JobType.IMPORT_DATA.name: _WRITE_PROCESS_DATA,
+    JobType.UPDATE_TRANSACTION_TABLE.name: _WRITE_PROCESS_DATA,
+    # backup moves data from database to files
+    JobType.USER_BACKUP_DATABASE.name: _WRITE_PROCESS_DATA,
+    JobType.USER_RESTORE_DATABASE.name: _WRITE_PROCESS_DATA,
+    JobType.RESTRUCTURE_INDEXES.name: (*_WRITE_PROCESS_DATA, (JobResource.PROC_LINK, LockMode.SHARED)),
+    JobType.GEN_GLOBAL.name: ((JobResource.UNIVERSAL_DB, LockMode.SHARED), (JobResource.PROC_LINK, LockMode.EXCLUSIVE)),
+    # counts linked data and saves the counts to app db
+    JobType.PROC_LINK_COUNT.name: (
+        (JobResource.UNIVERSAL_DB, LockMode.SHARED),
+        (JobResource.PROC_LINK, LockMode.SHARED),
+        (JobResource.APP_DB, LockMode.SHARED),
+    ),
+    # copies app db file to backup folder
+    JobType.BACKUP_DATABASE.name: _USE_APP_DB,
+    # deletes expired request rows of app db
+    JobType.CLEAN_EXPIRED_REQUEST.name: _USE_APP_DB,
+    # caches read data of their processes (all processes if there is no process id)
+    JobType.COMPUTE_PROCESS_CACHE.name: _READ_PROCESS_DATA,
+    JobType.PERIODICALLY_COMPUTE_PROCESS_CACHE.name: _READ_PROCESS_DATA,
+    JobType.COMPUTE_ALL_PROCESS_IDS_CACHE.name: _USE_APP_DB,
+    JobType.PERIODICALLY_COMPUTE_ALL_PROCESSES_CACHE.name: _USE_APP_DB,
+    JobType.COMPUTE_ALL_TRACES_CACHE.name: _USE_APP_DB,
+    JobType.PERIODICALLY_COMPUTE_ALL_TRACES_CACHE.name: _USE_APP_DB,
+    # pulled data is saved to files, import jobs are added for writing it
+    JobType.PULL_DATA.name: _USE_APP_DB,
+    JobType.IDLE_MONITORING.name: (),
+    JobType.PROCESS_COMMUNICATE.name: (),
+    JobType.SHUTDOWN_APP.name: (),
+    JobType.ZIP_LOG.name: (),
+    JobType.CLEAN_ZIP.name: (),
 }
 
+# job types which are not declared above are considered writing data of their process (if any)
+DEFAULT_JOB_RESOURCE_LOCKS = _WRITE_PROCESS_DATA
 
-def is_job_existed_in_exclusive_jobs_with_ids(job: str, running_job_name: str):
-    def extract_id_from_job(job_name: str) -> int | None:
-        for exclusive_job_with_id in EXCLUSIVE_JOBS_WITH_IDS:
-            if job_name.startswith(exclusive_job_with_id):
-                id_from_job = job_name[len(exclusive_job_with_id) + 1 :]
-                with contextlib.suppress(ValueError):
-                    return int(id_from_job)
-        return None
+ResourceKey = tuple[JobResource, Optional[int]]
 
-    job_id = extract_id_from_job(job)
-    running_job_id = extract_id_from_job(running_job_name)
-    return job_id is not None and running_job_id is not None and job_id == running_job_id
 
+def get_resource_name(key: ResourceKey) -> str:
+    resource, proc_id = key
+    return resource.name if proc_id is None else f'{resource.name}_{proc_id}'
 
-def is_conflict_jobs_with_ids(job_id: str, running_job_id: str):
-    def _extract_process_id_from_job_id(_job_name: str) -> str | None:
-        for job_with_id in CONFLICT_PAIR_JOBS_WITH_IDS:
-            if _job_name.startswith(job_with_id):
-                return _job_name[len(job_with_id) + 1 :]
-        return None
 
-    process_id = _extract_process_id_from_job_id(job_id)
-    running_process_id = _extract_process_id_from_job_id(running_job_id)
-
-    if process_id is None or running_process_id is None or process_id != running_process_id:
-        return False
-
-    job_name_without_id = job_id.replace(f'_{process_id}', '')
-    running_job_name_without_id = running_job_id.replace(f'_{running_process_id}', '')
+def get_job_resource_locks(job_name: str, proc_id: Optional[int]) -> dict[ResourceKey, LockMode]:
+    """
+    Resources locked by a job
+    :param job_name: job type name
+    :param proc_id: process id of job, per-process resources are not locked if it is None
+    :return: dict of resource key: lock mode
+    """
+    resource_locks = {}
+    for resource, mode in JOB_RESOURCE_LOCKS.get(job_name, DEFAULT_JOB_RESOURCE_LOCKS):
+        if resource not in PER_PROCESS_RESOURCES:
+            resource_locks[(resource, None)] = mode
+        elif proc_id is not None:
+            resource_locks[(resource, proc_id)] = mode
 
-    return (job_name_without_id, running_job_name_without_id) in CONFLICT_PAIR or (
-        running_job_name_without_id,
-        job_name_without_id,
-    ) in CONFLICT_PAIR
+    return resource_locks
 
 
-def is_conflict_with_other_jobs(job_id, job_name, proc_id, running_jobs: DictProxy[str, RunningJob]) -> bool:
+def is_conflict_with_jobs(job_id, job_name, proc_id, jobs: Iterable[RunningJob]) -> bool:
     """
-    Check if this job is conflicting with other running jobs
+    Check if this job needs a resource locked by other jobs, regardless of their status
     :return bool: True if conflicting otherwise False
     """
-    logger.info(f'{job_id}: check conflict with other running jobs')
+    resource_locks = get_job_resource_locks(job_name, proc_id)
+    for job in jobs:
+        for key, mode in get_job_resource_locks(job.name, job.proc_id).items():
+            if key in resource_locks and LockMode.EXCLUSIVE in (mode, resource_locks[key]):
+                logger.info(f'{job_id}: {get_resource_name(key)} is going to be locked by {job.id}')
+                return True
 
-    for running_job in running_jobs.values():
-        # Do not check conflict with executed jobs
-        if running_job.status is RunningJobStatus.EXECUTED:
-            continue
+    return False
 
-        if is_job_existed_in_exclusive_jobs_with_ids(job_name, running_job.name):
-            logger.info(f'{job_id}: existed in exclusive jobs with {running_job.name}')
-            return True
 
-        if (
-            (job_name, running_job.name) in CONFLICT_PAIR
-            or (running_job.name, job_name) in CONFLICT_PAIR
-            or is_conflict_jobs_with_ids(job_id, running_job.id)
-        ):
-            logger.info(f'{job_id}: cannot run in parallel with {running_job.id}')
-            return True
+class ResourceLock(BaseModel):
+    exclusive_holder: Optional[str] = None
+    shared_holders: set[str] = Field(default_factory=set)
+
+    # statistics
+    acquired: int = 0
+    contended: int = 0
+    max_shared_holders: int = 0
+
+    def get_blockers(self, job_id: str, mode: LockMode) -> list[str]:
+        """Jobs holding this resource that prevent job from locking it"""
+        blockers = [self.exclusive_holder] if self.exclusive_holder not in (None, job_id) else []
+        if mode is LockMode.EXCLUSIVE:
+            blockers.extend(holder for holder in self.shared_holders if holder != job_id)
+        return blockers
+
+    def acquire(self, job_id: str, mode: LockMode):
+        self.acquired += 1
+        if mode is LockMode.EXCLUSIVE:
+            self.exclusive_holder = job_id
+        else:
+            self.shared_holders.add(job_id)
+            self.max_shared_holders = max(self.max_shared_holders, len(self.shared_holders))
+
+    def release(self, job_id: str):
+        if self.exclusive_holder == job_id:
+            self.exclusive_holder = None
+        self.shared_holders.discard(job_id)
+
+
+class ResourceLocks:
+    """Shared / exclusive locks on resources, held by running jobs.
+    A job is submitted only when it can lock all resources of its type (see `JOB_RESOURCE_LOCKS`),
+    and releases them when it finishes.
+    Locks only live in main process, where scheduler submits jobs, access them under `RunningJobs.lock()`.
+    """
 
-        if proc_id is not None and proc_id == running_job.proc_id:
-            logger.info(f'{job_id}: cannot run multiple jobs with the same {proc_id}')
+    _locks: dict[ResourceKey, ResourceLock] = {}
+
+    # resources locked by each job
+    _job_resources: dict[str, list[ResourceKey]] = {}
+
+    _lock: threading.Lock = threading.Lock()
+
+    @classmethod
+    def try_acquire(cls, job_id, job_name, proc_id, running_jobs: DictProxy[str, RunningJob]) -> bool:
+        """
+        Lock all resources of this job, or none of them if some is locked by other running jobs
+        :return bool: True if locked otherwise False
+        """
+        logger.info(f'{job_id}: check conflict with other running jobs')
+
+        resource_locks = get_job_resource_locks(job_name, proc_id)
+        with cls._lock:
+            for key, mode in resource_locks.items():
+                resource_lock = cls._locks.setdefault(key, ResourceLock())
+                blockers = [
+                    blocker
+                    for blocker in resource_lock.get_blockers(job_id, mode)
+                    if cls._is_holding(blocker, running_jobs)
+                ]
+                if blockers:
+                    resource_lock.contended += 1
+                    logger.info(f'{job_id}: {get_resource_name(key)} is locked by {blockers[0]}')
+                    return False
+
+            for key, mode in resource_locks.items():
+                cls._locks[key].acquire(job_id, mode)
+            cls._job_resources[job_id] = list(resource_locks)
+
+        return True
+
+    @classmethod
+    def release(cls, job_id: str):
+        with cls._lock:
+            cls._release(job_id)
+
+    @classmethod
+    def get_stats(cls) -> dict[str, dict[str, Any]]:
+        """Holders and contention of each resource"""
+        with cls._lock:
+            return {get_resource_name(key): lock.model_dump(mode='json') for key, lock in cls._locks.items()}
+
+    @classmethod
+    def _release(cls, job_id: str):
+        for key in cls._job_resources.pop(job_id, []):
+            cls._locks[key].release(job_id)
+
+    @classmethod
+    def _is_holding(cls, job_id: str, running_jobs: DictProxy[str, RunningJob]) -> bool:
+        """Release locks of a job which is not running anymore (e.g. its finishing event was missed)"""
+        running_job = running_jobs.get(job_id)
+        if running_job is not None and running_job.status is RunningJobStatus.EXECUTING:
             return True
 
-    return False
+        logger.info(f'{job_id}: release locks of job which is not running')
+        cls._release(job_id)
+        return False
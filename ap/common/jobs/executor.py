@@ -1,4 +1,5 @@
 import logging
+from datetime import datetime
 from typing import Any, Callable
 
 import sqlalchemy
@@ -6,21 +7,24 @@ from apscheduler.events import JobExecutionEvent
 from apscheduler.executors.base import BaseExecutor
 from apscheduler.executors.pool import ProcessPoolExecutor, ThreadPoolExecutor
 from apscheduler.job import Job
+from pytz import utc
 
 from ap.common.constants import DB_LOCKED_MSG
-from ap.common.jobs.conflict import is_conflict_with_other_jobs
+from ap.common.jobs.conflict import ResourceLocks, is_conflict_with_jobs
 from ap.common.jobs.jobs import JobKwargs, RunningJob, RunningJobs, RunningJobStatus
 from ap.common.jobs.trigger import always_trigger_job, unwrap_always_triggered_job
+from ap.common.jobs.wait_queue import WaitingJobs
 
 logger = logging.getLogger(__name__)
 
 
 def mark_finished_job_done(event: JobExecutionEvent):
     """Event listener for: EVENT_JOB_EXECUTED | EVENT_JOB_ERROR
-    That mark each finished job as done
+    That mark each finished job as done, and wake up jobs waiting for it
     """
     running_jobs = RunningJobs.get_running_jobs()
 
+    waiting_job_ids = []
     with RunningJobs.lock():
         running_job = running_jobs.get(event.job_id)
         # in case of database is locked, do not update job status
@@ -31,7 +35,12 @@ def mark_finished_job_done(event: JobExecutionEvent):
             logger.info(f'{event.job_id}: was rescheduled since database is locked')
         else:
             running_job.update(status=RunningJobStatus.EXECUTED, running_jobs=running_jobs)
+            ResourceLocks.release(event.job_id)
             logger.info(f'{event.job_id}: mark complete executing job as done')
+            waiting_job_ids = WaitingJobs.get_job_ids()
+
+    # lock order is `scheduler lock` then `running jobs` lock, hence wake up jobs after releasing `running jobs` lock
+    WaitingJobs.wake_up(waiting_job_ids)
 
 
 def verify_job_submission(submit_function: Callable[[BaseExecutor, Job, list[Any]], Any]):
@@ -64,10 +73,12 @@ def verify_job_submission(submit_function: Callable[[BaseExecutor, Job, list[Any
 
                 # Job is not running, remove it
                 running_jobs.pop(running_job.id, None)
+                ResourceLocks.release(running_job.id)
 
                 # Job is finished, we don't need to always-trigger it anymore
                 # Return right away and let the scheduler decides if it should be removed or re-run later
                 if not running_job.modified():
+                    WaitingJobs.remove(job_kwargs.job_id)
                     unwrap_always_triggered_job(job)
                     logger.info(f'{job_kwargs.job_id}: already finished, schedule for the next run')
                     # Do not submit. TODO: need to find a way to raise error without trashing our log
@@ -77,10 +88,29 @@ def verify_job_submission(submit_function: Callable[[BaseExecutor, Job, list[Any
             # Can try to submit.
 
             # check before run and tell scheduler that we cannot submit our job
-            if is_conflict_with_other_jobs(job_kwargs.job_id, job_kwargs.job_name, job_kwargs.proc_id, running_jobs):
+            # waiting jobs with higher rank are checked first, so that this job does not take their turn
+            if is_conflict_with_jobs(
+                job_kwargs.job_id,
+                job_kwargs.job_name,
+                job_kwargs.proc_id,
+                WaitingJobs.get_jobs_ahead(job_kwargs).values(),
+            ) or not ResourceLocks.try_acquire(
+                job_kwargs.job_id,
+                job_kwargs.job_name,
+                job_kwargs.proc_id,
+                running_jobs,
+            ):
+                # `mark_finished_job_done` wakes it up when a running job finishes,
+                # the always-trigger is still there in case our application is restarted
+                WaitingJobs.wait(job_kwargs, scheduler=self._scheduler)
                 # Do not submit. TODO: need to find a way to raise error without trashing our log
                 return
 
+            waiting_job = WaitingJobs.remove(job_kwargs.job_id)
+            if waiting_job is not None:
+                waiting_seconds = (datetime.now(utc) - waiting_job.waiting_since).total_seconds()
+                logger.info(f'{job_kwargs.job_id}: admitted after waiting {waiting_seconds:.3f} seconds')
+
             try:
                 # We need to mark our job as running here so that we don't run into awkward situation that our job
                 # run so fast that it finishes right after submitting, but before we put it into `running_jobs`
@@ -97,6 +127,7 @@ def verify_job_submission(submit_function: Callable[[BaseExecutor, Job, list[Any
                 # `super.submit_job` runs into problems,
                 # need to pop it out from `running_jobs` since we added it before submitting
                 running_jobs.pop(job_kwargs.job_id, None)
+                ResourceLocks.release(job_kwargs.job_id)
                 raise e
 
     return wrapper
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from apscheduler.schedulers.base import BaseScheduler
+from pydantic import BaseModel, Field
+from pytz import utc
+
+from ap.common.jobs.conflict import PRIORITY_JOBS
+from ap.common.jobs.jobs import JobKwargs, RunningJob
+from ap.common.jobs.trigger import RE_TRIGGER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class WaitingJob(BaseModel):
+    id: str
+    name: str
+    proc_id: Optional[int] = None
+
+    # When this job started waiting, it keeps its turn even if it is rejected again
+    waiting_since: datetime = Field(default_factory=lambda: datetime.now(utc))
+
+    # The latest time this job was checked before submitting
+    checked_at: datetime = Field(default_factory=lambda: datetime.now(utc))
+
+    @property
+    def is_priority(self) -> bool:
+        return self.name in PRIORITY_JOBS
+
+    def rank(self) -> tuple[bool, datetime]:
+        """Priority jobs first, then first come first served"""
+        return not self.is_priority, self.waiting_since
+
+    def as_running_job(self) -> RunningJob:
+        return RunningJob(id=self.id, name=self.name, proc_id=self.proc_id)
+
+
+class WaitingJobs:
+    """Jobs which cannot be submitted because they are conflicting with running jobs.
+    They are woken up as soon as a running job finishes, instead of waiting for their next re-trigger.
+    A job cannot be submitted ahead of a waiting job which has higher rank and conflicts with it,
+    so that waiting jobs (especially `PRIORITY_JOBS`) are not starved by jobs coming later.
+    This queue only lives in main process, where scheduler submits jobs.
+    """
+
+    _waiting_jobs: dict[str, WaitingJob] = {}
+
+    _lock: threading.Lock = threading.Lock()
+
+    # scheduler used to wake up waiting jobs
+    _scheduler: BaseScheduler | None = None
+
+    # a job is re-triggered every `RE_TRIGGER_SECONDS`, if it is not checked for a longer time, it was removed
+    expired_seconds: int = RE_TRIGGER_SECONDS * 2
+
+    @classmethod
+    def wait(cls, job_kwargs: JobKwargs, scheduler: BaseScheduler):
+        with cls._lock:
+            cls._scheduler = scheduler
+            waiting_job = cls._waiting_jobs.get(job_kwargs.job_id)
+            if waiting_job is None:
+                cls._waiting_jobs[job_kwargs.job_id] = WaitingJob(
+                    id=job_kwargs.job_id,
+                    name=job_kwargs.job_name,
+                    proc_id=job_kwargs.proc_id,
+                )
+                logger.info(f'{job_kwargs.job_id}: waiting for conflicting jobs')
+            else:
+                waiting_job.checked_at = datetime.now(utc)
+
+    @classmethod
+    def remove(cls, job_id: str) -> WaitingJob | None:
+        with cls._lock:
+            return cls._waiting_jobs.pop(job_id, None)
+
+    @classmethod
+    def get_jobs_ahead(cls, job_kwargs: JobKwargs) -> dict[str, RunningJob]:
+        """
+        Waiting jobs which should be submitted before this job
+        :return: dict of job id: running job, to check conflict as if they were running
+        """
+        with cls._lock:
+            cls._remove_expired_jobs()
+            waiting_job = cls._waiting_jobs.get(job_kwargs.job_id) or WaitingJob(
+                id=job_kwargs.job_id,
+                name=job_kwargs.job_name,
+                proc_id=job_kwargs.proc_id,
+            )
+            rank = waiting_job.rank()
+            return {
+                job.id: job.as_running_job()
+                for job in cls._waiting_jobs.values()
+                if job.id != waiting_job.id and job.rank() < rank
+            }
+
+    @classmethod
+    def get_job_ids(cls) -> list[str]:
+        """Waiting job ids, by rank"""
+        with cls._lock:
+            cls._remove_expired_jobs()
+            return [job.id for job in sorted(cls._waiting_jobs.values(), key=WaitingJob.rank)]
+
+    @classmethod
+    def wake_up(cls, job_ids: list[str]):
+        """Make waiting jobs due now, so that scheduler submits them again right away.
+        Must not be called under `RunningJobs.lock()`, lock order is `scheduler lock` then `running jobs` lock.
+        """
+        scheduler = cls._scheduler
+        if scheduler is None:
+            return
+
+        for job_id in job_ids:
+            job = scheduler.get_job(job_id)
+            if job is None:
+                cls.remove(job_id)
+                continue
+
+            # do not resume paused job
+            if job.next_run_time is None:
+                continue
+
+            job.modify(next_run_time=datetime.now(utc))
+            logger.info(f'{job_id}: woken up')
+
+    @classmethod
+    def _remove_expired_jobs(cls):
+        expired_time = datetime.now(utc) - timedelta(seconds=cls.expired_seconds)
+        for job in list(cls._waiting_jobs.values()):
+            if job.checked_at < expired_time:
+                cls._waiting_jobs.pop(job.id, None)
@@ -16,6 +16,7 @@ from typing import Callable, Dict, List, Optional, Union
 from zipfile import ZipFile
 
 from ap.common.constants import LOG_LEVEL, ApLogLevel
+from ap.common.request_profile import current_span, enter_span, exit_span
 
 tz = time.strftime('%z')
 LOG_FORMAT = '%(asctime)s' + tz + ' %(levelname)s: %(message)s'
@@ -428,6 +429,11 @@ def log_execution_time(prefix='', logging_exception=True):
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
+            # collect span only when current request is profiled
+            parent_span = current_span.get()
+            if parent_span is not None:
+                return profiled_wrapper(parent_span, *args, **kwargs)
+
             start_dt = datetime.now()
             start = perf_counter()
             try:
@@ -438,6 +444,18 @@ def log_execution_time(prefix='', logging_exception=True):
                 print_log_with_processing_time(start, start_dt)
             return result
 
+        def profiled_wrapper(parent_span, *args, **kwargs):
+            span = enter_span(f'{prefix} {fn.__name__}'.strip(), parent_span)
+            result = None
+            start_dt = datetime.now()
+            start = perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                print_log_with_processing_time(start, start_dt)
+                exit_span(span, result)
+            return result
+
         def print_log_with_processing_time(start, start_dt):
             end = perf_counter()
             count_time = end - start
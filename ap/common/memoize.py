@@ -67,6 +67,11 @@ def get_cache_attr(key):
     return data
 
 
+def is_stop_using_cache() -> bool:
+    """Whether current request must not use cache, for caches which are not managed by `memoize`"""
+    return get_cache_attr(MemoizeKey.STOP_USING_CACHE) is not None
+
+
 @dataclasses.dataclass
 class OptionalCacheConfig:
     """Allow user to change cache behavior for function"""
@@ -119,7 +124,7 @@ class CacheConfig:
             config.save_file = True
 
         # check if we don't want to use cache anymore
-        if get_cache_attr(MemoizeKey.STOP_USING_CACHE) is not None:
+        if is_stop_using_cache():
             config.stop_use_cache = True
 
         # finding custom key, this is use for `jump_key`
@@ -172,3 +172,27 @@ Event = Union[
     EventRemoveJobs,
     EventKillJobs,
 ]
+
+
+# progress announcements, only the latest one of each job is worth delivering
+COALESCED_ANNOUNCE_EVENTS = (AnnounceEvent.JOB_RUN, AnnounceEvent.SHOW_GRAPH, AnnounceEvent.DISK_USAGE)
+
+
+def get_coalesce_key(event: Event) -> Optional[tuple]:
+    """Key of events which replace each other when they are waiting to be delivered.
+    A newer event with the same key makes the older one obsolete, None means the event is never coalesced.
+    """
+    if isinstance(event, EventBackgroundAnnounce) and event.event in COALESCED_ANNOUNCE_EVENTS:
+        return EventBackgroundAnnounce.__name__, event.event, event.job_id
+
+    if isinstance(event, EventExpireCache):
+        return EventExpireCache.__name__, event.cache_type
+
+    return None
+
+
+def is_batched_event(event: Event) -> bool:
+    """Notifications which can wait a moment to be sent together with others.
+    Other events (adding, removing jobs, shutting down ...) are sent immediately.
+    """
+    return isinstance(event, (EventBackgroundAnnounce, EventExpireCache))
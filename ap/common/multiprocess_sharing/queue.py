@@ -3,20 +3,52 @@ from __future__ import annotations
 import contextlib
 import logging
 import multiprocessing
+import multiprocessing.util
+import os
 import queue
 import threading
 from typing import Any, Callable
 
-from ap.common.multiprocess_sharing.events import Event
+from ap.common.multiprocess_sharing.events import Event, get_coalesce_key, is_batched_event
 from ap.common.multiprocess_sharing.manager import CustomManager
 
 logger = logging.getLogger(__name__)
 
 
+def coalesce_events(events: list[Event]) -> list[Event]:
+    """Remove events made obsolete by a newer event with the same coalesce key.
+    The newer event is kept at its own position, so that it is still run after events sent before it.
+    """
+    keys = [get_coalesce_key(event) for event in events]
+    latest_positions = {key: i for i, key in enumerate(keys) if key is not None}
+    return [event for i, (event, key) in enumerate(zip(events, keys)) if key is None or latest_positions[key] == i]
+
+
 class EventQueue:
-    """A queue wrapper to enable sharing event between parent process and children processes"""
+    """A queue wrapper to enable sharing event between parent process and children processes
+    Events are sent in batches (list of events): notifications are buffered in each process and sent together
+    at most `flush_interval` seconds later, other events are sent immediately along with buffered notifications.
+    """
+
+    inner: queue.Queue[list[Event]] | None = None
+
+    # the maximum time (in seconds) that a notification waits in buffer before being sent
+    flush_interval: float = 0.05
+
+    # buffer is sent right away when it has this many events
+    max_batch_size: int = 1000
+
+    # the maximum number of waiting batches that listener merges (and coalesces) before running callbacks
+    max_drain_batches: int = 100
+
+    # notifications waiting to be sent from this process
+    pending: list[Event] = []
+    pending_condition: threading.Condition = threading.Condition()
+
+    # keep order of batches sent by flusher thread and by `put`
+    send_lock: threading.Lock = threading.Lock()
 
-    inner: queue.Queue[Event] | None = None
+    flusher: threading.Thread | None = None
 
     # callback to run on Event
     # we don't need to lock this because all callbacks should be added only in main thread
@@ -26,20 +58,34 @@ class EventQueue:
 
     @classmethod
     def put(cls, event: Event):
-        """Putting event into queue, this is a block operation
+        """Putting event into queue, notifications are buffered, other events are a block operation
         If you are running test, please look at `setup_test_event_queue` function instead
         We don't perform queue when running tests
         """
-        cls._put(event)
+        if is_batched_event(event):
+            cls._buffer(event)
+            return
+
+        with cls.send_lock:
+            cls._put([*cls._pop_pending(), event])
 
     @classmethod
-    def get(cls) -> Event | None:
-        """Getting a message from the queue, this is a blocking operation,
+    def get(cls) -> list[Event] | None:
+        """Getting events from the queue, this is a blocking operation,
         However, we run this in separated thread, hence it is ok to just block them
+        Waiting batches are merged and obsolete events are removed.
         return None when the queue is stopped.
         """
         return cls._get()
 
+    @classmethod
+    def flush(cls):
+        """Send buffered notifications of this process now"""
+        with cls.send_lock:
+            events = cls._pop_pending()
+            if events:
+                cls._put(events)
+
     @classmethod
     def clear(cls):
         return cls._clear()
@@ -70,24 +116,72 @@ class EventQueue:
     @classmethod
     def _listen(cls):
         while True:
-            event = cls.get()
+            events = cls.get()
             # even though we waited, we cannot get any message, hence we stop the loop
-            if event is None:
+            if events is None:
                 break
 
             # callbacks are not executed when not listening
             if not cls.is_listening:
                 continue
 
-            # if Exception occurs in some callbacks, we can still listen to other events, so we add try catch here
-            try:
-                for callback in cls.callbacks:
-                    callback(event)
-            except Exception as e:
-                logger.exception(e)
+            for event in events:
+                # if Exception occurs in some callbacks, we can still listen to other events, so we add try catch here
+                try:
+                    for callback in cls.callbacks:
+                        callback(event)
+                except Exception as e:
+                    logger.exception(e)
+
+    @classmethod
+    def _buffer(cls, event: Event):
+        with cls.pending_condition:
+            cls.pending.append(event)
+            if cls.flusher is None:
+                cls._start_flusher()
+            if len(cls.pending) >= cls.max_batch_size:
+                cls.pending_condition.notify()
 
     @classmethod
-    def _put(cls, event: Event):
+    def _pop_pending(cls) -> list[Event]:
+        with cls.pending_condition:
+            events, cls.pending = cls.pending, []
+        return coalesce_events(events)
+
+    @classmethod
+    def _start_flusher(cls):
+        # daemon=True, when the process exit, the thread will stop as well
+        cls.flusher = threading.Thread(target=cls._flush_forever, daemon=True)
+        cls.flusher.start()
+
+        # send what is left in buffer when a child process exits (children processes do not run `atexit`)
+        # main process does not need it, because its listener stops at the same time
+        if multiprocessing.parent_process() is not None:
+            multiprocessing.util.Finalize(None, cls.flush, exitpriority=100)
+
+    @classmethod
+    def _flush_forever(cls):
+        while True:
+            with cls.pending_condition:
+                cls.pending_condition.wait_for(lambda: cls.pending)
+                # let notifications of a burst gather (and be coalesced) for a moment
+                cls.pending_condition.wait_for(
+                    lambda: len(cls.pending) >= cls.max_batch_size,
+                    timeout=cls.flush_interval,
+                )
+
+            cls.flush()
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # forked child process does not have flusher thread and must not send events buffered by its parent
+        cls.pending = []
+        cls.pending_condition = threading.Condition()
+        cls.send_lock = threading.Lock()
+        cls.flusher = None
+
+    @classmethod
+    def _put(cls, events: list[Event]):
         # Cannot connect to the server to get shared object
         if not cls.try_init():
             return
@@ -96,12 +190,12 @@ class EventQueue:
         # To avoid TOCTOU issue: <https://en.wikipedia.org/wiki/Time-of-check_to_time-of-use>
         with contextlib.suppress(BrokenPipeError, FileNotFoundError, AssertionError):
             try:
-                cls.inner.put(event)
+                cls.inner.put(events)
             except queue.Full:
-                logger.exception(f'Event queue is full, cannot put more event {event}')
+                logger.exception(f'Event queue is full, cannot put more events {events}')
 
     @classmethod
-    def _get(cls) -> Event | None:
+    def _get(cls) -> list[Event] | None:
         # Cannot connect to the server to get shared object
         if not cls.try_init():
             return None
@@ -110,7 +204,14 @@ class EventQueue:
         # To avoid TOCTOU issue: <https://en.wikipedia.org/wiki/Time-of-check_to_time-of-use>
         with contextlib.suppress(BrokenPipeError, FileNotFoundError, AssertionError):
             # We want to wait for message from the queue, so just block here
-            return cls.inner.get()
+            events = list(cls.inner.get())
+
+            # merge batches which are already waiting, so that obsolete events of different processes are skipped
+            with contextlib.suppress(queue.Empty):
+                for _ in range(cls.max_drain_batches):
+                    events.extend(cls.inner.get_nowait())
+
+            return coalesce_events(events)
 
         return None
 
@@ -124,6 +225,7 @@ class EventQueue:
 
     @classmethod
     def _clear(cls):
+        cls._pop_pending()
         while not cls.inner.empty():
             cls.inner.get_nowait()
 
@@ -159,3 +261,7 @@ class EventQueue:
 
         # Return whether we are connected
         return cls.is_connected()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=EventQueue._reset_after_fork)
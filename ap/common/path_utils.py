@@ -204,10 +204,16 @@ def get_backup_data_path():
     return resource_path(data_folder, folder_name, level=AbsPath.SHOW)
 
 
+def get_file_index_path():
+    folder_name = 'file_index'
+    data_folder = get_data_path()
+    return resource_path(data_folder, folder_name, level=AbsPath.SHOW)
+
+
 def get_backup_data_folder(process_id):
     folder = get_backup_data_path()
-    if not check_exist(folder):
-        os.makedirs(folder)
+    # may be called from several file workers at the same time
+    os.makedirs(folder, exist_ok=True)
     return os.path.join(folder, str(process_id))
 
 
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import sqlite3
 from datetime import datetime
 from typing import Union
 
@@ -14,6 +15,11 @@ from ap.common.pydn.dblib.oracle import Oracle
 from ap.common.pydn.dblib.postgresql import PostgreSQL
 from ap.common.pydn.dblib.snowflake import Snowflake
 from ap.common.pydn.dblib.sqlite import SQLite3
+from ap.common.services.request_time_out_handler import (
+    SQLITE_ABORT_CHECK_INSTRUCTIONS,
+    check_abort_process,
+    get_abort_checker,
+)
 from ap.setting_module.models import CfgDataSource, CfgDataSourceDB
 
 
@@ -83,6 +89,12 @@ class DbProxy:
         if self.is_universal_db and self.isolation_level:
             set_sqlite_params(conn)
 
+        if isinstance(self.db_instance, SQLite3):
+            is_aborted = get_abort_checker()
+            if is_aborted is not None:
+                # interrupt running statement as soon as the request is aborted or timed out
+                conn.set_progress_handler(is_aborted, SQLITE_ABORT_CHECK_INSTRUCTIONS)
+
         if self.dic_db_files:
             for proc_id, db_file in self.dic_db_files.items():
                 if proc_id != self.proc_id:
@@ -106,8 +118,16 @@ class DbProxy:
             raise e
         finally:
             self.db_instance.disconnect()
+
+        self.raise_if_aborted(_exc_type)
         return False
 
+    @staticmethod
+    def raise_if_aborted(exc_type):
+        """SQLite raises `interrupted` error when request is aborted, raise the abort reason instead"""
+        if exc_type is not None and issubclass(exc_type, sqlite3.OperationalError):
+            check_abort_process()
+
     def _get_db_instance(self):
         db_type = self.db_basic.type.lower()
         if db_type == DBType.SQLITE.value.lower():
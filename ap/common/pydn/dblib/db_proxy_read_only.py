@@ -17,6 +17,7 @@ class ReadOnlyDbProxy(DbProxy):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.db_instance.disconnect()
+        self.raise_if_aborted(exc_type)
         return False
 
     def _get_db_instance(self):
@@ -0,0 +1,185 @@
+"""Per-request performance profile.
+
+Functions decorated by `log_execution_time` are collected as a nested span tree when current request is profiled.
+Each span carries its execution time, the number of rows it returned and its peak traced memory.
+A request is profiled when `REQUEST_PROFILE_ENV` is set to 1, or when it is sent from server itself (admin)
+with `REQUEST_PROFILE_HEADER: 1`.
+Finished profiles are kept in memory and retrievable by their id from `/ap/api/common/request_profile/<profile_id>`.
+
+Traced memory is counted for the whole process and its peak is reset globally by every span, so peak memory of
+spans is only reliable when no other request runs at the same time. Profiles overlapping other profiled requests
+are marked by `memory_overlapped`, requests which are not profiled are not detected.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import os
+import threading
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Optional
+
+import pandas as pd
+
+from ap.common.constants import REQUEST_PROFILE_ENV, REQUEST_PROFILE_HEADER
+
+# span of the running decorated function, None when current request is not profiled
+current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float = field(default_factory=perf_counter)
+    end: Optional[float] = None
+    rows: Optional[int] = None
+    memory_start: int = 0
+    memory_peak: int = 0
+    children: list[Span] = field(default_factory=list)
+    parent: Optional[Span] = None
+
+    def to_dict(self, origin: float) -> dict:
+        """
+        :param origin: start of root span, all offsets are relative to it
+        :return: json serializable span tree
+        """
+        end = self.end if self.end is not None else perf_counter()
+        return {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((end - self.start) * 1000, 3),
+            'rows': self.rows,
+            'peak_memory_mb': round(max(self.memory_peak - self.memory_start, 0) / 1024 / 1024, 3),
+            'children': [child.to_dict(origin) for child in self.children],
+        }
+
+
+def count_rows(result: Any) -> Optional[int]:
+    """Number of rows of returned dataframe. For tuple results, the first dataframe is counted"""
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+
+    if isinstance(result, tuple):
+        for item in result:
+            if isinstance(item, (pd.DataFrame, pd.Series)):
+                return len(item)
+
+    return None
+
+
+def take_memory_peak() -> int:
+    """Peak traced memory since the previous call"""
+    if not tracemalloc.is_tracing():
+        return 0
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    return peak
+
+
+def get_traced_memory() -> int:
+    if not tracemalloc.is_tracing():
+        return 0
+
+    current, _ = tracemalloc.get_traced_memory()
+    return current
+
+
+def enter_span(name: str, parent: Span) -> Span:
+    # the peak until now belongs to parent span, because `reset_peak` is global
+    parent.memory_peak = max(parent.memory_peak, take_memory_peak())
+    memory = get_traced_memory()
+    span = Span(name=name, memory_start=memory, memory_peak=memory, parent=parent)
+    parent.children.append(span)
+    current_span.set(span)
+    return span
+
+
+def exit_span(span: Span, result: Any = None):
+    span.end = perf_counter()
+    span.rows = count_rows(result)
+    span.memory_peak = max(span.memory_peak, take_memory_peak())
+    span.parent.memory_peak = max(span.parent.memory_peak, span.memory_peak)
+    current_span.set(span.parent)
+
+
+class RequestProfiles:
+    """Keep profiles of latest profiled requests"""
+
+    MAX_PROFILES = 100
+
+    _profiles: OrderedDict[str, dict] = OrderedDict()
+
+    _lock: threading.Lock = threading.Lock()
+
+    # running profiled requests and whether they overlapped another one, memory is traced while there is any of them
+    _running: dict[str, bool] = {}
+
+    @staticmethod
+    def is_enabled(request) -> bool:
+        """Profile all requests by environment variable, or requests from server itself by header"""
+        if os.environ.get(REQUEST_PROFILE_ENV) == '1':
+            return True
+
+        if request.headers.get(REQUEST_PROFILE_HEADER) != '1':
+            return False
+
+        from ap import is_admin_request
+
+        return is_admin_request(request)
+
+    @classmethod
+    def start(cls, name: str) -> tuple[str, Span, contextvars.Token]:
+        """
+        Start profiling current request
+        :param name: name of root span, usually the endpoint
+        :return: profile id, root span and token to restore context when the request finishes
+        """
+        profile_id = uuid.uuid4().hex
+        with cls._lock:
+            for running_id in cls._running:
+                cls._running[running_id] = True
+            cls._running[profile_id] = bool(cls._running)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+        memory = get_traced_memory()
+        root = Span(name=name, memory_start=memory, memory_peak=memory)
+        token = current_span.set(root)
+        return profile_id, root, token
+
+    @classmethod
+    def finish(cls, profile_id: str, root: Span, token: contextvars.Token):
+        current_span.reset(token)
+        root.end = perf_counter()
+        root.memory_peak = max(root.memory_peak, take_memory_peak())
+
+        with cls._lock:
+            memory_overlapped = cls._running.pop(profile_id, False)
+            if not cls._running and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+            cls._profiles[profile_id] = {
+                'id': profile_id,
+                'created_at': datetime.now().isoformat(),
+                'memory_overlapped': memory_overlapped,
+                'span': root.to_dict(root.start),
+            }
+            while len(cls._profiles) > cls.MAX_PROFILES:
+                cls._profiles.popitem(last=False)
+
+    @classmethod
+    def get(cls, profile_id: str) -> Optional[dict]:
+        with cls._lock:
+            return cls._profiles.get(profile_id)
+
+    @classmethod
+    def get_ids(cls) -> list[str]:
+        """Profile ids, latest first"""
+        with cls._lock:
+            return list(reversed(cls._profiles))
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import codecs
 import csv
+import heapq
 import io
 
 # https://stackoverrun.com/ja/q/6869533
@@ -168,6 +169,34 @@ def read_data(
             yield normalize_func(row)
 
 
+def get_top_rows(rows, limit: int | None, sort_index: int | None = None, ascending: bool = True) -> list:
+    """
+    Read `rows` to the end and keep only the first `limit` rows ordered by column `sort_index`.
+    Only `limit` rows are held in memory at a time, so it is safe for files of any size.
+    Values are compared as strings, rows without value at `sort_index` come last and ties keep their file order.
+    :param rows: csv rows
+    :param limit: number of rows to keep, all rows if None
+    :param sort_index: index of sort column, rows are kept in file order if None
+    :param ascending: sort order
+    :return: kept rows
+    """
+    if sort_index is None:
+        return list(islice(rows, limit))
+
+    def sort_key(row):
+        has_value = len(row) > sort_index
+        value = row[sort_index] if has_value else EMPTY_STRING
+        return (not has_value, value) if ascending else (has_value, value)
+
+    if limit is None:
+        return sorted(rows, key=sort_key, reverse=not ascending)
+
+    if ascending:
+        return heapq.nsmallest(limit, rows, key=sort_key)
+
+    return heapq.nlargest(limit, rows, key=sort_key)
+
+
 def read_csv_with_transpose(file_path: str, is_transpose: bool = False, **pd_params) -> pd.DataFrame:
     if is_transpose:
         params = pd_params.copy()
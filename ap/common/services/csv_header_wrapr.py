@@ -2,9 +2,11 @@ import datetime
 import io
 import itertools
 import logging
+import os
 import re
+import threading
 import unicodedata
-from collections import Counter
+from collections import Counter, OrderedDict
 from itertools import tee
 
 import numpy as np
@@ -15,6 +17,9 @@ from ap.common.services.normalization import normalize_list
 
 logger = logging.getLogger(__name__)
 
+# number of rows which are read to guess encoding
+ENCODING_CHECK_ROWS = 100
+
 
 def get_file_info_py(target_file):
     no_data_error = 'NoDataError'
@@ -22,7 +27,7 @@ def get_file_info_py(target_file):
 
     is_empty_file = False
     try:
-        out = filechecker(fpath=target_file)
+        out = FileCheckerCache.check(target_file)
     except Exception as e:
         logger.error(e)
         return e, is_empty_file
@@ -210,12 +215,86 @@ def filechecker(fpath: str, nrows_to_check=20) -> dict:
     return results
 
 
+class FileCheckerCache:
+    """Keep results of `filechecker` in memory.
+    A file is analyzed again only when its size or modified time changes.
+    Files in a folder usually share one layout, so the header rows of the last analyzed file in each folder are kept:
+    a new file whose header rows are the same bytes, in the same encoding, reuses that result without analyzing.
+    Data types and escape strings of a reused result come from the analyzed file.
+    """
+
+    MAX_FILES = 10000
+
+    # (path, size, modified time) -> result
+    _results: OrderedDict[tuple, dict] = OrderedDict()
+
+    # folder -> (header rows, result) of the last analyzed file
+    _layouts: dict[str, tuple[list[bytes], dict]] = {}
+
+    _lock: threading.Lock = threading.Lock()
+
+    @classmethod
+    def check(cls, fpath: str) -> dict:
+        """
+        Same as `filechecker`, cached
+        :param fpath: path to csv/tsv
+        :return: results of `filechecker`
+        """
+        fpath = os.path.abspath(fpath)
+        stat = os.stat(fpath)
+        key = (fpath, stat.st_size, stat.st_mtime_ns)
+        folder = os.path.dirname(fpath)
+
+        with cls._lock:
+            results = cls._results.get(key)
+            if results is not None:
+                cls._results.move_to_end(key)
+                return results
+
+            layout = cls._layouts.get(folder)
+
+        head_rows = read_first_nrows_as_bytes(fpath, ENCODING_CHECK_ROWS)
+        if layout and is_same_layout(head_rows, *layout):
+            results = layout[1]
+        else:
+            results = filechecker(fpath)
+            layout = None
+            if not results.get('err'):
+                nrows_header = results['info']['skip'] + 1
+                layout = (head_rows[:nrows_header], results)
+
+        with cls._lock:
+            cls._results[key] = results
+            while len(cls._results) > cls.MAX_FILES:
+                cls._results.popitem(last=False)
+
+            if layout:
+                cls._layouts[folder] = layout
+
+        return results
+
+
+def is_same_layout(head_rows: list[bytes], header_rows: list[bytes], results: dict) -> bool:
+    """
+    Check if a file has the layout of an analyzed file
+    :param head_rows: first rows of the file as bytes
+    :param header_rows: header rows of the analyzed file as bytes
+    :param results: results of `filechecker` of the analyzed file
+    :return: True if header rows are the same, data follows and encoding is guessed the same
+    """
+    nrows_header = len(header_rows)
+    if head_rows[:nrows_header] != header_rows or len(head_rows) <= nrows_header:
+        return False
+
+    return guess_encoding_of_bytes(b''.join(head_rows)) == results['info']['encd']
+
+
 # =========================
 # Read header
 # =========================
 
 
-def guess_encoding_simply(fpath: str, max_rows=100) -> str:
+def guess_encoding_simply(fpath: str, max_rows=ENCODING_CHECK_ROWS) -> str:
     """Very simple file encoding estimator
     Just try utf-8 and shift-jis.
     Assume that we can not open shift-jis file with utf-8.
@@ -230,6 +309,22 @@ def guess_encoding_simply(fpath: str, max_rows=100) -> str:
     return encd
 
 
+def guess_encoding_of_bytes(data: bytes) -> str:
+    """Same as `guess_encoding_simply` for bytes which are already read"""
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return 'shift_jis'
+
+    return 'utf-8'
+
+
+def read_first_nrows_as_bytes(fpath: str, nrows: int) -> list:
+    """Read first rows of a file without decoding"""
+    with open(fpath, 'rb') as f:
+        return list(itertools.islice(f, nrows))
+
+
 def read_first_nrows_as_list(fpath: str, nrows: int, encd: str, del_newline=False) -> list:
     """Read a text file as a list
     Each element corresponds to a row of text file.
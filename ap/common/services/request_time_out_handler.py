@@ -1,13 +1,19 @@
+from __future__ import annotations
+
 import os
 import time
 from functools import wraps
+from typing import Callable
 
-from flask import g
+from flask import g, has_app_context
 
 from ap.common.constants import ANALYSIS_INTERFACE_ENV, AppEnv, FlaskGKey
 
 api_request_threads = []
 
+# number of SQLite virtual machine instructions between two checks whether the request is aborted
+SQLITE_ABORT_CHECK_INSTRUCTIONS = 100_000
+
 
 class RequestTimeOutAPI(Exception):
     status_code = 408
@@ -38,9 +44,13 @@ def request_timeout_handling(max_timeout=10):
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
+            current_env = os.environ.get(ANALYSIS_INTERFACE_ENV, AppEnv.PRODUCTION.value)
+            if current_env == AppEnv.PRODUCTION.value:
+                # let running work stop as soon as the request times out (see `check_abort_process`)
+                set_request_deadline(max_timeout)
+
             result = fn(*args, **kwargs)
 
-            current_env = os.environ.get(ANALYSIS_INTERFACE_ENV, AppEnv.PRODUCTION.value)
             if current_env == AppEnv.PRODUCTION.value:
                 start_func_time = time.time()
                 request_start_time = getattr(g, 'request_start_time', None)
@@ -64,12 +74,49 @@ def set_request_g_dict(value):
     g.setdefault(FlaskGKey.THREAD_ID, value)
 
 
+def get_request_deadline() -> float | None:
+    return g.get(FlaskGKey.REQUEST_DEADLINE)
+
+
+def set_request_deadline(max_timeout):
+    """Set the time (timestamp) that current request times out, the outermost decorated function sets it
+    :param max_timeout: minutes from request start time
+    """
+    request_start_time = getattr(g, 'request_start_time', None)
+    if request_start_time is not None:
+        g.setdefault(FlaskGKey.REQUEST_DEADLINE, request_start_time + max_timeout * 60)
+
+
 def check_abort_process():
     thread_id = get_request_g_dict()
     if thread_id and thread_id in api_request_threads:
         api_request_threads.remove(thread_id)
         raise BrokenPipeError('PROCESS KILLED')
 
+    deadline = get_request_deadline()
+    if deadline is not None and time.time() > deadline:
+        timeout = (time.time() - g.request_start_time) / 60  # to minutes
+        raise RequestTimeOutAPI('Request timeout: {} seconds'.format(str(timeout)))
+
+
+def get_abort_checker() -> Callable[[], bool] | None:
+    """
+    Cancellation token of current request, it does not need flask context to be checked (e.g. by database driver)
+    :return: function returning True if the request is aborted or timed out, None if there is no request to abort
+    """
+    if not has_app_context():
+        return None
+
+    thread_id = get_request_g_dict()
+    deadline = get_request_deadline()
+    if not thread_id and deadline is None:
+        return None
+
+    def is_aborted() -> bool:
+        return bool(thread_id and thread_id in api_request_threads) or (deadline is not None and time.time() > deadline)
+
+    return is_aborted
+
 
 def abort_process_handler():
     """Decorator to abort running process
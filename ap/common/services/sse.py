@@ -1,21 +1,32 @@
 from __future__ import annotations
 
-import contextlib
 import dataclasses
+import itertools
 import logging
-import queue
+import selectors
+import socket
 import threading
 import time
+from collections import deque
 from datetime import datetime, timedelta
 from functools import wraps
-from typing import Any, Generator
+from typing import Any, Generator, Optional
 
 from ap import json_dumps
 from ap.common.constants import AnnounceEvent
 from ap.common.multiprocess_sharing import EventBackgroundAnnounce, EventQueue
+from ap.common.multiprocess_sharing.events import get_coalesce_key
 
 logger = logging.getLogger(__name__)
 
+# response header of connections taken over by `SSEDispatcher`, the stream ends when connection is closed
+SSE_RESPONSE_HEADER = (
+    b'HTTP/1.1 200 OK\r\n'
+    b'Content-Type: text/event-stream; charset=utf-8\r\n'
+    b'Cache-Control: no-cache\r\n'
+    b'Connection: close\r\n\r\n'
+)
+
 
 @dataclasses.dataclass
 class SSEMessage:
@@ -47,75 +58,141 @@ class SSEMessage:
         return SSEMessage(data=e.data, event=e.event.name, timestamp=e.timestamp)
 
 
+class SSEHub:
+    """
+    Message log shared by all streamers.
+    A message is published once, each streamer reads it by its own cursor (sequence number) instead of having
+    a copy in its own queue. Slow streamers lose the oldest messages when the log is full (dropped messages) and
+    skip progress messages which are replaced by newer ones of the same job (coalesced messages).
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.condition = threading.Condition()
+
+        # (sequence, coalesce key, message), oldest first
+        self.messages: deque[tuple[int, Any, SSEMessage]] = deque(maxlen=capacity)
+        self.next_sequence: int = 0
+
+        # latest sequence of each coalesce key
+        self.latest_sequences: dict[Any, int] = {}
+
+        self.published_messages: int = 0
+        self.coalesced_messages: int = 0
+        self.dropped_messages: int = 0
+
+    def publish(self, sse_message: SSEMessage, coalesce_key: Any = None):
+        with self.condition:
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            self.messages.append((sequence, coalesce_key, sse_message))
+            self.published_messages += 1
+
+            if coalesce_key is not None:
+                self.latest_sequences[coalesce_key] = sequence
+                # forget keys whose messages are not in log anymore
+                if len(self.latest_sequences) > self.messages.maxlen:
+                    oldest_sequence = self.messages[0][0]
+                    self.latest_sequences = {
+                        key: seq for key, seq in self.latest_sequences.items() if seq >= oldest_sequence
+                    }
+
+            self.condition.notify_all()
+
+    def read(self, cursor: int, timeout: float) -> tuple[int, list[SSEMessage], int]:
+        """
+        Wait for messages published from cursor
+        :param cursor: sequence of the first message that streamer has not read
+        :param timeout: max waiting time (in seconds) if there is no new message
+        :return: next cursor, messages, number of dropped messages
+        """
+        with self.condition:
+            if cursor >= self.next_sequence:
+                self.condition.wait(timeout)
+
+            oldest_sequence = self.messages[0][0] if self.messages else self.next_sequence
+            dropped = max(oldest_sequence - cursor, 0)
+            entries = list(itertools.islice(self.messages, max(cursor - oldest_sequence, 0), None))
+            messages = [
+                message
+                for sequence, coalesce_key, message in entries
+                if coalesce_key is None or self.latest_sequences.get(coalesce_key) == sequence
+            ]
+
+            self.coalesced_messages += len(entries) - len(messages)
+            self.dropped_messages += dropped
+            return self.next_sequence, messages, dropped
+
+
 class SSEStreamer:
     """Streamer handling for sending message to a specific client"""
 
     def __init__(
         self,
         uuid: Any,
+        hub: SSEHub,
         blocking_message_timeout: int = 1,
         idle_timeout: float = 60,
-        message_queue_size: int = 1000,
+        flush_interval: float = 0.1,
     ):
         # The streamer unique identifier
         self.uuid: str = str(uuid)
 
+        # Messages from background announcing, the streamer only receives messages published after it is created.
+        self.hub = hub
+        self.cursor: int = hub.next_sequence
+
         # The total of time (in seconds) that we should wait for message in each stream loop.
         self.blocking_message_timeout = blocking_message_timeout
 
         # The total of time we consider that our streamer is idle (no client is pulling message from it).
         self.idle_timeout = idle_timeout
 
+        # The minimum time (in seconds) between two sends, messages of a burst are sent (and coalesced) together
+        # instead of waking up every streamer for each message.
+        self.flush_interval = flush_interval
+
         # The latest time that we access our messages.
         # We use this to check if a connected client is disconnected
         self.latest_response: datetime = datetime.now()
 
-        # Store messages from background announcing.
-        # Memory leak can occur if we have a streamer running around without pointing to any client.
-        self.messages: queue.Queue[SSEMessage] = queue.Queue(maxsize=message_queue_size)
+        # Messages lost because this streamer was too slow
+        self.dropped_messages: int = 0
 
         # Internal flag to exit out of the stream.
         # Because we cannot execute `self.stream().close()` after it is run, we need to stop it using this flag.
         self.stop: bool = False
 
+        # Connection and bytes not sent yet, if the streamer is served by `SSEDispatcher` instead of `stream`
+        self.socket: Optional[socket.socket] = None
+        self.pending: bytes = b''
+
         logger.debug(f'[SSE]: UUID = {self.uuid}; streamer created')
 
     def is_alive(self):
         """Check if our streamer is alive"""
 
+        if self.socket is not None:
+            # served by `SSEDispatcher`, it stops the streamer when its client is disconnected
+            return not self.stop
+
         latest_message_query_time_diff = datetime.now() - self.latest_response
         return latest_message_query_time_diff < timedelta(seconds=self.idle_timeout)
 
-    def get_message(self) -> SSEMessage | None:
-        """Getting message from queue, we also update our `latest_response` depends on `sse_message.timestamp`."""
-
-        with contextlib.suppress(queue.Empty):
-            sse_message = self.messages.get(timeout=self.blocking_message_timeout)
-            self.latest_response = sse_message.timestamp
-            return sse_message
-
-        return None
+    def get_messages(self, timeout: Optional[float] = None) -> list[SSEMessage]:
+        """Getting new messages from hub, we also update our `latest_response` depends on `sse_message.timestamp`."""
 
-    def add_message(self, sse_message: SSEMessage):
-        """Add new msg to messages"""
-        # Do not accept new message for stopped stream.
-        if self.stop:
-            return
+        if timeout is None:
+            timeout = self.blocking_message_timeout
 
-        # TODO: do we want to accept event only after we establish our connection ?
-        # Or we just accept messages, so that messages received before connection is established can be sent.
-        try:
-            self.messages.put_nowait(sse_message)
-        except queue.Full:
-            # Our queue is full, hence we should pop out old message to append the new one.
+        self.cursor, sse_messages, dropped = self.hub.read(self.cursor, timeout=timeout)
+        if dropped:
+            self.dropped_messages += dropped
+            logger.debug(f'[SSE]: UUID = {self.uuid}; {dropped} messages dropped')
 
-            # Pop the oldest message out of the queue,
-            # the operation below does not raise `queue.Empty` exception because
-            # our queue is not full.
-            self.messages.get_nowait()
+        if sse_messages:
+            self.latest_response = sse_messages[-1].timestamp
 
-            # Put back the newest msg
-            self.messages.put_nowait(sse_message)
+        return sse_messages
 
     def stream(self) -> Generator[str, None, None]:
         """Generator for stream to front-end"""
@@ -125,9 +202,175 @@ class SSEStreamer:
                 logger.debug(f'[SSE]: UUID = {self.uuid}; streamer stopped')
                 break
 
-            sse_message = self.get_message()
-            if sse_message is not None:
-                yield sse_message.format()
+            sse_messages = self.get_messages()
+            if sse_messages:
+                yield ''.join(sse_message.format() for sse_message in sse_messages)
+                time.sleep(self.flush_interval)
+
+
+class SSEDispatcher:
+    """
+    Serve streamers whose connections are taken over from waitress, all of them in one thread.
+    A waiting client holds no waitress thread and no waitress connection,
+    so the number of clients is not limited by `threads` and `connection_limit` of the server.
+    Messages are sent without blocking, a client which does not receive them keeps its bytes pending
+    and does not read new messages from hub until they are sent, so it loses the oldest ones like a slow streamer.
+    """
+
+    def __init__(self, hub: SSEHub, flush_interval: float = 0.1):
+        self.hub = hub
+
+        # The minimum time (in seconds) between two reads of hub, same as `SSEStreamer.flush_interval`
+        self.flush_interval = flush_interval
+
+        # Streamers added by request threads, they are registered by dispatcher thread
+        self.added_streamers: list[SSEStreamer] = []
+        self.lock = threading.Lock()
+        self.thread: threading.Thread | None = None
+
+        # A byte is written to wake up dispatcher thread when a message is published or a streamer is added
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+
+    @staticmethod
+    def take_over_connection(environ: dict) -> Optional[socket.socket]:
+        """
+        Socket of the request connection, removed from waitress so that request thread can return without closing it.
+        None if the app is not served by waitress (e.g. development server), then the streamer holds a thread.
+        """
+        # waitress gives its channel of this connection only as a bound method
+        channel = getattr(environ.get('waitress.client_disconnected'), '__self__', None)
+        trigger = getattr(getattr(channel, 'server', None), 'trigger', None)
+        if trigger is None or not hasattr(channel, 'del_channel'):
+            return None
+
+        removed = threading.Event()
+
+        def remove_channel():
+            # channel map is only changed in waitress main loop, thunks of trigger are run there
+            channel.del_channel()
+            # response of request thread must not be written into the connection
+            channel.write_soon = len
+            removed.set()
+
+        trigger.pull_trigger(remove_channel)
+        removed.wait()
+        return channel.socket
+
+    def add(self, streamer: SSEStreamer, sock: socket.socket):
+        """Serve streamer by dispatcher thread, the response header is sent first"""
+        sock.setblocking(False)
+        streamer.socket = sock
+        streamer.pending = SSE_RESPONSE_HEADER
+        with self.lock:
+            self.added_streamers.append(streamer)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='SSEDispatcher', daemon=True)
+                self.thread.start()
+
+        self.wakeup()
+
+    def wakeup(self):
+        try:
+            self.wakeup_writer.send(b'\0')
+        except OSError:
+            # buffer is full, dispatcher thread is already woken up
+            pass
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        streamers: set[SSEStreamer] = set()
+        read_at = 0.0
+        while True:
+            # wait for a client, a new streamer or a new message, but read hub at most once in `flush_interval`
+            timeout = None
+            if self._has_unread(streamers):
+                timeout = max(read_at + self.flush_interval - time.monotonic(), 0)
+
+            for key, mask in selector.select(timeout=timeout):
+                streamer = key.data
+                if streamer is None:
+                    self._drain_wakeup()
+                elif mask & selectors.EVENT_READ:
+                    # client sends nothing, readable means it is disconnected
+                    self._receive(streamer)
+                elif mask & selectors.EVENT_WRITE:
+                    self._send(streamer)
+
+            with self.lock:
+                added_streamers, self.added_streamers = self.added_streamers, []
+
+            for streamer in added_streamers:
+                streamers.add(streamer)
+                selector.register(streamer.socket, selectors.EVENT_READ, streamer)
+
+            now = time.monotonic()
+            if now >= read_at + self.flush_interval and self._has_unread(streamers):
+                read_at = now
+                self._read_messages(streamers)
+
+            for streamer in list(streamers):
+                if streamer.stop:
+                    logger.debug(f'[SSE]: UUID = {streamer.uuid}; streamer stopped')
+                    selector.unregister(streamer.socket)
+                    streamer.socket.close()
+                    streamers.remove(streamer)
+                    continue
+
+                if streamer.pending:
+                    self._send(streamer)
+
+                events = selectors.EVENT_READ | (selectors.EVENT_WRITE if streamer.pending else 0)
+                if selector.get_key(streamer.socket).events != events:
+                    selector.modify(streamer.socket, events, streamer)
+
+    def _has_unread(self, streamers: set[SSEStreamer]) -> bool:
+        """Whether a streamer which sent everything has messages to read"""
+        next_sequence = self.hub.next_sequence
+        return any(not streamer.pending and streamer.cursor < next_sequence for streamer in streamers)
+
+    def _drain_wakeup(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def _read_messages(self, streamers: set[SSEStreamer]):
+        """Messages of streamers which sent everything, a message is formatted once for all of them"""
+        formatted: dict[int, bytes] = {}
+        for streamer in streamers:
+            if streamer.pending or streamer.stop:
+                continue
+
+            sse_messages = streamer.get_messages(timeout=0)
+            for sse_message in sse_messages:
+                if id(sse_message) not in formatted:
+                    formatted[id(sse_message)] = sse_message.format().encode()
+
+            streamer.pending = b''.join(formatted[id(sse_message)] for sse_message in sse_messages)
+
+    @staticmethod
+    def _receive(streamer: SSEStreamer):
+        try:
+            if not streamer.socket.recv(4096):
+                streamer.stop = True
+        except BlockingIOError:
+            pass
+        except OSError:
+            streamer.stop = True
+
+    @staticmethod
+    def _send(streamer: SSEStreamer):
+        try:
+            sent = streamer.socket.send(streamer.pending)
+            streamer.pending = streamer.pending[sent:]
+        except BlockingIOError:
+            pass
+        except OSError:
+            streamer.stop = True
 
 
 class MessageAnnouncer:
@@ -137,6 +380,12 @@ class MessageAnnouncer:
     # Value is the specific streamer that we use to send our message to front-end
     streamers: dict[str, SSEStreamer] = {}
 
+    # All streamers read messages from this hub
+    hub: SSEHub = SSEHub()
+
+    # Streamers whose connections are taken over from waitress are served by this dispatcher
+    dispatcher: SSEDispatcher = SSEDispatcher(hub)
+
     # Lock to maintain that we are not modifying streamer while reading it at the same time.
     # Though it rarely happens, we still want to avoid returning a *dead* streamer to caller.
     streamer_lock: threading.Lock = threading.Lock()
@@ -170,9 +419,22 @@ class MessageAnnouncer:
             # they will try to pull message from streamer. Resulting in message loss.
             cls.remove_streamer(uuid)
 
-            cls.streamers[uuid] = SSEStreamer(uuid)
+            cls.streamers[uuid] = SSEStreamer(uuid, cls.hub)
             return cls.streamers[uuid]
 
+    @classmethod
+    def dispatch_streamer(cls, streamer: SSEStreamer, environ: dict) -> bool:
+        """
+        Serve streamer by `SSEDispatcher`, so that it does not hold the request thread
+        :return: False if its connection cannot be taken over, then `streamer.stream()` must be returned as response
+        """
+        sock = SSEDispatcher.take_over_connection(environ)
+        if sock is None:
+            return False
+
+        cls.dispatcher.add(streamer, sock)
+        return True
+
     @classmethod
     def announce(cls, event: EventBackgroundAnnounce):
         """
@@ -181,8 +443,19 @@ class MessageAnnouncer:
         """
 
         sse_message = SSEMessage.from_background_event(event)
-        for streamer in cls.streamers.values():
-            streamer.add_message(sse_message)
+        cls.hub.publish(sse_message, coalesce_key=get_coalesce_key(event))
+        cls.dispatcher.wakeup()
+
+    @classmethod
+    def get_stats(cls) -> dict[str, int]:
+        """Number of connected clients and messages"""
+
+        return {
+            'connected_clients': len(cls.streamers),
+            'published_messages': cls.hub.published_messages,
+            'coalesced_messages': cls.hub.coalesced_messages,
+            'dropped_messages': cls.hub.dropped_messages,
+        }
 
     @staticmethod
     def notify_progress(percent):
@@ -193,7 +466,14 @@ class MessageAnnouncer:
             def wrapper(*args, **kwargs):
                 try:
                     result = fn(*args, **kwargs)
-                    EventQueue.put(EventBackgroundAnnounce(data=percent, event=AnnounceEvent.SHOW_GRAPH))
+                    # progress of a request replaces only its own older progress, a thread serves one request at a time
+                    EventQueue.put(
+                        EventBackgroundAnnounce(
+                            data=percent,
+                            event=AnnounceEvent.SHOW_GRAPH,
+                            job_id=f'request_{threading.get_ident()}',
+                        ),
+                    )
                 except Exception as e:
                     raise e
 
@@ -243,3 +523,5 @@ class MessageAnnouncer:
         streamer = cls.streamers.pop(uuid, None)
         if streamer is not None:
             streamer.stop = True
+            if streamer.socket is not None:
+                cls.dispatcher.wakeup()
@@ -23,6 +23,101 @@ from ap.common.logger import log_execution_time
 from ap.common.sigificant_digit import signify_digit
 
 
+class WindowStatistics:
+    """Order statistics of finite values of one threshold window (act_from ~ act_to)
+
+    `array_y` keeps original order, so that sum-based statistics (mean, std) are bit-identical to
+    calculating them on the window slice. `sorted_y` is taken from the column sorted once, and answers
+    quantiles, min/max, mode and threshold counts without sorting again.
+    """
+
+    def __init__(self, df_threshold: pd.DataFrame, array_y: Series, sorted_y: np.ndarray):
+        self.df_threshold = df_threshold
+        self.array_y = array_y
+        self.sorted_y = sorted_y
+        self._mode = None
+        self._is_mode_calculated = False
+
+    @property
+    def size(self):
+        return self.sorted_y.size
+
+    def count_ge(self, value) -> int:
+        """Number of values >= value"""
+        return int(self.size - np.searchsorted(self.sorted_y, value, side='left'))
+
+    def count_le(self, value) -> int:
+        """Number of values <= value"""
+        return int(np.searchsorted(self.sorted_y, value, side='right'))
+
+    def count_gt(self, value) -> int:
+        """Number of values > value"""
+        return int(self.size - np.searchsorted(self.sorted_y, value, side='right'))
+
+    def count_lt(self, value) -> int:
+        """Number of values < value"""
+        return int(np.searchsorted(self.sorted_y, value, side='left'))
+
+    def max(self):
+        return self.sorted_y[-1].item() if self.size else None
+
+    def min(self):
+        return self.sorted_y[0].item() if self.size else None
+
+    def percentile(self, q):
+        return np.percentile(self.sorted_y, q)
+
+    def mode(self):
+        """Smallest most frequent value, same as `get_mode`"""
+        if not self._is_mode_calculated:
+            self._is_mode_calculated = True
+            if self.size:
+                run_starts = np.concatenate([[0], np.flatnonzero(self.sorted_y[1:] != self.sorted_y[:-1]) + 1])
+                run_lengths = np.diff(np.append(run_starts, self.size))
+                self._mode = self.sorted_y[run_starts[np.argmax(run_lengths)]]
+
+        return self._mode
+
+
+class SummaryStatisticsEngine:
+    """Sort finite values of a chart once and answer summary queries of all threshold windows from it
+
+    Windows are cached by their (act_from, act_to) range, so chart infos that share the same period only
+    differ in threshold counts, which are O(log n) lookups on the sorted values.
+    """
+
+    ALL_WINDOW = 'all'
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        is_finite = np.isfinite(df[ARRAY_Y].to_numpy())
+        self.finite_idxs = np.flatnonzero(is_finite)
+        finite_y = df[ARRAY_Y].to_numpy()[self.finite_idxs]
+        self.sort_order = np.argsort(finite_y, kind='stable')
+        self.sorted_y = finite_y[self.sort_order]
+        self.windows = {}
+
+    def get_window(self, act_from=None, act_to=None) -> WindowStatistics:
+        """Get statistics of rows in [act_from, act_to). If both are None, get statistics of all rows"""
+        key = self.ALL_WINDOW if act_from is None and act_to is None else (act_from, act_to)
+        if key in self.windows:
+            return self.windows[key]
+
+        if key == self.ALL_WINDOW:
+            df_threshold = self.df
+            sorted_y = self.sorted_y
+        else:
+            is_in_window = ((self.df[ARRAY_X] >= act_from) & (self.df[ARRAY_X] < act_to)).to_numpy()
+            df_threshold = self.df[is_in_window]
+            # keep sorted order, no need to sort again
+            sorted_y = self.sorted_y[is_in_window[self.finite_idxs][self.sort_order]]
+
+        array_y = df_threshold.loc[np.isfinite(df_threshold[ARRAY_Y]), ARRAY_Y]
+        window = WindowStatistics(df_threshold, array_y, sorted_y)
+        self.windows[key] = window
+        return window
+
+
 @log_execution_time()
 def calc_summary_elements(plot):
     none_ids = plot.get(NONE_IDXS)
@@ -54,17 +149,20 @@ def calc_summary_elements(plot):
     #     return [empty_summary]
 
     df[ARRAY_Y] = convert_series_to_number(df[ARRAY_Y])
-    array_y_num = df.loc[np.isfinite(df[ARRAY_Y]), ARRAY_Y]
+
+    # sort values once for all threshold windows
+    engine = SummaryStatisticsEngine(df)
+    all_window = engine.get_window()
 
     # calc overflow lower/upper
     num_over_upper = None
     num_over_lower = None
-    overflow_lower, overflow_upper = calc_overflow_boundary(array_y_num)
+    overflow_lower, overflow_upper = calc_overflow_boundary(all_window.sorted_y)
     if overflow_upper is not None and overflow_lower is not None:
         overflow_upper = float(overflow_upper)
         overflow_lower = float(overflow_lower)
-        num_over_upper = array_y_num[array_y_num > overflow_upper].size
-        num_over_lower = array_y_num[array_y_num < overflow_lower].size
+        num_over_upper = all_window.count_gt(overflow_upper)
+        num_over_lower = all_window.count_lt(overflow_lower)
 
     x_not_none = df.loc[df[ARRAY_X].notna(), ARRAY_X]
     min_x = x_not_none.min()
@@ -91,14 +189,15 @@ def calc_summary_elements(plot):
             act_to_formatted = reformat_dt_str('9999-01-01', DATE_FORMAT_STR)
 
         if (not act_from and not act_to) or (act_from_formatted <= min_x and max_x <= act_to_formatted):
-            df_threshold = df
+            window = all_window
         else:
-            df_threshold = df[(df[ARRAY_X] >= act_from_formatted) & (df[ARRAY_X] < act_to_formatted)]
+            window = engine.get_window(act_from_formatted, act_to_formatted)
 
+        df_threshold = window.df_threshold
         count_unlinked = len(df_threshold[df_threshold[ARRAY_X].isna()])
 
-        array_y_th = df_threshold.loc[np.isfinite(df_threshold[ARRAY_Y]), ARRAY_Y]
-        mode = get_mode(array_y_th)
+        array_y_th = window.array_y
+        mode = window.mode()
 
         # count process
         ntotal = len(df_threshold)
@@ -108,9 +207,9 @@ def calc_summary_elements(plot):
         pn_minus = 0
         pn_plus = 0
         if th_high is not None:
-            pn_plus = array_y_th[array_y_th >= th_high].size
+            pn_plus = window.count_ge(th_high)
         if th_low is not None:
-            pn_minus = array_y_th[array_y_th <= th_low].size
+            pn_minus = window.count_le(th_low)
         pn = pn_minus + pn_plus
         if ntotal:
             p = (pn / ntotal) * 100
@@ -123,9 +222,9 @@ def calc_summary_elements(plot):
         pn_proc_minus = 0
         pn_proc_plus = 0
         if th_high_process is not None:
-            pn_proc_plus = array_y_th[array_y_th >= th_high_process].size
+            pn_proc_plus = window.count_ge(th_high_process)
         if th_low_process is not None:
-            pn_proc_minus = array_y_th[array_y_th <= th_low_process].size
+            pn_proc_minus = window.count_le(th_low_process)
         pn_proc = pn_proc_minus + pn_proc_plus
         if ntotal:
             p_proc = (pn_proc / ntotal) * 100
@@ -192,8 +291,8 @@ def calc_summary_elements(plot):
         p5 = None
 
         if array_y_th.size:
-            max_input_arr = array_y_th.max()
-            min_input_arr = array_y_th.min()
+            max_input_arr = window.max()
+            min_input_arr = window.min()
 
         iqr = None
         whisker_lower = None
@@ -210,7 +309,7 @@ def calc_summary_elements(plot):
         t_n_stats = 0
         if array_y_th.size:
             # non parametric process
-            p5, p25, median, p75, p95 = np.percentile(array_y_th, [5, 25, 50, 75, 95])
+            p5, p25, median, p75, p95 = window.percentile([5, 25, 50, 75, 95])
             iqr = p75 - p25
             whisker_lower = p25 - 1.5 * iqr
             whisker_upper = p75 + 1.5 * iqr
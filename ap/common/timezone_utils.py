@@ -364,6 +364,21 @@ def from_utc_to_localtime(input_datetime, local_timezone, is_simple_fmt=True):
         return time_value
 
 
+def from_utc_to_localtime_series(input_datetimes: pd.Series, local_timezone) -> pd.Series:
+    """
+    Vectorized `from_utc_to_localtime` for a whole column of utc datetime strings
+    Args:
+        input_datetimes: 2019-12-31 15:00:00, ...
+        local_timezone: Asia/Tokyo
+    Returns: 2020-01-01 00:00:00+09:00, ... as tz aware datetime series
+    """
+    try:
+        utc_datetimes = pd.to_datetime(input_datetimes, format=DATE_FORMAT_SIMPLE, utc=True)
+    except ValueError:
+        utc_datetimes = pd.to_datetime(input_datetimes, format='mixed', utc=True)
+    return utc_datetimes.dt.tz_convert(tz.gettz(local_timezone))
+
+
 def get_datetime_from_str(str_datetime):
     try:
         dt_obj = parser.parse(str_datetime)
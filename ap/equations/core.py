@@ -3,7 +3,9 @@ from __future__ import annotations
 import contextlib
 import logging
 import re
+import string
 from abc import abstractmethod
+from collections.abc import Callable
 from typing import Any, ClassVar, Optional
 
 import numpy as np
@@ -38,6 +40,28 @@ BOOLEAN_DICT_VALUES = {
 FUNCTION_DATE_FORMAT = '%Y-%m-%d'
 FUNCTION_TIME_FORMAT = '%H:%M:%S.%f'
 
+# strftime directives by the finest time unit they depend on, ordered from coarse to fine
+STRFTIME_RESOLUTIONS = {
+    'D': 'aAbBCdDeFgGhjmuUVwWxyY',
+    'h': 'HIklp',
+    'min': 'MR',
+    's': 'crSTX',
+    'us': 'f',
+}
+
+# zero padded numeric strftime directives: (DatetimeIndex attribute, width)
+STRFTIME_NUMERIC_DIRECTIVES = {
+    'Y': ('year', 4),
+    'y': ('year', 2),
+    'm': ('month', 2),
+    'd': ('day', 2),
+    'j': ('dayofyear', 3),
+    'H': ('hour', 2),
+    'M': ('minute', 2),
+    'S': ('second', 2),
+    'f': ('microsecond', 6),
+}
+
 
 class FunctionInfo(BaseModel):
     id: int
@@ -162,15 +186,202 @@ def get_data_encoding_type_from_series(series: pd.Series) -> DataTypeEncode:
     return DataTypeEncode.NULL
 
 
+def factorize_with_na(series: pd.Series) -> tuple[np.ndarray, list]:
+    """
+    Codes and distinct values of series, NA is the last distinct value
+    """
+    codes, uniques = pd.factorize(series)
+    codes[codes == -1] = len(uniques)
+    return codes, [*uniques, pd.NA]
+
+
+def map_distinct_values(series: pd.Series, func: Callable[[Any], Any], dtype: Any = None) -> pd.Series:
+    """
+    Same as ``series.apply(func)`` but ``func`` is called once per distinct value (and once for NA).
+    Only use for typed series, values of object series can be equal but have different representation (1, 1.0, True)
+    :param series:
+    :param func:
+    :param dtype: build result in this dtype if possible, otherwise result is object series
+    :return:
+    """
+    codes, uniques = factorize_with_na(series)
+    results = [func(value) for value in uniques]
+
+    if dtype is not None:
+        with contextlib.suppress(TypeError, ValueError, OverflowError):
+            return pd.Series(pd.array(results, dtype=dtype).take(codes), index=series.index)
+
+    object_results = np.empty(len(results), dtype=object)
+    object_results[:] = results
+    return pd.Series(object_results[codes], index=series.index)
+
+
+def lookup_timezone_offsets(
+    times: pd.Series,
+    to_offsets: Callable[[pd.DatetimeIndex], pd.TimedeltaIndex],
+    freqs: tuple[str, ...] = ('D', 'h'),
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Timezone offsets of times, looked up once per distinct day.
+    Days that offset changes within are looked up again per hour.
+    :param times: tz-naive times
+    :param to_offsets: get offsets of times
+    :param freqs: periods from coarse to fine
+    :return: offsets, boolean array indicated that offset changes within the finest period (must be converted one by one)
+    """
+    freq, *finer_freqs = freqs
+    codes, periods = pd.factorize(times.dt.floor(freq))
+    last_moments = periods + (pd.Timedelta(1, unit=freq) - pd.Timedelta(1, unit=periods.unit))
+    start_offsets = to_offsets(periods).to_numpy()
+    end_offsets = to_offsets(last_moments).to_numpy()
+
+    # NaT is the last one
+    offsets = np.append(start_offsets, start_offsets.dtype.type('NaT'))[codes]
+    is_changed = np.append(start_offsets != end_offsets, False)[codes]
+    if finer_freqs and is_changed.any():
+        offsets[is_changed], is_changed[is_changed] = lookup_timezone_offsets(
+            times.loc[is_changed],
+            to_offsets,
+            tuple(finer_freqs),
+        )
+
+    return offsets, is_changed
+
+
+def to_wall_time(series: pd.Series) -> pd.Series:
+    """
+    Drop timezone of datetime series but keep local time.
+    Pandas converts ``tzlocal`` element by element, offsets are looked up by day or hour instead
+    """
+    timezone = series.dt.tz
+    if timezone is None:
+        return series
+
+    if not isinstance(timezone, tz.tzlocal):
+        return series.dt.tz_localize(None)
+
+    utc_times = series.dt.tz_convert('UTC').dt.tz_localize(None)
+    offsets, is_changed = lookup_timezone_offsets(
+        utc_times,
+        lambda times: times.tz_localize('UTC').tz_convert(timezone).tz_localize(None) - times,
+    )
+    wall_times = utc_times + offsets
+
+    # daylight saving time changes within these hours
+    if is_changed.any():
+        wall_times.loc[is_changed] = series.loc[is_changed].dt.tz_localize(None)
+
+    return wall_times
+
+
+def localize_wall_time(series: pd.Series, timezone: Any) -> pd.Series:
+    """
+    Same as ``series.dt.tz_localize(timezone)``.
+    Pandas converts ``tzlocal`` element by element, offsets are looked up by day or hour instead
+    """
+    if not isinstance(timezone, tz.tzlocal) or series.dt.tz is not None:
+        return series.dt.tz_localize(timezone)
+
+    offsets, is_changed = lookup_timezone_offsets(
+        series,
+        lambda times: times - times.tz_localize(timezone).tz_convert('UTC').tz_localize(None),
+    )
+    utc_times = series - offsets
+
+    # daylight saving time changes within these hours
+    if is_changed.any():
+        utc_times.loc[is_changed] = (
+            series.loc[is_changed].dt.tz_localize(timezone).dt.tz_convert('UTC').dt.tz_localize(None)
+        )
+
+    return utc_times.dt.tz_localize('UTC').dt.tz_convert(timezone)
+
+
+def get_strftime_resolution(date_format: str) -> str | None:
+    """
+    Finest time unit used by strftime format, None if format uses timezone or unknown directives
+    """
+    resolution = 'D'
+    for directive in re.findall(r'%(.)', date_format):
+        if directive == '%':
+            continue
+
+        for freq, directives in STRFTIME_RESOLUTIONS.items():
+            if directive in directives:
+                resolution = max(resolution, freq, key=list(STRFTIME_RESOLUTIONS).index)
+                break
+        else:
+            return None
+
+    return resolution
+
+
+def format_numeric_datetime(times: pd.DatetimeIndex, date_format: str) -> np.ndarray | None:
+    """
+    Vectorized strftime for formats that only have zero padded numeric directives (e.g: %Y%m%d, %H:%M:%S.%f).
+    Characters of each row are written to a fixed width code point matrix, which is viewed as string array.
+    :return: formatted strings, None if format is not supported
+    """
+    tokens = re.split(r'(%.)', date_format)
+    if tokens[-1].endswith('%') or (times.year.min() < 1000 or times.year.max() > 9999):
+        return None
+
+    columns = []
+    for token in tokens:
+        if not token.startswith('%') or token == '%%':
+            columns.extend(np.full(len(times), ord(char), dtype=np.uint32) for char in token.replace('%%', '%'))
+            continue
+
+        if token[1] not in STRFTIME_NUMERIC_DIRECTIVES:
+            return None
+
+        attr, width = STRFTIME_NUMERIC_DIRECTIVES[token[1]]
+        values = getattr(times, attr).to_numpy(dtype=np.int64)
+        digits = []
+        for _ in range(width):
+            digits.append((values % 10 + ord('0')).astype(np.uint32))
+            values = values // 10
+        columns.extend(reversed(digits))
+
+    if not columns:
+        return None
+
+    chars = np.column_stack(columns)
+    return chars.view(f'<U{chars.shape[1]}').ravel().astype(object)
+
+
+def strftime_series(series: pd.Series, date_format: str) -> pd.Series:
+    """
+    Same as ``series.dt.strftime(date_format)``.
+    Timestamps are truncated to the finest unit used by format, then each distinct value is formatted once
+    """
+    resolution = get_strftime_resolution(date_format)
+    if resolution is None:
+        return series.dt.strftime(date_format)
+
+    # format result only depends on wall time
+    codes, uniques = pd.factorize(to_wall_time(series).dt.floor(resolution))
+    results = np.empty(len(uniques) + 1, dtype=object)
+    formatted = format_numeric_datetime(uniques, date_format)
+    results[:-1] = uniques.strftime(date_format) if formatted is None else formatted
+    results[-1] = np.nan
+    return pd.Series(results[codes], index=series.index)
+
+
 class BaseFunction(BaseModel):
     EXCLUDE_VARS: ClassVar[list[str]] = ['type_cast']
+    # result of a row only depends on values of that row, it can be computed for any subset of rows
+    IS_ROW_WISE: ClassVar[bool] = True
     type_cast: Optional[str] = None
 
     @classmethod
     def from_kwargs(cls, **kwargs) -> 'BaseFunction':
-        existed_required_kwargs = {k: v for k, v in kwargs.items() if k in cls.required_coefficients()}
-        missing_required_kwargs = {k: None for k in cls.required_coefficients() if k not in existed_required_kwargs}
-        optional_kwargs = {k: v for k, v in kwargs.items() if k in cls.optional_coefficients()}
+        # json schema of model is generated on each call, do not call them for each kwarg
+        required_coefficients = cls.required_coefficients()
+        optional_coefficients = cls.optional_coefficients()
+        existed_required_kwargs = {k: v for k, v in kwargs.items() if k in required_coefficients}
+        missing_required_kwargs = {k: None for k in required_coefficients if k not in existed_required_kwargs}
+        optional_kwargs = {k: v for k, v in kwargs.items() if k in optional_coefficients}
         try:
             instance = cls(**existed_required_kwargs, **missing_required_kwargs, **optional_kwargs)
         except pydantic.ValidationError as exc:
@@ -265,69 +476,98 @@ class BaseFunction(BaseModel):
             )
         return output_data_type
 
-    def evaluate(
+    def cast_input_series(
         self,
-        df: pd.DataFrame,
-        out_col: str,
-        x_col: str | None = None,
-        y_col: str | None = None,
+        series_x: pd.Series | None = None,
+        series_y: pd.Series | None = None,
         x_dtype: str | None = None,
         y_dtype: str | None = None,
-    ):
-        if df.empty:
-            result_series = pd.Series([])
-        else:
-            df = df.reset_index(drop=True)
-            m_function = self.get_function_orm()
+    ) -> tuple[pd.Series | None, pd.Series | None]:
+        m_function = self.get_function_orm()
 
+        if m_function.has_x():
+            if series_x is None:
+                raise FunctionFieldError('Missing var').add_error(
+                    ErrorField(function_type=self.function_type(), field='X', msg='Missing X'),
+                )
+
+            possible_types = (
+                [m_function.get_x_data_type(x_data_type=x_dtype)]
+                if x_dtype is not None
+                else m_function.get_possible_x_types()
+            )
+            series_x = try_cast_series(series_x, possible_types)
+        else:
             series_x = None
-            if m_function.has_x():
-                if x_col is None:
-                    raise FunctionFieldError('Missing var').add_error(
-                        ErrorField(function_type=self.function_type(), field='X', msg='Missing X'),
-                    )
 
-                possible_types = (
-                    [m_function.get_x_data_type(x_data_type=x_dtype)]
-                    if x_dtype is not None
-                    else m_function.get_possible_x_types()
+        if m_function.has_y():
+            if series_y is None:
+                raise FunctionFieldError('Missing var').add_error(
+                    ErrorField(function_type=self.function_type(), field='Y', msg='Missing Y'),
                 )
-                series_x = try_cast_series(df[x_col], possible_types)
 
+            possible_types = (
+                [m_function.get_y_data_type(y_data_type=y_dtype)]
+                if y_dtype is not None
+                else m_function.get_possible_y_types()
+            )
+            series_y = try_cast_series(series_y, possible_types)
+        else:
             series_y = None
-            if m_function.has_y():
-                if y_col is None:
-                    raise FunctionFieldError('Missing var').add_error(
-                        ErrorField(function_type=self.function_type(), field='Y', msg='Missing Y'),
-                    )
 
-                possible_types = (
-                    [m_function.get_y_data_type(y_data_type=y_dtype)]
-                    if y_dtype is not None
-                    else m_function.get_possible_y_types()
-                )
-                series_y = try_cast_series(df[y_col], possible_types)
-
-            result_series = self.eval_to_series(series_x=series_x, series_y=series_y)
+        return series_x, series_y
 
+    def cast_output_series(
+        self,
+        result_series: pd.Series,
+        x_dtype: str | None = None,
+        y_dtype: str | None = None,
+    ) -> pd.Series:
         raw_output_type = self.get_output_type(x_data_type=x_dtype, y_data_type=y_dtype)
         output_dtype = RawDataTypeDB.get_pandas_dtype(raw_output_type.value)
-        result_series = result_series.convert_dtypes()
 
-        maybe_none_result_series = try_cast_series_pd_types(result_series, [output_dtype])
-        if maybe_none_result_series is None:
-            logger.error(
-                f'Function {self.__class__.__name__}:'
-                f'cannot cast output from `{result_series.dtype}` to `{output_dtype}',
-            )
-        if maybe_none_result_series is not None:
-            result_series = maybe_none_result_series
+        # result is already in output type (e.g. arithmetic on typed series), converting it is redundant
+        if result_series.dtype != output_dtype:
+            result_series = result_series.convert_dtypes()
+
+            maybe_none_result_series = try_cast_series_pd_types(result_series, [output_dtype])
+            if maybe_none_result_series is None:
+                logger.error(
+                    f'Function {self.__class__.__name__}:'
+                    f'cannot cast output from `{result_series.dtype}` to `{output_dtype}',
+                )
+            if maybe_none_result_series is not None:
+                result_series = maybe_none_result_series
 
         # must change null string to NA
         if raw_output_type == RawDataTypeDB.TEXT:
             result_series = result_series.replace(to_replace=EMPTY_STRING, value=pd.NA)
 
-        df[out_col] = result_series
+        return result_series
+
+    def evaluate(
+        self,
+        df: pd.DataFrame,
+        out_col: str,
+        x_col: str | None = None,
+        y_col: str | None = None,
+        x_dtype: str | None = None,
+        y_dtype: str | None = None,
+    ):
+        if df.empty:
+            result_series = pd.Series([])
+        else:
+            df = df.reset_index(drop=True)
+            m_function = self.get_function_orm()
+            series_x, series_y = self.cast_input_series(
+                series_x=df[x_col] if m_function.has_x() and x_col is not None else None,
+                series_y=df[y_col] if m_function.has_y() and y_col is not None else None,
+                x_dtype=x_dtype,
+                y_dtype=y_dtype,
+            )
+            result_series = self.eval_to_series(series_x=series_x, series_y=series_y)
+
+        df[out_col] = self.cast_output_series(result_series, x_dtype=x_dtype, y_dtype=y_dtype)
 
         return df
 
@@ -468,7 +708,9 @@ class HexToDec(BaseFunction):
         series_x: pd.Series | None = None,
         series_y: pd.Series | None = None,
     ) -> pd.Series | np.NDArray:
-        return series_x.apply(self._convert)
+        if pd.api.types.is_object_dtype(series_x):
+            return series_x.apply(self._convert)
+        return map_distinct_values(series_x, self._convert, dtype=pd.Int64Dtype())
 
 
 class HexToBin(BaseFunction):
@@ -485,7 +727,9 @@ class HexToBin(BaseFunction):
         series_x: pd.Series | None = None,
         series_y: pd.Series | None = None,
     ) -> pd.Series | np.NDArray:
-        return series_x.apply(self._convert)
+        if pd.api.types.is_object_dtype(series_x):
+            return series_x.apply(self._convert)
+        return map_distinct_values(series_x, self._convert, dtype=pd.StringDtype())
 
 
 class HexToLogical(BaseFunction):
@@ -499,6 +743,9 @@ class HexToLogical(BaseFunction):
     ) -> pd.Series | np.NDArray:
         result = HexToDec().eval_to_series(series_x=series_x, series_y=series_y)
         nth_bit = 2 ** (int(self.n) - 1)
+        if pd.api.types.is_integer_dtype(result) and isinstance(nth_bit, int) and nth_bit <= np.iinfo(np.int64).max:
+            return (result & nth_bit) != 0
+
         is_na = result.isna()
         result.loc[~is_na] = (result[~is_na] & nth_bit) != 0
         return result
@@ -611,7 +858,6 @@ class CategoryGeneration(BaseFunction):
 
     def apply_format(self, x: Any, y: Any) -> str | None:
         """
-        This function is slow because we use lambda instead of vectorization
         Try to parse x, y as empty string if it is None.
         However, in case the format is specified for number (e.g: {:02d}), we can only return None if x or y is None
         """
@@ -622,6 +868,65 @@ class CategoryGeneration(BaseFunction):
 
         return None
 
+    def get_plain_format_fields(self) -> tuple[list[str], list[int]] | None:
+        """
+        Literal texts and argument index (0 for X, 1 for Y) of format fields,
+        None if s has format spec, conversion or attribute access (e.g: {:02d}, {!r}, {0.real})
+        """
+        try:
+            parsed_fields = list(string.Formatter().parse(self.s))
+        except ValueError:
+            return None
+
+        literals = [EMPTY_STRING]
+        field_names = []
+        for literal, field_name, format_spec, conversion in parsed_fields:
+            literals[-1] += literal
+            if field_name is None:
+                continue
+            if format_spec or conversion:
+                return None
+            field_names.append(field_name)
+            literals.append(EMPTY_STRING)
+
+        if all(field_name == EMPTY_STRING for field_name in field_names) and len(field_names) <= 2:
+            return literals, list(range(len(field_names)))
+
+        if all(field_name in ('0', '1') for field_name in field_names):
+            return literals, [int(field_name) for field_name in field_names]
+
+        return None
+
+    def format_series(self, series_x: pd.Series, series_y: pd.Series) -> pd.Series:
+        """
+        Vectorized version of ``apply_format``, results of plain fields are concatenated,
+        other formats are applied once per distinct pair of x and y
+        """
+        codes_x, values_x = factorize_with_na(series_x)
+        codes_y, values_y = factorize_with_na(series_y)
+
+        plain_format_fields = self.get_plain_format_fields()
+        if plain_format_fields is not None:
+            literals, arg_indexes = plain_format_fields
+            strings = []
+            for codes, values in ((codes_x, values_x), (codes_y, values_y)):
+                value_strings = np.array(
+                    [EMPTY_STRING if pd.isna(value) else f'{value}' for value in values], dtype=object
+                )
+                strings.append(value_strings[codes])
+
+            result = np.full(len(series_x), literals[0], dtype=object)
+            for arg_index, literal in zip(arg_indexes, literals[1:]):
+                result = result + strings[arg_index] + literal
+            return pd.Series(result)
+
+        pair_codes, pairs = pd.factorize(codes_x * len(values_y) + codes_y)
+        results = np.empty(len(pairs), dtype=object)
+        results[:] = [
+            self.apply_format(values_x[pair // len(values_y)], values_y[pair % len(values_y)]) for pair in pairs
+        ]
+        return pd.Series(results[pair_codes])
+
     def eval_to_series(
         self,
         *,
@@ -631,7 +936,10 @@ class CategoryGeneration(BaseFunction):
         self.custom_validate()
         self.set_type_cast(self.t)
 
-        result = pd.Series([self.apply_format(x, y) for x, y in zip(series_x, series_y)])
+        if pd.api.types.is_object_dtype(series_x) or pd.api.types.is_object_dtype(series_y):
+            result = pd.Series([self.apply_format(x, y) for x, y in zip(series_x, series_y)])
+        else:
+            result = self.format_series(series_x, series_y)
         type_converter = TypeConvert.from_kwargs(t=self.type_cast)
         return type_converter.eval_to_series(series_x=result)
 
@@ -681,15 +989,23 @@ class DatetimeFromDateAndTime(BaseFunction):
 
         result_format = f'{date_format}{time_format}'
 
+        if not is_x_string and not is_y_string:
+            # same as parsing `date_format` of X + `time_format` of Y, without formatting to string
+            date_x = to_wall_time(series_x).dt.as_unit('ns').dt.normalize()
+            time_y = to_wall_time(series_y).dt.as_unit('ns')
+            time_y = (time_y - time_y.dt.normalize()).dt.floor('us')
+            return localize_wall_time(date_x + time_y, tz.tzlocal())
+
         # extract date format
         if not is_x_string:
-            series_x = series_x.dt.strftime(date_format)
+            series_x = strftime_series(series_x, date_format)
 
         # extract time format
         if not is_y_string:
-            series_y = series_y.dt.strftime(time_format)
+            series_y = strftime_series(series_y, time_format)
 
-        return pd.to_datetime(series_x + series_y, format=result_format, exact=True, errors='coerce').dt.tz_localize(
+        return localize_wall_time(
+            pd.to_datetime(series_x + series_y, format=result_format, exact=True, errors='coerce'),
             tz.tzlocal(),
         )
 
@@ -703,7 +1019,7 @@ class DateExtraction(BaseFunction):
         series_x: pd.Series | None = None,
         series_y: pd.Series | None = None,
     ) -> pd.Series | np.NDArray:
-        result = series_x.dt.strftime(self.s).astype(pd.StringDtype())
+        result = strftime_series(series_x, self.s).astype(pd.StringDtype())
         # try to cast result to integer
         with contextlib.suppress(ValueError, TypeError):
             result = result.astype(pd.Int64Dtype())
@@ -1181,6 +1497,7 @@ class TypeConvert(BaseFunction):
 
 
 class Shift(BaseFunction):
+    IS_ROW_WISE: ClassVar[bool] = False
     s: str
     t: str
 
@@ -1229,6 +1546,7 @@ class Shift(BaseFunction):
 
 
 class FillNa(BaseFunction):
+    IS_ROW_WISE: ClassVar[bool] = False
     s: Optional[str] = None
     t: str
 
@@ -0,0 +1,449 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import pickle
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from typing import ClassVar
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype, is_datetime64_any_dtype, is_float_dtype
+
+from ap.common.constants import CacheType
+from ap.common.memoize import CustomCache, is_stop_using_cache
+from ap.equations.core import BaseFunction
+from ap.equations.utils import get_function_class_by_id
+from ap.setting_module.models import CfgProcessColumn, CfgProcessFunctionColumn
+
+logger = logging.getLogger(__name__)
+
+# distinct input rows kept per day of a cached plan, rows out of current data are dropped when it is exceeded
+FUNCTION_COLUMN_CACHE_MAX_ROWS = 200_000
+
+# plans evaluated faster than this (seconds per row) are not cached, loading and checking cached rows costs about as much
+FUNCTION_COLUMN_CACHE_MIN_SECONDS_PER_ROW = 2e-6
+
+# measured evaluation costs kept in memory, costs of oldest plans are dropped when it is exceeded
+FUNCTION_COLUMN_COST_MAX_PLANS = 1000
+
+# inferred types of values of object input columns which are cached
+CACHED_OBJECT_TYPES = ('empty', 'string', 'integer', 'floating', 'mixed-integer-float', 'boolean')
+
+
+@dataclass
+class FunctionStep:
+    process_column_id: int
+    equation: BaseFunction
+    out_col: str
+    x_col: str | None = None
+    y_col: str | None = None
+    x_dtype: str | None = None
+    y_dtype: str | None = None
+    return_type: str | None = None
+
+
+@dataclass
+class FunctionColumnPlan:
+    """
+    Compiled evaluation plan of function columns of a process.
+
+    Function columns are ordered by their dependencies (a function column reads ``var_x`` / ``var_y``,
+    which may be other function columns), every step is evaluated once on typed series and
+    chained steps (``me`` functions, function columns that read function columns) consume the output
+    of the previous step directly, without writing it back to the dataframe and casting it again.
+    Only ``output_cols`` are written to the dataframe, intermediate results are dropped.
+    """
+
+    steps: list[FunctionStep] = field(default_factory=list)
+    output_cols: list[str] = field(default_factory=list)
+    input_cols: list[str] = field(default_factory=list)
+
+    # evaluation seconds per row of plans by process id and fingerprint, measured when new rows are evaluated
+    evaluation_seconds: ClassVar[dict[tuple[int, str], float]] = {}
+
+    @classmethod
+    def compile(
+        cls,
+        dic_columns: dict[int, CfgProcessColumn],
+        target_col_ids: Iterable[int],
+        get_label: Callable[[CfgProcessColumn], str],
+    ) -> FunctionColumnPlan:
+        """
+        Build plan for target function columns
+        :param dic_columns: all columns of process by id
+        :param target_col_ids: columns that must be written to dataframe. Normal columns are ignored
+        :param get_label: column label in dataframe
+        :return: plan
+        """
+        target_cols = [dic_columns[col_id] for col_id in target_col_ids if col_id in dic_columns]
+        target_cols = [col for col in target_cols if col.function_details]
+
+        sorted_cols = []
+        visited = set()
+
+        def min_order(col: CfgProcessColumn) -> int:
+            return min(function_detail.order for function_detail in col.function_details)
+
+        def visit(col: CfgProcessColumn):
+            if col.id in visited:
+                return
+            visited.add(col.id)
+
+            dependencies = set()
+            for function_detail in col.function_details:
+                dependencies.update(var for var in (function_detail.var_x, function_detail.var_y) if var is not None)
+            dependencies.discard(col.id)
+
+            dependency_cols = [dic_columns[col_id] for col_id in dependencies if col_id in dic_columns]
+            dependency_cols = [dependency_col for dependency_col in dependency_cols if dependency_col.function_details]
+            for dependency_col in sorted(dependency_cols, key=min_order):
+                visit(dependency_col)
+
+            sorted_cols.append(col)
+
+        for col in sorted(target_cols, key=min_order):
+            visit(col)
+
+        # data type of a function column changes after each step
+        dic_dtypes = {col_id: col.raw_data_type for col_id, col in dic_columns.items()}
+        function_col_ids = {col.id for col in sorted_cols}
+        steps = []
+        input_cols = []
+        for col in sorted_cols:
+            function_details: list[CfgProcessFunctionColumn] = sorted(col.function_details, key=lambda x: x.order)
+            for function_detail in function_details:
+                equation_class = get_function_class_by_id(function_detail.function_id)
+                equation = equation_class.from_kwargs(**function_detail.as_dict())
+                cfg_col_x = dic_columns.get(function_detail.var_x)
+                cfg_col_y = dic_columns.get(function_detail.var_y)
+                step = FunctionStep(
+                    process_column_id=col.id,
+                    equation=equation,
+                    out_col=get_label(col),
+                    x_col=get_label(cfg_col_x) if cfg_col_x else None,
+                    y_col=get_label(cfg_col_y) if cfg_col_y else None,
+                    x_dtype=dic_dtypes.get(cfg_col_x.id) if cfg_col_x else None,
+                    y_dtype=dic_dtypes.get(cfg_col_y.id) if cfg_col_y else None,
+                    return_type=function_detail.return_type,
+                )
+                steps.append(step)
+                dic_dtypes[col.id] = function_detail.return_type
+
+                for cfg_col in (cfg_col_x, cfg_col_y):
+                    if cfg_col and cfg_col.id not in function_col_ids and get_label(cfg_col) not in input_cols:
+                        input_cols.append(get_label(cfg_col))
+
+        output_cols = [get_label(col) for col in sorted_cols if col in target_cols]
+        return cls(steps=steps, output_cols=output_cols, input_cols=input_cols)
+
+    def get_return_types(self) -> dict[int, str]:
+        """
+        Data type of each function column after all its steps
+        """
+        return {step.process_column_id: step.return_type for step in self.steps}
+
+    def is_row_wise(self) -> bool:
+        """
+        Whether every step only reads input columns or outputs of previous steps and every function is row-wise,
+        so that outputs can be computed for any subset of rows
+        """
+        available_cols = set(self.input_cols)
+        for step in self.steps:
+            if not step.equation.IS_ROW_WISE:
+                return False
+            m_function = step.equation.get_function_orm()
+            if m_function.has_x() and step.x_col not in available_cols:
+                return False
+            if m_function.has_y() and step.y_col not in available_cols:
+                return False
+            available_cols.add(step.out_col)
+        return True
+
+    def fingerprint(self) -> str:
+        """
+        Hash of plan definition: functions, coefficients, variables and data types of all steps
+        """
+        definition = [
+            (
+                step.equation.__class__.__name__,
+                step.equation.model_dump(),
+                step.out_col,
+                step.x_col,
+                step.y_col,
+                step.x_dtype,
+                step.y_dtype,
+                step.return_type,
+            )
+            for step in self.steps
+        ]
+        definition.append((self.output_cols, self.input_cols))
+        return hashlib.sha1(pickle.dumps(definition), usedforsecurity=False).hexdigest()
+
+    def evaluate(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not self.steps:
+            return df
+
+        if df.empty:
+            return self.evaluate_by_steps(df)
+
+        df = df.reset_index(drop=True)
+        dic_results = self.evaluate_results(df)
+        return self.write_results(df, dic_results)
+
+    def evaluate_with_cache(self, df: pd.DataFrame, process_id: int, time_col: str | None = None) -> pd.DataFrame:
+        """
+        Same as ``evaluate`` but outputs are memoized on disk per distinct input row, in one cache entry per day.
+        Rows are addressed by hash of their input values (there is no stable row id for every process of a trace),
+        a request only loads entries of its days and only evaluates input rows which are not cached yet
+        (e.g. newly imported data). Cached rows are used only if their input values are equal.
+        Non row-wise plans (shift, fillna), plans which are evaluated faster than cache is loaded,
+        object inputs of mixed types and requests which must not use cache are always evaluated.
+        :param df: dataframe
+        :param process_id: process of function columns
+        :param time_col: time column of process, rows are cached by its day
+        :return: dataframe with output columns
+        """
+        if not self.steps or df.empty or not self.is_row_wise() or is_stop_using_cache():
+            return self.evaluate(df)
+
+        fingerprint = self.fingerprint()
+        cost_key = (process_id, fingerprint)
+        if self.evaluation_seconds.get(cost_key, np.inf) < FUNCTION_COLUMN_CACHE_MIN_SECONDS_PER_ROW:
+            return self.evaluate(df)
+
+        df = df.reset_index(drop=True)
+        df_inputs = df[self.input_cols]
+        input_types = self.get_input_types(df_inputs)
+        if input_types is None:
+            return self.evaluate(df)
+
+        row_hashes = pd.util.hash_pandas_object(df_inputs, index=False).to_numpy()
+        days = get_days(df[time_col]) if time_col in df.columns else np.zeros(len(df), dtype=np.int64)
+        day_codes, day_keys = pd.factorize(days, use_na_sentinel=False)
+        dic_day_rows = pd.Series(day_codes).groupby(day_codes).indices
+        cache_keys = [self.gen_cache_key(process_id, fingerprint, input_types, day) for day in day_keys.tolist()]
+        dic_cached = {code: CustomCache.get(cache_keys[code]) for code in dic_day_rows}
+
+        # position of each row in cached rows of its day, followed by evaluated new rows
+        sources = []
+        offset = 0
+        positions = np.full(len(df), -1, dtype=np.int64)
+        for code, rows in dic_day_rows.items():
+            df_cached = dic_cached[code]
+            if df_cached is None:
+                continue
+
+            day_positions = df_cached.index.get_indexer(row_hashes[rows])
+            is_cached = day_positions >= 0
+            positions[rows[is_cached]] = day_positions[is_cached] + offset
+            sources.append(df_cached)
+            offset += len(df_cached)
+
+        is_new_row = positions < 0
+        df_new = None
+        evaluation_seconds = None
+        if is_new_row.any():
+            new_hashes = pd.Index(row_hashes[is_new_row])
+            is_first = ~new_hashes.duplicated()
+            started_at = time.perf_counter()
+            df_new = self.evaluate_rows(df_inputs[is_new_row][is_first], new_hashes[is_first])
+            evaluation_seconds = (time.perf_counter() - started_at) / len(df_new)
+            self.save_evaluation_seconds(cost_key, evaluation_seconds)
+            positions[is_new_row] = df_new.index.get_indexer(new_hashes) + offset
+            sources.append(df_new)
+
+        output_dtypes = sources[0][self.output_cols].dtypes
+        if any(not source[self.output_cols].dtypes.equals(output_dtypes) for source in sources):
+            # output type is inferred from data for some functions, it changed with new rows
+            logger.debug(f'Function column cache of process {process_id} has different output types, re-evaluate')
+            is_first = ~pd.Index(row_hashes).duplicated()
+            df_new = self.evaluate_rows(df_inputs[is_first], pd.Index(row_hashes[is_first]))
+            positions = df_new.index.get_indexer(row_hashes)
+            sources = [df_new]
+            is_new_row[:] = True
+            dic_cached = {}
+
+        df_source = pd.concat(sources) if len(sources) > 1 else sources[0]
+        if not is_same_values(df_inputs, df_source[self.input_cols], positions):
+            logger.warning(f'Function column cache of process {process_id} has hash collision, re-evaluate')
+            return self.evaluate(df)
+
+        if evaluation_seconds is not None and evaluation_seconds >= FUNCTION_COLUMN_CACHE_MIN_SECONDS_PER_ROW:
+            self.save_cache(cache_keys, dic_cached, dic_day_rows, is_new_row, row_hashes, df_new)
+
+        df_outputs = df_source[self.output_cols].take(positions).set_axis(df.index)
+        dic_results = {col: df_outputs[col] for col in self.output_cols}
+        return self.write_results(df, dic_results)
+
+    def get_input_types(self, df_inputs: pd.DataFrame) -> list[tuple[str, str]] | None:
+        """
+        Data type of each input column. Hash of object values does not distinguish 1 and '1',
+        so inferred type of values of object columns is a part of cache key.
+        :return: None if values of an object column have mixed types
+        """
+        input_types = []
+        for col in self.input_cols:
+            input_type = str(df_inputs[col].dtype)
+            if df_inputs[col].dtype == object:
+                inferred_type = infer_dtype(df_inputs[col], skipna=True)
+                if inferred_type not in CACHED_OBJECT_TYPES:
+                    return None
+                input_type = f'{input_type}:{inferred_type}'
+            input_types.append((col, input_type))
+        return input_types
+
+    @staticmethod
+    def gen_cache_key(process_id: int, fingerprint: str, input_types: list[tuple[str, str]], day) -> str:
+        # datetime functions depend on local timezone of server
+        key = ('function_column_results', process_id, fingerprint, input_types, time.tzname, day)
+        return hashlib.sha1(pickle.dumps(key), usedforsecurity=False).hexdigest()
+
+    def evaluate_rows(self, df_inputs: pd.DataFrame, row_hashes: pd.Index) -> pd.DataFrame:
+        """
+        :return: input values and outputs of rows, indexed by row hash
+        """
+        df_inputs = df_inputs.reset_index(drop=True)
+        dic_results = self.evaluate_results(df_inputs)
+        df_outputs = pd.DataFrame({col: dic_results[col] for col in self.output_cols}, index=df_inputs.index)
+        return pd.concat([df_inputs, df_outputs], axis=1).set_axis(row_hashes)
+
+    def save_cache(
+        self,
+        cache_keys: list[str],
+        dic_cached: dict[int, pd.DataFrame | None],
+        dic_day_rows: dict[int, np.ndarray],
+        is_new_row: np.ndarray,
+        row_hashes: np.ndarray,
+        df_new: pd.DataFrame,
+    ):
+        """
+        Add new rows of each day to its cache entry
+        """
+        dic_saving = {}
+        for code, rows in dic_day_rows.items():
+            new_hashes = pd.unique(row_hashes[rows[is_new_row[rows]]])
+            if not len(new_hashes):
+                continue
+
+            df_day = df_new.iloc[df_new.index.get_indexer(new_hashes)]
+            if dic_cached.get(code) is not None:
+                df_day = pd.concat([dic_cached[code], df_day])
+
+            if len(df_day) > FUNCTION_COLUMN_CACHE_MAX_ROWS:
+                # only keep rows of current data
+                df_day = df_day[df_day.index.isin(row_hashes[rows])]
+                if len(df_day) > FUNCTION_COLUMN_CACHE_MAX_ROWS:
+                    continue
+
+            dic_saving[cache_keys[code]] = df_day
+
+        for cache_key, df_day in dic_saving.items():
+            saved = CustomCache.set(cache_key, df_day, timeout=None, save_file=True)
+            if saved and cache_key not in CustomCache.cached_keys[CacheType.OTHER]:
+                CustomCache.cached_keys[CacheType.OTHER].append(cache_key)
+
+    @classmethod
+    def save_evaluation_seconds(cls, cost_key: tuple[int, str], seconds: float):
+        """Keep measured cost of a plan, plans which are not used anymore (e.g. edited functions) are dropped"""
+        cls.evaluation_seconds.pop(cost_key, None)
+        while len(cls.evaluation_seconds) >= FUNCTION_COLUMN_COST_MAX_PLANS:
+            cls.evaluation_seconds.pop(next(iter(cls.evaluation_seconds)), None)
+        cls.evaluation_seconds[cost_key] = seconds
+
+    def evaluate_results(self, df: pd.DataFrame) -> dict[str, pd.Series]:
+        """
+        Evaluate all steps on dataframe with default index
+        :return: result of each function column
+        """
+        dic_results: dict[str, pd.Series] = {}
+
+        def get_series(col: str | None, has_var: bool) -> pd.Series | None:
+            if col is None or not has_var:
+                return None
+            if col in dic_results:
+                return dic_results[col]
+            return df[col]
+
+        for step in self.steps:
+            m_function = step.equation.get_function_orm()
+            series_x, series_y = step.equation.cast_input_series(
+                series_x=get_series(step.x_col, m_function.has_x()),
+                series_y=get_series(step.y_col, m_function.has_y()),
+                x_dtype=step.x_dtype,
+                y_dtype=step.y_dtype,
+            )
+            result_series = step.equation.eval_to_series(series_x=series_x, series_y=series_y)
+            dic_results[step.out_col] = step.equation.cast_output_series(
+                result_series,
+                x_dtype=step.x_dtype,
+                y_dtype=step.y_dtype,
+            )
+
+        return dic_results
+
+    def write_results(self, df: pd.DataFrame, dic_results: dict[str, pd.Series]) -> pd.DataFrame:
+        # overwrite existing columns in place, append new columns at once
+        dic_new_cols = {}
+        for col in self.output_cols:
+            if col in df.columns:
+                df[col] = dic_results[col]
+            else:
+                dic_new_cols[col] = dic_results[col]
+
+        if dic_new_cols:
+            df = pd.concat([df, pd.DataFrame(dic_new_cols, index=df.index)], axis=1)
+
+        return df
+
+    def evaluate_by_steps(self, df: pd.DataFrame) -> pd.DataFrame:
+        original_cols = set(df.columns)
+        for step in self.steps:
+            df = step.equation.evaluate(
+                df,
+                out_col=step.out_col,
+                x_col=step.x_col,
+                y_col=step.y_col,
+                x_dtype=step.x_dtype,
+                y_dtype=step.y_dtype,
+            )
+
+        intermediate_cols = {step.out_col for step in self.steps} - set(self.output_cols) - original_cols
+        return df.drop(columns=list(intermediate_cols))
+
+
+def get_days(times: pd.Series) -> np.ndarray:
+    """Day of each time, text times are cut to their date part"""
+    if is_datetime64_any_dtype(times):
+        if times.dt.tz is not None:
+            times = times.dt.tz_convert(None)
+        return times.to_numpy().astype('datetime64[D]').view(np.int64)
+
+    return np.asarray(times.astype(object).to_numpy(), dtype='U10')
+
+
+def is_same_values(df_left: pd.DataFrame, df_right: pd.DataFrame, positions: np.ndarray) -> bool:
+    """Whether values of each row of left dataframe are equal to the row at the position in right dataframe"""
+    for col in df_left.columns:
+        left = get_comparable_values(df_left[col])
+        right = get_comparable_values(df_right[col])[positions]
+        is_different = left != right
+        if is_different.any():
+            # missing values are equal
+            left, right = left[is_different], right[is_different]
+            if not (pd.isna(left) & pd.isna(right)).all():
+                return False
+    return True
+
+
+def get_comparable_values(series: pd.Series) -> np.ndarray:
+    """Values as numpy array, missing values of extension arrays are None"""
+    if isinstance(series.dtype, np.dtype):
+        return series.to_numpy()
+
+    if is_float_dtype(series.dtype):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    return series.to_numpy(dtype=object, na_value=None)
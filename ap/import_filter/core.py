@@ -3,6 +3,7 @@ from __future__ import annotations
 from abc import abstractmethod
 from typing import ClassVar, Optional, Union
 
+import numpy as np
 import pandas as pd
 import pydantic
 from pydantic import BaseModel
@@ -19,6 +20,15 @@ from ap.api.trace_data.services.filter_function_condition import (
 from ap.common.constants import COL_DATA_TYPE, COL_NAME, DataType
 
 
+def to_bool_array(matched) -> np.ndarray:
+    """
+    Matched rows as numpy bool array. NA is not matched, the same as boolean indexing of pandas
+    """
+    if isinstance(matched, np.ndarray) and matched.dtype == bool:
+        return matched
+    return pd.Series(matched).to_numpy(dtype=bool, na_value=False)
+
+
 class ImportFilter(BaseModel):
     data_type: ClassVar[Union[DataType, str]] = None
     column_name: ClassVar[str] = None
@@ -83,31 +93,46 @@ class ImportFilter(BaseModel):
     @abstractmethod
     def do_filter(self, series: pd.Series, value): ...
 
-    def filter_by_combine_conditions(self, df: pd.DataFrame, column_name: str, data_type: str) -> pd.DataFrame:
-        series = self.cast_series(df[column_name], data_type=data_type, force_str=self.cast_series_value_to_string)
-        conditions = [condition.value for condition in self.values]
-        filtered_idx = self.do_filter(series, conditions)
-        return df[filtered_idx]
-
-    def filter_by_single_condition(self, df: pd.DataFrame, column_name: str, data_type: str) -> pd.DataFrame:
-        for condition in self.values:
-            series = self.cast_series(df[column_name], data_type=data_type, force_str=self.cast_series_value_to_string)
-            condition_value = condition.value
-            # cast condition value in case of MATCHES
-            if not self.cast_series_value_to_string:
-                condition_value = self.cast_condition_value(condition.value, data_type=data_type)
-            filtered_idx = self.do_filter(series, condition_value)
-            df = df[filtered_idx]
-        return df
+    def gen_conditions(self, data_type: str) -> list:
+        """
+        Condition values passed to ``do_filter``, a row is kept if it matches all of them
+        """
+        if self.should_combine_conditions:
+            return [[condition.value for condition in self.values]]
+
+        # cast condition value in case of MATCHES
+        if not self.cast_series_value_to_string:
+            return [self.cast_condition_value(condition.value, data_type=data_type) for condition in self.values]
+
+        return [condition.value for condition in self.values]
+
+    def update_mask(self, series: pd.Series, data_type: str, mask: np.ndarray) -> np.ndarray:
+        """
+        Unset rows of mask that do not match all conditions
+        @param series: column data casted by ``cast_series``, indexed by row position.
+            It can only contain rows of mask (e.g. column can not be casted for removed rows)
+        @param data_type: column data type
+        @param mask: rows kept by previous filters
+        """
+        for condition_value in self.gen_conditions(data_type):
+            # only search for remain data
+            positions = np.flatnonzero(mask)
+            remain_series = series if len(positions) == len(series) else series.loc[positions]
+            matched = to_bool_array(self.do_filter(remain_series, condition_value))
+            mask[positions[~matched]] = False
+        return mask
 
     def filter(self, df: pd.DataFrame, column_cfg: Union[dict, None] = None) -> pd.DataFrame:
         column_name = column_cfg.get(COL_NAME)
         data_type = column_cfg.get(COL_DATA_TYPE)
 
-        if self.should_combine_conditions:
-            return self.filter_by_combine_conditions(df, column_name, data_type)
-
-        return self.filter_by_single_condition(df, column_name, data_type)
+        series = self.cast_series(
+            df[column_name].reset_index(drop=True),
+            data_type=data_type,
+            force_str=self.cast_series_value_to_string,
+        )
+        mask = self.update_mask(series, data_type, np.ones(len(df), dtype=bool))
+        return df[mask]
 
 
 class Matches(ImportFilter):
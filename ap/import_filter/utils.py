@@ -1,6 +1,8 @@
+import numpy as np
 from pandas import DataFrame
 
-from ap.common.constants import KEY_FILTER_FUNCTION, KEY_IMPORT_FILTERS
+from ap.common.constants import COL_DATA_TYPE, COL_NAME, KEY_FILTER_FUNCTION, KEY_IMPORT_FILTERS
+from ap.common.logger import log_execution_time
 from ap.import_filter.core import FILTER_METHODS_DEFINITION, ImportFilter
 from ap.setting_module.models import CfgProcess
 
@@ -25,11 +27,47 @@ def get_function_class_by_name(filter_func_name: str) -> type[ImportFilter]:
     return filter_func_class
 
 
-def import_filter_from_df(df: DataFrame, process: CfgProcess) -> DataFrame:
-    import_filters = get_import_filters_from_process(process)
+@log_execution_time()
+def gen_import_filter_mask(df: DataFrame, import_filters: list[dict]) -> np.ndarray:
+    """
+    Rows kept by all import filters of a process.
+    Each column is casted once (for rows kept by previous filters) and shared by all its filters, each condition
+    only evaluates rows kept by previous conditions and dataframe is not copied until rows are selected by the mask.
+    :param df: import data
+    :param import_filters: result of ``get_import_filters_from_process``
+    :return: boolean mask of rows
+    """
+    mask = np.ones(len(df), dtype=bool)
+    dic_casted_series = {}
     for filter_col in import_filters:
+        column_name = filter_col.get(COL_NAME)
+        data_type = filter_col.get(COL_DATA_TYPE)
         for value in filter_col.get(KEY_IMPORT_FILTERS):
             filter_func_class = get_function_class_by_name(value.get(KEY_FILTER_FUNCTION))
             filter_func = filter_func_class.from_kwargs(**value)
-            df = filter_func.filter(df, column_cfg=filter_col)
-    return df
+            force_str = filter_func.cast_series_value_to_string
+
+            series = dic_casted_series.get((column_name, force_str))
+            if series is None:
+                # only cast rows kept by previous filters, later filters of this column reuse it
+                series = df[column_name].reset_index(drop=True)
+                if not mask.all():
+                    series = series[mask]
+                series = filter_func.cast_series(series, data_type=data_type, force_str=force_str)
+                dic_casted_series[(column_name, force_str)] = series
+
+            mask = filter_func.update_mask(series, data_type, mask)
+
+    return mask
+
+
+def import_filter_from_df(df: DataFrame, process: CfgProcess) -> DataFrame:
+    import_filters = get_import_filters_from_process(process)
+    if not import_filters:
+        return df
+
+    mask = gen_import_filter_mask(df, import_filters)
+    if mask.all():
+        return df
+
+    return df[mask]
@@ -0,0 +1,395 @@
+"""Micro-benchmark of vectorized equation functions against the row by row implementations they replaced.
+
+Each case evaluates one function on synthetic series (1M rows by default) twice:
+with current `eval_to_series` and with the previous implementation (`apply_format` per row, `series.apply(_convert)`,
+`Series.dt.strftime`, `Series.dt.tz_localize`), both followed by the same output cast.
+Execution time of both and whether their results are identical are written as json,
+exit code is not 0 if any result differs.
+
+Run from application root folder:
+    python -m ap.script.benchmark_equation_functions --rows 1000000 --output equation_functions.json
+    python -m ap.script.benchmark_equation_functions --cases date_extraction_ym,hex_to_dec --timezone America/New_York
+
+Functions read their definitions from master data, the app is started in a child process
+whose working directory is a scratch folder like `benchmark_show_graph`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import dataclasses
+import functools
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+from dateutil import tz
+from pydantic import BaseModel
+
+from ap.script.benchmark_show_graph import APP_ROOT, prepare_workdir
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_START_DATETIME = pd.Timestamp('2024-01-01', tz='UTC')
+
+
+class BenchmarkConfig(BaseModel):
+    rows: int = 1_000_000
+    # distinct values of generated hex / integer / text inputs
+    categories: int = 1000
+    days: int = 400
+    repeat: int = 1
+    cases: Optional[list[str]] = None
+    seed: int = 0
+
+
+class BenchmarkResult(BaseModel):
+    case: str
+    function: str
+    rows: int
+    old_seconds: float
+    new_seconds: float
+    speedup: float
+    identical: bool
+    difference: Optional[str] = None
+
+
+@dataclasses.dataclass(frozen=True)
+class EquationCase:
+    function_id: int
+    kwargs: dict
+    x_dtype: str
+    y_dtype: Optional[str]
+    gen_inputs: Callable[[BenchmarkConfig, np.random.Generator], tuple[pd.Series, Optional[pd.Series]]]
+    old_eval_to_series: Callable
+
+
+def old_hex_to_dec(function, series_x: pd.Series, series_y: pd.Series | None) -> pd.Series:
+    return series_x.apply(function._convert)
+
+
+def old_hex_to_bin(function, series_x: pd.Series, series_y: pd.Series | None) -> pd.Series:
+    return series_x.apply(function._convert)
+
+
+def old_hex_to_logical(function, series_x: pd.Series, series_y: pd.Series | None) -> pd.Series:
+    from ap.equations.core import HexToDec
+
+    result = series_x.apply(HexToDec._convert)
+    nth_bit = 2 ** (int(function.n) - 1)
+    is_na = result.isna()
+    result.loc[~is_na] = (result[~is_na] & nth_bit) != 0
+    return result
+
+
+def old_category_generation(function, series_x: pd.Series, series_y: pd.Series | None) -> pd.Series:
+    from ap.equations.core import TypeConvert
+
+    function.custom_validate()
+    function.set_type_cast(function.t)
+    result = pd.Series([function.apply_format(x, y) for x, y in zip(series_x, series_y, strict=True)])
+    type_converter = TypeConvert.from_kwargs(t=function.type_cast)
+    return type_converter.eval_to_series(series_x=result)
+
+
+def old_datetime_from_date_and_time(function, series_x: pd.Series, series_y: pd.Series | None) -> pd.Series:
+    from ap.equations.core import FUNCTION_DATE_FORMAT, FUNCTION_TIME_FORMAT
+
+    is_x_string = not pd.api.types.is_datetime64_any_dtype(series_x)
+    is_y_string = not pd.api.types.is_datetime64_any_dtype(series_y)
+    function.custom_validate(is_x_string, is_y_string)
+
+    date_format = function.s if is_x_string and function.s else FUNCTION_DATE_FORMAT
+    time_format = function.t if is_y_string and function.t else FUNCTION_TIME_FORMAT
+    if not is_x_string:
+        series_x = series_x.dt.strftime(date_format)
+    if not is_y_string:
+        series_y = series_y.dt.strftime(time_format)
+
+    result_format = f'{date_format}{time_format}'
+    return pd.to_datetime(series_x + series_y, format=result_format, exact=True, errors='coerce').dt.tz_localize(
+        tz.tzlocal(),
+    )
+
+
+def old_date_extraction(function, series_x: pd.Series, series_y: pd.Series | None) -> pd.Series:
+    from ap.equations.core import get_data_encoding_type_from_series
+
+    result = series_x.dt.strftime(function.s).astype(pd.StringDtype())
+    with contextlib.suppress(ValueError, TypeError):
+        result = result.astype(pd.Int64Dtype())
+    function.set_type_cast(get_data_encoding_type_from_series(result).value)
+    return result
+
+
+def gen_hexes(config: BenchmarkConfig, rng: np.random.Generator) -> pd.Series:
+    """Hex texts with NA and invalid values"""
+    hexes = pd.Series([format(value, 'x') for value in rng.integers(0, config.categories, config.rows)])
+    hexes = hexes.astype(pd.StringDtype())
+    hexes[::10] = pd.NA
+    hexes[5::97] = 'zz'
+    hexes[7::101] = ' 0x1F '
+    hexes[9::103] = ''
+    return hexes
+
+
+def gen_integers(config: BenchmarkConfig, rng: np.random.Generator) -> pd.Series:
+    integers = pd.Series(rng.integers(0, config.categories, config.rows)).astype(pd.Int64Dtype())
+    integers[::13] = pd.NA
+    return integers
+
+
+def gen_texts(config: BenchmarkConfig, rng: np.random.Generator) -> pd.Series:
+    texts = pd.Series(rng.integers(0, config.categories, config.rows)).map('ab{}'.format).astype(pd.StringDtype())
+    texts[::7] = pd.NA
+    return texts
+
+
+def gen_datetimes(config: BenchmarkConfig, rng: np.random.Generator) -> pd.Series:
+    """Local datetimes with microseconds, over several daylight saving time changes if server timezone has them"""
+    microseconds = rng.integers(0, config.days * 86400 * 10**6, config.rows)
+    datetimes = pd.Series(BENCHMARK_START_DATETIME + pd.to_timedelta(microseconds, unit='us'))
+    datetimes = datetimes.dt.tz_convert(tz.tzlocal())
+    datetimes[::17] = pd.NaT
+    return datetimes
+
+
+def gen_date_texts(config: BenchmarkConfig, rng: np.random.Generator) -> pd.Series:
+    return gen_datetimes(config, rng).dt.strftime('%Y/%m/%d').astype(pd.StringDtype())
+
+
+CASES = {
+    'hex_to_dec': EquationCase(20, {}, 'TEXT', None, lambda c, r: (gen_hexes(c, r), None), old_hex_to_dec),
+    'hex_to_bin': EquationCase(21, {}, 'TEXT', None, lambda c, r: (gen_hexes(c, r), None), old_hex_to_bin),
+    'hex_to_logical': EquationCase(
+        22,
+        {'n': '3'},
+        'TEXT',
+        None,
+        lambda c, r: (gen_hexes(c, r), None),
+        old_hex_to_logical,
+    ),
+    'category_generation_plain': EquationCase(
+        32,
+        {'s': '{}_{}', 't': 'Str'},
+        'INTEGER',
+        'TEXT',
+        lambda c, r: (gen_integers(c, r), gen_texts(c, r)),
+        old_category_generation,
+    ),
+    'category_generation_index': EquationCase(
+        32,
+        {'s': '[{1}]-{0}', 't': 'Str'},
+        'INTEGER',
+        'TEXT',
+        lambda c, r: (gen_integers(c, r), gen_texts(c, r)),
+        old_category_generation,
+    ),
+    'category_generation_spec': EquationCase(
+        32,
+        {'s': '{:04d}/{}', 't': 'Str'},
+        'INTEGER',
+        'INTEGER',
+        lambda c, r: (gen_integers(c, r), gen_integers(c, r)),
+        old_category_generation,
+    ),
+    'date_extraction_ym': EquationCase(
+        42,
+        {'s': '%Y%m'},
+        'DATETIME',
+        None,
+        lambda c, r: (gen_datetimes(c, r), None),
+        old_date_extraction,
+    ),
+    'date_extraction_time': EquationCase(
+        42,
+        {'s': '%H:%M:%S.%f'},
+        'DATETIME',
+        None,
+        lambda c, r: (gen_datetimes(c, r), None),
+        old_date_extraction,
+    ),
+    'datetime_from_date_and_time': EquationCase(
+        41,
+        {},
+        'DATE',
+        'TIME',
+        lambda c, r: (gen_datetimes(c, r), gen_datetimes(c, r)),
+        old_datetime_from_date_and_time,
+    ),
+    'datetime_from_text_and_time': EquationCase(
+        41,
+        {'s': '%Y/%m/%d'},
+        'TEXT',
+        'TIME',
+        lambda c, r: (gen_date_texts(c, r), gen_datetimes(c, r)),
+        old_datetime_from_date_and_time,
+    ),
+}
+
+
+def evaluate(function, eval_to_series: Callable, series_x, series_y, case: EquationCase) -> tuple[pd.Series, float]:
+    """Same as `BaseFunction.evaluate` after inputs are cast, returns result and execution time"""
+    start = time.perf_counter()
+    result = eval_to_series(series_x=series_x, series_y=series_y)
+    result = function.cast_output_series(result, x_dtype=case.x_dtype, y_dtype=case.y_dtype)
+    return result, time.perf_counter() - start
+
+
+def run_case(name: str, case: EquationCase, config: BenchmarkConfig, rng: np.random.Generator) -> BenchmarkResult:
+    from ap.equations.utils import get_function_class_by_id
+
+    function_class = get_function_class_by_id(case.function_id)
+    series_x, series_y = function_class.from_kwargs(**case.kwargs).cast_input_series(
+        *case.gen_inputs(config, rng),
+        x_dtype=case.x_dtype,
+        y_dtype=case.y_dtype,
+    )
+
+    old_seconds = new_seconds = np.inf
+    for _ in range(config.repeat):
+        # functions keep output type of last evaluation
+        old_function = function_class.from_kwargs(**case.kwargs)
+        old_result, seconds = evaluate(
+            old_function,
+            functools.partial(case.old_eval_to_series, old_function),
+            series_x.copy(),
+            None if series_y is None else series_y.copy(),
+            case,
+        )
+        old_seconds = min(old_seconds, seconds)
+
+        new_function = function_class.from_kwargs(**case.kwargs)
+        new_result, seconds = evaluate(
+            new_function,
+            new_function.eval_to_series,
+            series_x.copy(),
+            None if series_y is None else series_y.copy(),
+            case,
+        )
+        new_seconds = min(new_seconds, seconds)
+
+    difference = None
+    try:
+        pd.testing.assert_series_equal(new_result, old_result)
+    except AssertionError as e:
+        difference = str(e)
+
+    return BenchmarkResult(
+        case=name,
+        function=function_class.__name__,
+        rows=config.rows,
+        old_seconds=round(old_seconds, 4),
+        new_seconds=round(new_seconds, 4),
+        speedup=round(old_seconds / new_seconds, 1),
+        identical=difference is None,
+        difference=difference,
+    )
+
+
+def run_benchmark(config: BenchmarkConfig) -> dict:
+    """Run inside the scratch working directory"""
+    from ap import create_app
+
+    app = create_app('config.ProdConfig')
+    rng = np.random.default_rng(config.seed)
+    results = []
+    with app.app_context():
+        for name in config.cases or CASES:
+            result = run_case(name, CASES[name], config, rng)
+            logger.info(f'[BENCHMARK] {result.model_dump(exclude={"difference"})}')
+            results.append(result)
+
+    return {
+        'config': config.model_dump(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'timezone': time.tzname,
+            'created_at': datetime.now().isoformat(),
+        },
+        'results': [result.model_dump() for result in results],
+        'identical': all(result.identical for result in results),
+    }
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    defaults = BenchmarkConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=defaults.rows, help='rows of each input series')
+    parser.add_argument('--categories', type=int, default=defaults.categories, help='distinct values of inputs')
+    parser.add_argument('--days', type=int, default=defaults.days, help='period of generated datetimes')
+    parser.add_argument('--repeat', type=int, default=defaults.repeat, help='runs per case, fastest one is reported')
+    parser.add_argument('--cases', help=f'comma separated: {",".join(CASES)}')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--timezone', help='server timezone (TZ) of benchmark, local one is used by default')
+    parser.add_argument('--workdir', help='scratch working directory, a temporary one is used by default')
+    parser.add_argument('--output', help='json result file, printed to stdout by default')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.worker:
+        logging.basicConfig(level=logging.WARNING)
+        logger.setLevel(logging.INFO)
+        result = run_benchmark(BenchmarkConfig.model_validate_json(args.worker))
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        return
+
+    config = BenchmarkConfig(
+        rows=args.rows,
+        categories=args.categories,
+        days=args.days,
+        repeat=args.repeat,
+        cases=[case.strip() for case in args.cases.split(',') if case.strip()] if args.cases else None,
+        seed=args.seed,
+    )
+    unknown_cases = set(config.cases or []) - set(CASES)
+    if unknown_cases:
+        raise ValueError(f'Unknown cases: {unknown_cases}')
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ap_benchmark_')
+    prepare_workdir(workdir)
+    output = os.path.abspath(args.output or os.path.join(workdir, 'benchmark.json'))
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [APP_ROOT, env.get('PYTHONPATH')]))
+    if args.timezone:
+        env['TZ'] = args.timezone
+    try:
+        subprocess.run(
+            [sys.executable, '-m', __spec__.name, '--worker', config.model_dump_json(), '--output', output],
+            cwd=workdir,
+            env=env,
+            check=True,
+        )
+        with open(output, encoding='utf-8') as f:
+            result = json.load(f)
+        if not args.output:
+            print(json.dumps(result, indent=2))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if not result['identical']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,468 @@
+"""Benchmark of term / facet cells of ScP and HMp against the per-term implementation they replaced.
+
+`gen_scatter_by_cyclic` and `gen_scatter_by_direct_term` of both pages are shared in `facet_cells`,
+rows are bucketed to terms by one sort and two binary searches per term.
+Each case builds graphs of more than 100 cells from synthetic data with current functions and with the previous
+implementation (one mask over all rows per term), with graph data functions of each page.
+Execution time of both and whether their graphs are identical are written as json,
+exit code is not 0 if any result differs.
+
+Run from application root folder:
+    python -m ap.script.benchmark_facet_cells --rows 500000 --terms 150 --output facet_cells.json
+    python -m ap.script.benchmark_facet_cells --cases scp_cyclic_facet,hmp_direct_term --repeat 3
+
+The app is started in a child process whose working directory is a scratch folder like `benchmark_show_graph`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from ap.script.benchmark_show_graph import APP_ROOT, BENCHMARK_START_DATETIME, prepare_workdir
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_PROCESS_ID = 1
+BENCHMARK_X = 'x'
+BENCHMARK_Y = 'y'
+BENCHMARK_COLOR = 'color'
+BENCHMARK_FACET = 'facet'
+BENCHMARK_SERIAL = 'serial'
+
+
+class BenchmarkConfig(BaseModel):
+    rows: int = 500_000
+    # cyclic / direct terms, a graph is shown for each of them when there is no facet
+    terms: int = 150
+    # distinct values of facet column, graphs per row is `matrix_col`
+    facets: int = 15
+    matrix_col: int = 10
+    # maximum graphs of ScP / HMp, configurable in application settings
+    max_graph: int = 150
+    days: int = 30
+    repeat: int = 1
+    cases: Optional[list[str]] = None
+    seed: int = 0
+
+
+class BenchmarkResult(BaseModel):
+    case: str
+    rows: int
+    cells: int
+    old_seconds: float
+    new_seconds: float
+    speedup: float
+    identical: bool
+    difference: Optional[str] = None
+
+
+@dataclasses.dataclass(frozen=True)
+class FacetCase:
+    page: str
+    # cyclic terms overlap each other, direct terms are given as chunks
+    is_cyclic: bool
+    with_facet: bool
+
+
+CASES = {
+    f'{page}_{term_type}{"_facet" if with_facet else ""}': FacetCase(page, term_type == 'cyclic', with_facet)
+    for page in ('scp', 'hmp')
+    for term_type in ('cyclic', 'direct_term')
+    for with_facet in (False, True)
+}
+
+
+def get_page_functions(page: str) -> tuple[Callable, Callable]:
+    """Graph data and process times functions of ScP or HMp"""
+    if page == 'scp':
+        from ap.api.scatter_plot.services import gen_dic_graphs, get_proc_times
+    else:
+        from ap.api.heatmap.services import gen_dic_graphs, get_proc_times
+
+    return gen_dic_graphs, get_proc_times
+
+
+def gen_df(config: BenchmarkConfig, rng: np.random.Generator) -> pd.DataFrame:
+    from ap.common.constants import DATE_FORMAT_STR, ROWID, TIME_COL
+
+    total_seconds = config.days * 24 * 60 * 60
+    offsets = rng.integers(0, total_seconds, config.rows)
+    times = pd.Timestamp(BENCHMARK_START_DATETIME) + pd.to_timedelta(offsets, unit='s')
+    x = rng.normal(size=config.rows)
+    x[::50] = np.nan
+    return pd.DataFrame(
+        {
+            ROWID: np.arange(config.rows),
+            TIME_COL: times.strftime(DATE_FORMAT_STR),
+            f'{TIME_COL}_{BENCHMARK_PROCESS_ID}': times.strftime(DATE_FORMAT_STR),
+            BENCHMARK_X: x,
+            BENCHMARK_Y: rng.normal(size=config.rows),
+            BENCHMARK_COLOR: rng.integers(0, 100, config.rows),
+            BENCHMARK_FACET: rng.integers(0, config.facets, config.rows).astype(str),
+            BENCHMARK_SERIAL: np.arange(config.rows).astype(str),
+        },
+    )
+
+
+def gen_terms(config: BenchmarkConfig, is_cyclic: bool) -> list[dict]:
+    """Cyclic terms are windows of 3 intervals starting every interval, direct terms are back to back"""
+    from ap.common.constants import DATE_FORMAT_STR, END_DT, START_DT
+
+    interval = timedelta(days=config.days) / config.terms
+    window = interval * 3 if is_cyclic else interval
+    terms = []
+    for term_idx in range(config.terms):
+        start = BENCHMARK_START_DATETIME + interval * term_idx
+        terms.append({START_DT: start.strftime(DATE_FORMAT_STR), END_DT: (start + window).strftime(DATE_FORMAT_STR)})
+    return terms
+
+
+def gen_direct_term_chunks(df: pd.DataFrame, terms: list[dict]) -> dict[tuple, pd.DataFrame]:
+    """Chunks of direct terms keyed by (start date, start time, end date, end time), same as ScP / HMp"""
+    from ap.api.common.services.facet_cells import split_df_by_terms
+    from ap.common.constants import END_DT, START_DT
+
+    dic_df_chunks = split_df_by_terms(df, terms)
+    return {
+        (*term[START_DT].split('T'), *term[END_DT].split('T')): dic_df_chunks[(term[START_DT], term[END_DT])]
+        for term in terms
+    }
+
+
+def old_gen_facet_cells(dic_df_chunks, v_group_cols, matrix_col):
+    from ap import max_graph_config
+    from ap.api.common.services.facet_cells import group_by_df, split_df_by_time_range
+    from ap.common.constants import MaxGraphNumber
+
+    max_graph = matrix_col if v_group_cols else max_graph_config[MaxGraphNumber.SCP_MAX_GRAPH.name]
+    dic_groups = split_df_by_time_range(dic_df_chunks, max_graph)
+    dic_groups = {key: group_by_df(df_group, v_group_cols) for key, df_group in dic_groups.items()}
+    row_count = math.ceil(max_graph_config[MaxGraphNumber.SCP_MAX_GRAPH.name] / matrix_col)
+    facet_keys = [
+        key for key, _ in Counter([val for vals in dic_groups.values() for val in vals]).most_common(row_count)
+    ]
+    return dic_groups, facet_keys
+
+
+def old_gen_cell_graphs(dic_proc_cfgs, dic_groups, facet_keys, get_time_range, gen_dic_graphs, get_proc_times):
+    """Loop over cells of previous `gen_scatter_by_cyclic` / `gen_scatter_by_direct_term` of ScP / HMp"""
+    from ap.api.common.services.facet_cells import gen_empty_dic_graphs, get_proc_serials, get_v_keys_str
+    from ap.common.constants import CYCLE_IDS, ROWID, TIME_COL, X_SERIAL, Y_SERIAL
+
+    serial_cols = dic_proc_cfgs[BENCHMARK_PROCESS_ID].get_serials(column_name_only=False)
+    output_graphs = []
+    output_times = []
+    for h_key, dic_group in dic_groups.items():
+        time_min, time_max = get_time_range(h_key)
+        h_keys_str = f'{time_min} – {time_max}'
+        if not dic_group:
+            empty_dic_data, empty_output_time = gen_empty_dic_graphs(facet_keys, h_keys_str, None, time_min, time_max)
+            output_times.extend(empty_output_time)
+            output_graphs.extend(empty_dic_data)
+        for v_keys, df_data in dic_group.items():
+            if v_keys not in facet_keys:
+                continue
+
+            dic_data = gen_dic_graphs(
+                df_data,
+                BENCHMARK_X,
+                BENCHMARK_Y,
+                h_keys_str,
+                get_v_keys_str(v_keys),
+                BENCHMARK_COLOR,
+                TIME_COL,
+            )
+            dic_data[X_SERIAL] = get_proc_serials(df_data, serial_cols)
+            dic_data[Y_SERIAL] = get_proc_serials(df_data, [])
+            dic_data[CYCLE_IDS] = df_data.rowid if ROWID in df_data.columns else pd.Series()
+            output_times.append(
+                (get_proc_times(df_data, BENCHMARK_PROCESS_ID), get_proc_times(df_data, BENCHMARK_PROCESS_ID)),
+            )
+            output_graphs.append(dic_data)
+
+    return output_graphs, output_times
+
+
+def old_gen_scatter_by_cyclic(dic_proc_cfgs, matrix_col, df, terms, levels, gen_dic_graphs, get_proc_times):
+    from ap.api.common.services.facet_cells import drop_missing_data
+    from ap.common.constants import END_DT, START_DT, TIME_COL
+
+    df = drop_missing_data(df, [BENCHMARK_X, BENCHMARK_Y, BENCHMARK_COLOR] + levels)
+    dic_df_chunks = {}
+    df = df.set_index(TIME_COL, drop=False)
+    for term in terms:
+        start_dt = term[START_DT]
+        end_dt = term[END_DT]
+        dic_df_chunks[(start_dt, end_dt)] = df[(df.index >= start_dt) & (df.index < end_dt)]
+
+    dic_groups, facet_keys = old_gen_facet_cells(dic_df_chunks, levels, matrix_col)
+    return old_gen_cell_graphs(
+        dic_proc_cfgs,
+        dic_groups,
+        facet_keys,
+        lambda h_key: (f'{h_key[0]}', f'{h_key[1]}'),
+        gen_dic_graphs,
+        get_proc_times,
+    )
+
+
+def old_gen_scatter_by_direct_term(dic_proc_cfgs, matrix_col, dic_df_chunks, levels, gen_dic_graphs, get_proc_times):
+    from ap.api.common.services.facet_cells import drop_missing_data
+
+    for key, df in dic_df_chunks.items():
+        dic_df_chunks[key] = drop_missing_data(df, [BENCHMARK_X, BENCHMARK_Y, BENCHMARK_COLOR] + levels)
+
+    dic_groups, facet_keys = old_gen_facet_cells(dic_df_chunks, levels, matrix_col)
+    return old_gen_cell_graphs(
+        dic_proc_cfgs,
+        dic_groups,
+        facet_keys,
+        lambda h_key: (f'{h_key[0]} {h_key[1]}', f'{h_key[2]} {h_key[3]}'),
+        gen_dic_graphs,
+        get_proc_times,
+    )
+
+
+def find_difference(new, old, path='graphs') -> Optional[str]:
+    """First difference of two graph outputs, series are compared with their index and dtype"""
+    if isinstance(old, pd.Series):
+        try:
+            pd.testing.assert_series_equal(new, old)
+        except AssertionError as e:
+            return f'{path}: {e}'
+        return None
+
+    if isinstance(old, (list, tuple)):
+        if not isinstance(new, (list, tuple)) or len(new) != len(old):
+            return f'{path}: length {len(new)} != {len(old)}'
+        for idx, old_item in enumerate(old):
+            difference = find_difference(new[idx], old_item, f'{path}[{idx}]')
+            if difference:
+                return difference
+        return None
+
+    if isinstance(old, dict):
+        if not isinstance(new, dict) or list(new) != list(old):
+            return f'{path}: keys {list(new)} != {list(old)}'
+        for key, old_item in old.items():
+            difference = find_difference(new[key], old_item, f'{path}.{key}')
+            if difference:
+                return difference
+        return None
+
+    if new != old and not (pd.isna(new) and pd.isna(old)):
+        return f'{path}: {new!r} != {old!r}'
+    return None
+
+
+def gen_proc_cfgs():
+    from ap.common.constants import DataType
+    from ap.setting_module.models import CfgProcess, CfgProcessColumn
+
+    serial_col = CfgProcessColumn(
+        id=1,
+        process_id=BENCHMARK_PROCESS_ID,
+        column_name=BENCHMARK_SERIAL,
+        name_en=BENCHMARK_SERIAL,
+        data_type=DataType.TEXT.name,
+        is_serial_no=True,
+    )
+    return {BENCHMARK_PROCESS_ID: CfgProcess(id=BENCHMARK_PROCESS_ID, name_en='benchmark', columns=[serial_col])}
+
+
+def run_case(name: str, case: FacetCase, config: BenchmarkConfig, df: pd.DataFrame) -> BenchmarkResult:
+    from ap.api.common.services.facet_cells import gen_scatter_by_cyclic, gen_scatter_by_direct_term
+    from ap.common.common_utils import gen_sql_label
+    from ap.common.constants import ChartType
+
+    dic_proc_cfgs = gen_proc_cfgs()
+    # serial column label in dataframe
+    df = df.rename(columns={BENCHMARK_SERIAL: gen_sql_label(1, BENCHMARK_SERIAL)})
+    gen_dic_graphs, get_proc_times = get_page_functions(case.page)
+    levels = [BENCHMARK_FACET] if case.with_facet else []
+    terms = gen_terms(config, case.is_cyclic)
+    args = (dic_proc_cfgs, config.matrix_col)
+    chart_type = ChartType.SCATTER.value
+    if case.is_cyclic:
+
+        def run_new():
+            return gen_scatter_by_cyclic(
+                *args,
+                df,
+                BENCHMARK_PROCESS_ID,
+                BENCHMARK_PROCESS_ID,
+                BENCHMARK_X,
+                BENCHMARK_Y,
+                terms,
+                BENCHMARK_COLOR,
+                levels,
+                chart_type,
+                gen_dic_graphs=gen_dic_graphs,
+                get_proc_times=get_proc_times,
+            )
+
+        def run_old():
+            return old_gen_scatter_by_cyclic(*args, df, terms, levels, gen_dic_graphs, get_proc_times)
+
+    else:
+        dic_df_chunks = gen_direct_term_chunks(df, terms)
+
+        def run_new():
+            return gen_scatter_by_direct_term(
+                *args,
+                dict(dic_df_chunks),
+                BENCHMARK_PROCESS_ID,
+                BENCHMARK_PROCESS_ID,
+                BENCHMARK_X,
+                BENCHMARK_Y,
+                BENCHMARK_COLOR,
+                levels,
+                chart_type,
+                gen_dic_graphs=gen_dic_graphs,
+                get_proc_times=get_proc_times,
+            )
+
+        def run_old():
+            return old_gen_scatter_by_direct_term(*args, dict(dic_df_chunks), levels, gen_dic_graphs, get_proc_times)
+
+    old_seconds = new_seconds = np.inf
+    for _ in range(config.repeat):
+        start = time.perf_counter()
+        old_output = run_old()
+        old_seconds = min(old_seconds, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        new_output = run_new()
+        new_seconds = min(new_seconds, time.perf_counter() - start)
+
+    difference = find_difference(new_output, old_output)
+    return BenchmarkResult(
+        case=name,
+        rows=config.rows,
+        cells=len(new_output[0]),
+        old_seconds=round(old_seconds, 4),
+        new_seconds=round(new_seconds, 4),
+        speedup=round(old_seconds / new_seconds, 1),
+        identical=difference is None,
+        difference=difference,
+    )
+
+
+def run_benchmark(config: BenchmarkConfig) -> dict:
+    """Run inside the scratch working directory"""
+    from ap import create_app, max_graph_config
+    from ap.common.constants import MaxGraphNumber
+
+    app = create_app('config.ProdConfig')
+    rng = np.random.default_rng(config.seed)
+    df = gen_df(config, rng)
+    results = []
+    with app.app_context(), app.test_request_context():
+        max_graph_config[MaxGraphNumber.SCP_MAX_GRAPH.name] = config.max_graph
+        for name in config.cases or CASES:
+            result = run_case(name, CASES[name], config, df)
+            logger.info(f'[BENCHMARK] {result.model_dump(exclude={"difference"})}')
+            results.append(result)
+
+    return {
+        'config': config.model_dump(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'created_at': datetime.now().isoformat(),
+        },
+        'results': [result.model_dump() for result in results],
+        'identical': all(result.identical for result in results),
+    }
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    defaults = BenchmarkConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=defaults.rows, help='rows of dataframe')
+    parser.add_argument('--terms', type=int, default=defaults.terms, help='cyclic / direct terms')
+    parser.add_argument('--facets', type=int, default=defaults.facets, help='distinct values of facet column')
+    parser.add_argument('--matrix-col', type=int, default=defaults.matrix_col, help='graphs per row with facet')
+    parser.add_argument('--max-graph', type=int, default=defaults.max_graph, help='maximum graphs of ScP / HMp')
+    parser.add_argument('--days', type=int, default=defaults.days, help='period of generated datetimes')
+    parser.add_argument('--repeat', type=int, default=defaults.repeat, help='runs per case, fastest one is reported')
+    parser.add_argument('--cases', help=f'comma separated: {",".join(CASES)}')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--workdir', help='scratch working directory, a temporary one is used by default')
+    parser.add_argument('--output', help='json result file, printed to stdout by default')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.worker:
+        logging.basicConfig(level=logging.WARNING)
+        logger.setLevel(logging.INFO)
+        result = run_benchmark(BenchmarkConfig.model_validate_json(args.worker))
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        return
+
+    config = BenchmarkConfig(
+        rows=args.rows,
+        terms=args.terms,
+        facets=args.facets,
+        matrix_col=args.matrix_col,
+        max_graph=args.max_graph,
+        days=args.days,
+        repeat=args.repeat,
+        cases=[case.strip() for case in args.cases.split(',') if case.strip()] if args.cases else None,
+        seed=args.seed,
+    )
+    unknown_cases = set(config.cases or []) - set(CASES)
+    if unknown_cases:
+        raise ValueError(f'Unknown cases: {unknown_cases}')
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ap_benchmark_')
+    prepare_workdir(workdir)
+    output = os.path.abspath(args.output or os.path.join(workdir, 'benchmark.json'))
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [APP_ROOT, env.get('PYTHONPATH')]))
+    try:
+        subprocess.run(
+            [sys.executable, '-m', __spec__.name, '--worker', config.model_dump_json(), '--output', output],
+            cwd=workdir,
+            env=env,
+            check=True,
+        )
+        with open(output, encoding='utf-8') as f:
+            result = json.load(f)
+        if not args.output:
+            print(json.dumps(result, indent=2))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if not result['identical']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""Benchmark of cancelling a long graph request, aborted by user or timed out.
+
+A SQLite table with 5M rows is generated in a scratch working directory,
+then a request reads all of it with `DbProxy` (sorted by SQLite) and sorts it again in an `abort_process_handler` stage.
+- abort: `/abort_process` is called for the request's thread id while SQLite is running
+- timeout: request view has a short `request_timeout_handling`, its deadline passes while SQLite is running
+- complete: request is not cancelled, to know how long and how much memory it takes.
+  It runs last, memory kept by allocator after a finished request would be counted as retained by the others
+
+Cancelled requests must stop by the SQLite progress handler (every `SQLITE_ABORT_CHECK_INSTRUCTIONS`)
+and `DbProxy.raise_if_aborted`, not after the statement finishes.
+Stop time, CPU time used after cancellation, peak and retained RSS are written as json,
+exit code is not 0 if a cancelled request does not stop and free its memory within the given bounds.
+
+Run from application root folder:
+    python -m ap.script.benchmark_request_cancel --rows 5000000 --output benchmark_cancel.json
+
+The app is started in a child process whose working directory is the scratch folder,
+so that config db and transaction db of the real application are never touched.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from ap.script.benchmark_show_graph import APP_ROOT, PeakRSS, get_rss, prepare_workdir
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DB_FILE = 'benchmark_cancel.sqlite3'
+BENCHMARK_THREAD_ID = 'benchmark_cancel'
+BENCHMARK_URL = '/benchmark/cancel'
+BENCHMARK_TIMEOUT_URL = '/benchmark/cancel_timeout'
+BENCHMARK_SQL = 'SELECT id, serial, value, category FROM benchmark ORDER BY category, value'
+INSERT_CHUNK_ROWS = 1_000_000
+
+SCENARIOS = ('abort', 'timeout', 'complete')
+
+
+class BenchmarkConfig(BaseModel):
+    rows: int = 5_000_000
+    # seconds after request start to call `/abort_process`
+    abort_after: float = 2.0
+    # seconds of `request_timeout_handling` of timeout scenario
+    timeout_after: float = 2.0
+    # a cancelled request must stop within this many seconds
+    max_stop_seconds: float = 1.0
+    # a cancelled request must not keep more memory than this
+    max_retained_mb: float = 100.0
+    scenarios: list[str] = list(SCENARIOS)
+    seed: int = 0
+
+
+class BenchmarkResult(BaseModel):
+    scenario: str
+    status_code: int
+    seconds: float
+    # seconds from cancellation to the end of request
+    stop_seconds: Optional[float] = None
+    cpu_seconds_after_cancel: Optional[float] = None
+    rss_increase_mb: float
+    retained_rss_mb: float
+    ok: bool
+
+
+def get_cpu_seconds() -> float:
+    """User and system CPU time of current process"""
+    times = os.times()
+    return times.user + times.system
+
+
+def generate_table(db_file: str, config: BenchmarkConfig):
+    """Transaction-like table, inserted by chunks to bound memory"""
+    rng = np.random.default_rng(config.seed)
+    with sqlite3.connect(db_file) as conn:
+        conn.execute('CREATE TABLE benchmark (id INTEGER PRIMARY KEY, serial INTEGER, value REAL, category TEXT)')
+        for start in range(0, config.rows, INSERT_CHUNK_ROWS):
+            size = min(INSERT_CHUNK_ROWS, config.rows - start)
+            rows = zip(
+                rng.integers(0, 1000, size).tolist(),
+                rng.random(size).tolist(),
+                (f'category{value}' for value in rng.integers(0, 5000, size).tolist()),
+            )
+            conn.executemany('INSERT INTO benchmark (serial, value, category) VALUES (?, ?, ?)', rows)
+    conn.close()
+
+
+def register_views(app, db_file: str, config: BenchmarkConfig):
+    """Views reading the whole table like a trace request, one of them times out after `timeout_after` seconds"""
+    from ap.common.constants import DBType
+    from ap.common.pydn.dblib.db_proxy import DbProxy
+    from ap.common.services.request_time_out_handler import abort_process_handler, request_timeout_handling
+    from ap.setting_module.models import CfgDataSource, CfgDataSourceDB
+
+    @abort_process_handler()
+    def sort_stage(df: pd.DataFrame) -> pd.DataFrame:
+        return df.sort_values(['serial', 'value'])
+
+    def read_table():
+        data_source = CfgDataSource(type=DBType.SQLITE.name, db_detail=CfgDataSourceDB(dbname=db_file))
+        with DbProxy(data_source, True, force_connect=True) as db_instance:
+            cols, rows = db_instance.run_sql(BENCHMARK_SQL, row_is_dict=False)
+        df = pd.DataFrame(rows, columns=cols)
+        del rows
+        df = sort_stage(df)
+        return {'rows': len(df)}, 200
+
+    app.add_url_rule(
+        BENCHMARK_URL,
+        'benchmark_cancel',
+        request_timeout_handling()(read_table),
+        methods=['POST'],
+    )
+    app.add_url_rule(
+        BENCHMARK_TIMEOUT_URL,
+        'benchmark_cancel_timeout',
+        request_timeout_handling(max_timeout=config.timeout_after / 60)(read_table),
+        methods=['POST'],
+    )
+
+
+def run_scenario(app, scenario: str, config: BenchmarkConfig) -> BenchmarkResult:
+    from ap.common.constants import REQUEST_THREAD_ID
+
+    url = BENCHMARK_TIMEOUT_URL if scenario == 'timeout' else BENCHMARK_URL
+    cancel_after = {'abort': config.abort_after, 'timeout': config.timeout_after}.get(scenario)
+    response = {}
+
+    def send_request():
+        client_response = app.test_client().post(url, data={REQUEST_THREAD_ID: BENCHMARK_THREAD_ID})
+        response['status_code'] = client_response.status_code
+        response['finished_at'] = time.perf_counter()
+
+    gc.collect()
+    rss_start = get_rss()
+    stop_seconds = cpu_seconds_after_cancel = None
+    with PeakRSS() as rss:
+        started_at = time.perf_counter()
+        request_thread = threading.Thread(target=send_request, daemon=True)
+        request_thread.start()
+        if cancel_after is not None:
+            request_thread.join(cancel_after)
+            cancelled_at = time.perf_counter()
+            cpu_at_cancel = get_cpu_seconds()
+            if scenario == 'abort':
+                app.test_client().get('/ap/api/common/abort_process', query_string={'thread_id': BENCHMARK_THREAD_ID})
+
+        request_thread.join()
+        if cancel_after is not None:
+            stop_seconds = max(response['finished_at'] - cancelled_at, 0)
+            cpu_seconds_after_cancel = get_cpu_seconds() - cpu_at_cancel
+
+    gc.collect()
+    retained_rss_mb = (get_rss() - rss_start) / 1024 / 1024
+    if cancel_after is None:
+        ok = response['status_code'] == 200
+    else:
+        ok = (
+            response['status_code'] != 200
+            and stop_seconds <= config.max_stop_seconds
+            and retained_rss_mb <= config.max_retained_mb
+        )
+
+    return BenchmarkResult(
+        scenario=scenario,
+        status_code=response['status_code'],
+        seconds=round(response['finished_at'] - started_at, 4),
+        stop_seconds=None if stop_seconds is None else round(stop_seconds, 4),
+        cpu_seconds_after_cancel=None if cpu_seconds_after_cancel is None else round(cpu_seconds_after_cancel, 4),
+        rss_increase_mb=round((rss.peak - rss.start) / 1024 / 1024, 1),
+        retained_rss_mb=round(retained_rss_mb, 1),
+        ok=ok,
+    )
+
+
+def run_benchmark(config: BenchmarkConfig) -> dict:
+    """Run inside the scratch working directory"""
+    from ap import create_app
+    from ap.common.services.request_time_out_handler import SQLITE_ABORT_CHECK_INSTRUCTIONS
+
+    app = create_app('config.ProdConfig')
+    app.config['IS_SEND_GOOGLE_ANALYTICS'] = False
+
+    db_file = os.path.abspath(BENCHMARK_DB_FILE)
+    start = time.perf_counter()
+    generate_table(db_file, config)
+    generate_seconds = time.perf_counter() - start
+    register_views(app, db_file, config)
+
+    results = []
+    for scenario in config.scenarios:
+        result = run_scenario(app, scenario, config)
+        logger.info(f'[BENCHMARK] {result}')
+        results.append(result)
+
+    return {
+        'config': config.model_dump(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlite': sqlite3.sqlite_version,
+            'sqlite_abort_check_instructions': SQLITE_ABORT_CHECK_INSTRUCTIONS,
+            'created_at': datetime.now().isoformat(),
+        },
+        'generate_seconds': round(generate_seconds, 4),
+        'results': [result.model_dump() for result in results],
+        'ok': all(result.ok for result in results),
+    }
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    defaults = BenchmarkConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=defaults.rows, help='rows of generated table')
+    parser.add_argument('--abort-after', type=float, default=defaults.abort_after, help='seconds before abort')
+    parser.add_argument('--timeout-after', type=float, default=defaults.timeout_after, help='seconds before timeout')
+    parser.add_argument('--max-stop-seconds', type=float, default=defaults.max_stop_seconds)
+    parser.add_argument('--max-retained-mb', type=float, default=defaults.max_retained_mb)
+    parser.add_argument(
+        '--scenarios', default=','.join(defaults.scenarios), help=f'comma separated: {",".join(SCENARIOS)}'
+    )
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--workdir', help='scratch working directory, a temporary one is used by default')
+    parser.add_argument('--output', help='json result file, printed to stdout by default')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.worker:
+        logging.basicConfig(level=logging.WARNING)
+        logger.setLevel(logging.INFO)
+        result = run_benchmark(BenchmarkConfig.model_validate_json(args.worker))
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        return
+
+    config = BenchmarkConfig(
+        rows=args.rows,
+        abort_after=args.abort_after,
+        timeout_after=args.timeout_after,
+        max_stop_seconds=args.max_stop_seconds,
+        max_retained_mb=args.max_retained_mb,
+        scenarios=[scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()],
+        seed=args.seed,
+    )
+    unknown_scenarios = set(config.scenarios) - set(SCENARIOS)
+    if unknown_scenarios:
+        raise ValueError(f'Unknown scenarios: {unknown_scenarios}')
+
+    # table of a previous run would be appended
+    if args.workdir and os.path.isdir(args.workdir) and os.listdir(args.workdir):
+        raise ValueError(f'Working directory is not empty: {args.workdir}')
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ap_benchmark_')
+    prepare_workdir(workdir)
+    output = os.path.abspath(args.output or os.path.join(workdir, 'benchmark.json'))
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [APP_ROOT, env.get('PYTHONPATH')]))
+    try:
+        subprocess.run(
+            [sys.executable, '-m', __spec__.name, '--worker', config.model_dump_json(), '--output', output],
+            cwd=workdir,
+            env=env,
+            check=True,
+        )
+        with open(output, encoding='utf-8') as f:
+            result = json.load(f)
+        if not args.output:
+            print(json.dumps(result, indent=2))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if not result['ok']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,561 @@
+"""Offline benchmark of show graph pipeline with synthetic factory data.
+
+Linked processes are generated in local SQLite of a scratch working directory, then representative
+FPP/ScP/CHM/RLP/PCA requests are posted to the app.
+Each request goes through `get_data_from_db` -> `gen_graph_df` -> `gen_trace_procs_df` -> `reduce_data`,
+its execution time and peak RSS are written as json, so that regressions in these hot paths can be caught.
+
+Run from application root folder:
+    python -m ap.script.benchmark_show_graph --processes 3 --rows 100000 --output benchmark.json
+
+The app is started in a child process whose working directory is the scratch folder,
+so that config db, transaction db and cache of the real application are never touched.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ctypes
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCHMARK_DATA_SOURCE = 'benchmark'
+BENCHMARK_START_DATETIME = datetime(2024, 1, 1)
+
+# interval (seconds) to sample RSS while a request is running
+RSS_SAMPLING_INTERVAL = 0.01
+
+PAGES = ('fpp', 'scp', 'chm', 'rlp', 'pca')
+
+
+class BenchmarkConfig(BaseModel):
+    processes: int = 3
+    rows: int = 100_000
+    # real columns per process
+    columns: int = 10
+    # text category columns per process
+    category_columns: int = 2
+    # distinct values of each category column
+    categories: int = 20
+    # distinct serials, serials are link keys between processes. Same as rows when not given, so every row is linked
+    link_keys: Optional[int] = None
+    days: int = 30
+    repeat: int = 3
+    pages: list[str] = list(PAGES)
+    seed: int = 0
+
+
+class BenchmarkProcess(BaseModel):
+    id: int
+    serial_col_id: int
+    datetime_col_id: int
+    category_col_ids: list[int]
+    real_col_ids: list[int]
+
+
+class BenchmarkResult(BaseModel):
+    page: str
+    run: int
+    seconds: float
+    peak_rss_mb: float
+    rss_increase_mb: float
+    status_code: int
+    records: Optional[int] = None
+
+
+def get_rss() -> int:
+    """Resident set size (bytes) of current process"""
+    if sys.platform == 'win32':
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', ctypes.c_ulong),
+                ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(),
+            ctypes.byref(counters),
+            counters.cb,
+        )
+        return counters.WorkingSetSize
+
+    with open('/proc/self/statm', encoding='utf-8') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakRSS:
+    """Sample RSS in background thread, to get the peak RSS while running a block of code"""
+
+    def __init__(self, interval: float = RSS_SAMPLING_INTERVAL):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, get_rss())
+
+    def __enter__(self):
+        self.start = self.peak = get_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, get_rss())
+
+
+def prepare_workdir(workdir: str):
+    """Working directory of benchmark app, only init files and yaml configs are copied"""
+    os.makedirs(os.path.join(workdir, 'ap'), exist_ok=True)
+    for folder in ('init', os.path.join('ap', 'config')):
+        shutil.copytree(os.path.join(APP_ROOT, folder), os.path.join(workdir, folder), dirs_exist_ok=True)
+    shutil.copy2(os.path.join(APP_ROOT, 'VERSION'), workdir)
+
+
+def gen_process_df(config: BenchmarkConfig, proc_idx: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Synthetic factory data of one process
+    :param config: benchmark config
+    :param proc_idx: order of process in the line, downstream processes run a little bit later
+    :param rng: random generator
+    :return: dataframe of serial, datetime, category and real columns
+    """
+    rows = config.rows
+    # every process sees the same products in the same order, seeded apart from values so that they are identical
+    line_rng = np.random.default_rng(config.seed)
+    total_seconds = config.days * 24 * 60 * 60
+    offsets = np.sort(line_rng.integers(0, total_seconds, rows)) + proc_idx * 60
+    datetimes = pd.Timestamp(BENCHMARK_START_DATETIME) + pd.to_timedelta(offsets, unit='s')
+
+    link_keys = config.link_keys or rows
+    data = {
+        # serials are unique as long as there are enough link keys
+        'serial': line_rng.choice(link_keys, rows, replace=rows > link_keys),
+        'datetime': datetimes,
+    }
+    labels = np.array([f'C{code:04d}' for code in range(config.categories)], dtype=object)
+    for i in range(config.category_columns):
+        data[f'category_{i + 1}'] = labels[rng.integers(0, config.categories, rows)]
+
+    for i in range(config.columns):
+        data[f'sensor_{i + 1}'] = rng.normal(i, 1 + i / 10, rows).round(6)
+
+    return pd.DataFrame(data)
+
+
+def create_processes(config: BenchmarkConfig) -> list[BenchmarkProcess]:
+    """Register data source, processes and linking config of benchmark in app db"""
+    from ap import db
+    from ap.common.constants import DataColumnType, DataType, DBType
+    from ap.setting_module.models import (
+        CfgDataSource,
+        CfgDataSourceCSV,
+        CfgProcess,
+        CfgProcessColumn,
+        CfgTrace,
+        CfgTraceKey,
+    )
+
+    data_source = CfgDataSource(name=BENCHMARK_DATA_SOURCE, type=DBType.CSV.name, order=1)
+    data_source.csv_detail = CfgDataSourceCSV(directory=os.getcwd())
+    db.session.add(data_source)
+
+    cfg_processes = []
+    for proc_idx in range(config.processes):
+        name = f'{BENCHMARK_DATA_SOURCE}_process_{proc_idx + 1}'
+        cfg_process = CfgProcess(name=name, name_en=name, name_jp=name, name_local=name, order=proc_idx + 1)
+        cfg_process.data_source = data_source
+        columns = [
+            ('serial', DataType.INTEGER, DataColumnType.MAIN_SERIAL, {'is_serial_no': True}),
+            ('datetime', DataType.DATETIME, DataColumnType.DATETIME, {'is_get_date': True}),
+        ]
+        columns += [
+            (f'category_{i + 1}', DataType.TEXT, DataColumnType.GENERATED, {}) for i in range(config.category_columns)
+        ]
+        columns += [(f'sensor_{i + 1}', DataType.REAL, DataColumnType.GENERATED, {}) for i in range(config.columns)]
+        for order, (column_name, data_type, column_type, flags) in enumerate(columns, start=1):
+            cfg_process.columns.append(
+                CfgProcessColumn(
+                    column_name=column_name,
+                    column_raw_name=column_name,
+                    name_en=column_name,
+                    name_jp=column_name,
+                    name_local=column_name,
+                    data_type=data_type.name,
+                    raw_data_type=data_type.name,
+                    column_type=column_type.value,
+                    order=order,
+                    **flags,
+                ),
+            )
+        db.session.add(cfg_process)
+        cfg_processes.append(cfg_process)
+    db.session.flush()
+
+    # link processes in line by serial
+    for self_process, target_process in zip(cfg_processes, cfg_processes[1:]):
+        trace = CfgTrace(self_process_id=self_process.id, target_process_id=target_process.id)
+        trace.trace_keys.append(
+            CfgTraceKey(
+                self_column_id=self_process.get_serials(column_name_only=False)[0].id,
+                target_column_id=target_process.get_serials(column_name_only=False)[0].id,
+                order=1,
+            ),
+        )
+        db.session.add(trace)
+    db.session.commit()
+
+    processes = []
+    for cfg_process in cfg_processes:
+        dic_cols = {col.column_name: col for col in cfg_process.columns}
+        processes.append(
+            BenchmarkProcess(
+                id=cfg_process.id,
+                serial_col_id=dic_cols['serial'].id,
+                datetime_col_id=dic_cols['datetime'].id,
+                category_col_ids=[dic_cols[f'category_{i + 1}'].id for i in range(config.category_columns)],
+                real_col_ids=[dic_cols[f'sensor_{i + 1}'].id for i in range(config.columns)],
+            ),
+        )
+    return processes
+
+
+def import_process_data(process_id: int, df: pd.DataFrame):
+    """Write synthetic data into transaction table as data import does"""
+    from ap.api.setting_module.services.data_import import (
+        gen_bulk_insert_sql,
+        gen_insert_cycle_values,
+        get_insert_params,
+        get_proc_data_count_df,
+        insert_data,
+    )
+    from ap.common.constants import DATE_FORMAT_STR
+    from ap.common.pydn.dblib.db_proxy import DbProxy, gen_data_source_of_universal_db
+    from ap.trace_data.transaction_model import DataCountTable, TransactionData
+
+    trans_data = TransactionData(process_id)
+    dic_cols = {col.column_name: col.bridge_column_name for col in trans_data.cfg_process_columns}
+    get_date_col = trans_data.getdate_column.column_name
+
+    df_count = get_proc_data_count_df(df, get_date_col=get_date_col, decrease=False, is_db=True)
+    df = df.assign(**{get_date_col: df[get_date_col].dt.strftime(DATE_FORMAT_STR)})
+
+    with DbProxy(gen_data_source_of_universal_db(process_id), True) as db_instance:
+        trans_data.create_table(db_instance)
+        sql_insert = gen_bulk_insert_sql(
+            trans_data.table_name, *get_insert_params([dic_cols[col] for col in df.columns])
+        )
+        insert_data(db_instance, sql_insert, gen_insert_cycle_values(df))
+
+        df_count = df_count.groupby(DataCountTable.datetime.name, as_index=False).sum()
+        sql_insert = gen_bulk_insert_sql(
+            trans_data.data_count_table_name,
+            *get_insert_params(df_count.columns.tolist()),
+        )
+        insert_data(db_instance, sql_insert, df_count.to_records(index=False).tolist())
+
+        trans_data.re_structure_index(db_instance)
+
+
+def gen_terms(config: BenchmarkConfig, count: int) -> list[tuple[datetime, datetime]]:
+    """Split generated period into terms of same length"""
+    end_datetime = BENCHMARK_START_DATETIME + timedelta(days=config.days, hours=1)
+    term = (end_datetime - BENCHMARK_START_DATETIME) / count
+    return [(BENCHMARK_START_DATETIME + term * i, BENCHMARK_START_DATETIME + term * (i + 1)) for i in range(count)]
+
+
+def gen_common_form(config: BenchmarkConfig, process: BenchmarkProcess, term_count: int = 1) -> dict[str, list[str]]:
+    """Request form items which are shared between pages, whole generated period is requested"""
+    terms = gen_terms(config, term_count)
+    return {
+        'start_proc': [str(process.id)],
+        'START_DATE': [start.strftime('%Y/%m/%d') for start, _ in terms],
+        'START_TIME': [start.strftime('%H:%M') for start, _ in terms],
+        'END_DATE': [end.strftime('%Y/%m/%d') for _, end in terms],
+        'END_TIME': [end.strftime('%H:%M') for _, end in terms],
+        'client_timezone': ['UTC'],
+    }
+
+
+def gen_end_proc_form(processes: list[BenchmarkProcess], get_col_ids: Callable) -> dict[str, list[str]]:
+    """Select columns of every process, so that all processes are traced"""
+    form = {}
+    for idx, process in enumerate(processes, start=1):
+        form[f'end_proc{idx}'] = [str(process.id)]
+        form[f'GET02_VALS_SELECT{idx}'] = [str(col_id) for col_id in get_col_ids(process)]
+    return form
+
+
+def gen_fpp_form(config: BenchmarkConfig, processes: list[BenchmarkProcess]) -> dict[str, list[str]]:
+    form = gen_common_form(config, processes[0])
+    form.update(gen_end_proc_form(processes, lambda process: process.real_col_ids + process.category_col_ids))
+    return form
+
+
+def gen_scp_form(config: BenchmarkConfig, processes: list[BenchmarkProcess]) -> dict[str, list[str]]:
+    """Scatter first sensor of first process and last sensor of last process, colored by a category"""
+    first_process, last_process = processes[0], processes[-1]
+    x_col_id, y_col_id = first_process.real_col_ids[0], last_process.real_col_ids[-1]
+    form = gen_common_form(config, first_process)
+    form.update(
+        gen_end_proc_form(
+            [first_process, last_process] if len(processes) > 1 else [first_process],
+            lambda process: [col_id for col_id in (x_col_id, y_col_id) if col_id in process.real_col_ids],
+        ),
+    )
+    form['SCP_HMP_X_AXIS'] = [f'{first_process.id}-{x_col_id}']
+    form['SCP_HMP_Y_AXIS'] = [f'{last_process.id}-{y_col_id}']
+    form['compareType'] = ['var']
+    if first_process.category_col_ids:
+        form['colorVar'] = [str(first_process.category_col_ids[0])]
+    return form
+
+
+def gen_chm_form(config: BenchmarkConfig, processes: list[BenchmarkProcess]) -> dict[str, list[str]]:
+    """Hourly calendar heatmap of every column of last process"""
+    last_process = processes[-1]
+    form = gen_common_form(config, processes[0])
+    form.update(
+        gen_end_proc_form([last_process], lambda process: process.real_col_ids + process.category_col_ids),
+    )
+    form.update(
+        {
+            'mode': ['1'],
+            'step_minute': ['60'],
+            'step_hour': ['1'],
+            'function_real': ['mean'],
+            'function_cate': ['count'],
+            'remove_outlier': ['0'],
+        },
+    )
+    return form
+
+
+def gen_rlp_form(config: BenchmarkConfig, processes: list[BenchmarkProcess]) -> dict[str, list[str]]:
+    """Ridgelines of sensors of last process, compared between 4 terms"""
+    form = gen_common_form(config, processes[0], term_count=4)
+    form.update(gen_end_proc_form([processes[-1]], lambda process: process.real_col_ids))
+    form['compareType'] = ['directTerm']
+    form['emdType'] = ['drift']
+    return form
+
+
+def gen_pca_form(config: BenchmarkConfig, processes: list[BenchmarkProcess]) -> dict[str, list[str]]:
+    """First half of the period is train data, the rest is test data"""
+    form = gen_common_form(config, processes[0], term_count=2)
+    form.update(gen_end_proc_form(processes, lambda process: process.real_col_ids))
+    return form
+
+
+PAGE_REQUESTS: dict[str, tuple[str, Callable[[BenchmarkConfig, list[BenchmarkProcess]], dict]]] = {
+    'fpp': ('/ap/api/fpp/index', gen_fpp_form),
+    'scp': ('/ap/api/scp/plot', gen_scp_form),
+    'chm': ('/ap/api/chm/plot', gen_chm_form),
+    'rlp': ('/ap/api/rlp/index', gen_rlp_form),
+    'pca': ('/ap/api/analyze/pca', gen_pca_form),
+}
+
+
+def run_page(client, page: str, url: str, form: dict) -> tuple[float, PeakRSS, int, Optional[int]]:
+    """
+    Post one uncached request
+    :return: seconds, RSS while running, status code and number of records shown
+    """
+    from ap.common.constants import ACTUAL_RECORD_NUMBER
+    from ap.common.memoize import clear_cache
+
+    clear_cache()
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        response = client.post(url, data=form)
+        seconds = time.perf_counter() - start
+
+    records = None
+    if response.status_code == 200:
+        records = json.loads(response.get_data()).get(ACTUAL_RECORD_NUMBER)
+    else:
+        logger.error(f'[BENCHMARK] {page}: {response.status_code} {response.get_data(as_text=True)[:1000]}')
+
+    return seconds, rss, response.status_code, records
+
+
+def run_benchmark(config: BenchmarkConfig) -> dict:
+    """Run inside the scratch working directory"""
+    from ap import create_app, max_graph_config
+    from ap.common import multiprocess_sharing
+    from ap.common.multiprocess_sharing import EventQueue
+    from ap.setting_module.models import CfgConstant
+
+    app = create_app('config.ProdConfig')
+    app.config['IS_SEND_GOOGLE_ANALYTICS'] = False
+    multiprocess_sharing.start_sharing_instance_server()
+    # nobody needs background notifications, just drain them
+    EventQueue.start_listening()
+
+    rng = np.random.default_rng(config.seed)
+    with app.app_context():
+        # same as main.py, pages limit their number of graphs by these constants
+        CfgConstant.initialize_max_graph_constants()
+        for key in max_graph_config:
+            max_graph_config[key] = CfgConstant.get_value_by_type_first(key, int)
+
+        processes = create_processes(config)
+        start = time.perf_counter()
+        for proc_idx, process in enumerate(processes):
+            import_process_data(process.id, gen_process_df(config, proc_idx, rng))
+        generate_seconds = time.perf_counter() - start
+
+    results = []
+    client = app.test_client()
+    for page in config.pages:
+        url, gen_form = PAGE_REQUESTS[page]
+        form = gen_form(config, processes)
+        for run in range(config.repeat):
+            seconds, rss, status_code, records = run_page(client, page, url, form)
+            result = BenchmarkResult(
+                page=page,
+                run=run,
+                seconds=round(seconds, 4),
+                peak_rss_mb=round(rss.peak / 1024 / 1024, 1),
+                rss_increase_mb=round((rss.peak - rss.start) / 1024 / 1024, 1),
+                status_code=status_code,
+                records=records,
+            )
+            logger.info(f'[BENCHMARK] {result}')
+            results.append(result)
+
+    return {
+        'config': config.model_dump(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'created_at': datetime.now().isoformat(),
+        },
+        'generate_seconds': round(generate_seconds, 4),
+        'results': [result.model_dump() for result in results],
+        'summary': summarize(results),
+    }
+
+
+def summarize(results: list[BenchmarkResult]) -> dict[str, dict]:
+    """Median time and max peak RSS of each page"""
+    summary = {}
+    for page in dict.fromkeys(result.page for result in results):
+        page_results = [result for result in results if result.page == page]
+        summary[page] = {
+            'median_seconds': round(float(np.median([result.seconds for result in page_results])), 4),
+            'min_seconds': min(result.seconds for result in page_results),
+            'peak_rss_mb': max(result.peak_rss_mb for result in page_results),
+            'ok': all(result.status_code == 200 for result in page_results),
+        }
+    return summary
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    defaults = BenchmarkConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=defaults.processes, help='number of linked processes')
+    parser.add_argument('--rows', type=int, default=defaults.rows, help='rows per process')
+    parser.add_argument('--columns', type=int, default=defaults.columns, help='real columns per process')
+    parser.add_argument('--category-columns', type=int, default=defaults.category_columns)
+    parser.add_argument('--categories', type=int, default=defaults.categories, help='distinct values per category')
+    parser.add_argument('--link-keys', type=int, default=defaults.link_keys, help='distinct serials (link keys)')
+    parser.add_argument('--days', type=int, default=defaults.days, help='period of generated data')
+    parser.add_argument('--repeat', type=int, default=defaults.repeat, help='runs per page')
+    parser.add_argument('--pages', default=','.join(defaults.pages), help=f'comma separated: {",".join(PAGES)}')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--workdir', help='scratch working directory, a temporary one is used by default')
+    parser.add_argument('--output', help='json result file, printed to stdout by default')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.worker:
+        logging.basicConfig(level=logging.WARNING)
+        logger.setLevel(logging.INFO)
+        result = run_benchmark(BenchmarkConfig.model_validate_json(args.worker))
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        return
+
+    config = BenchmarkConfig(
+        processes=args.processes,
+        rows=args.rows,
+        columns=args.columns,
+        category_columns=args.category_columns,
+        categories=args.categories,
+        link_keys=args.link_keys,
+        days=args.days,
+        repeat=args.repeat,
+        pages=[page.strip() for page in args.pages.split(',') if page.strip()],
+        seed=args.seed,
+    )
+    unknown_pages = set(config.pages) - set(PAGE_REQUESTS)
+    if unknown_pages:
+        raise ValueError(f'Unknown pages: {unknown_pages}')
+
+    # data of a previous run would be read together with new data
+    if args.workdir and os.path.isdir(args.workdir) and os.listdir(args.workdir):
+        raise ValueError(f'Working directory is not empty: {args.workdir}')
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ap_benchmark_')
+    prepare_workdir(workdir)
+    output = os.path.abspath(args.output or os.path.join(workdir, 'benchmark.json'))
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [APP_ROOT, env.get('PYTHONPATH')]))
+    try:
+        subprocess.run(
+            [sys.executable, '-m', __spec__.name, '--worker', config.model_dump_json(), '--output', output],
+            cwd=workdir,
+            env=env,
+            check=True,
+        )
+        if not args.output:
+            with open(output, encoding='utf-8') as f:
+                print(f.read())
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+"""Load test of background job notifications (SSE) with many concurrent listeners.
+
+The app is served by waitress with the same threads and connection limit as `main.py`,
+in a child process whose working directory is a scratch folder.
+Listeners connect to `/ap/api/setting/listen_background_job/<uuid>` over HTTP from this process
+and are read by one thread (many reading threads would skew latency by switching between them),
+then the server announces events through `MessageAnnouncer.announce`, which the background event listener calls:
+- plain events (TRANSACTION_UPDATED) must be delivered to every listener, their latency is measured
+- progress events (JOB_RUN of several jobs) may be coalesced, only the last one of each job must be delivered
+Connected clients, delivered, coalesced and dropped messages (`/listen_background_job_stats`) and latency percentiles
+are written as json, exit code is not 0 if a listener misses a message.
+
+Run from application root folder:
+    python -m ap.script.benchmark_sse --clients 500 --events 600 --rate 20 --output benchmark_sse.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import selectors
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from ap.script.benchmark_show_graph import APP_ROOT, prepare_workdir
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_HOST = '127.0.0.1'
+LISTEN_URL = '/ap/api/setting/listen_background_job/{}'
+STATS_URL = '/ap/api/setting/listen_background_job_stats'
+PUBLISH_URL = '/benchmark/sse/publish'
+STOP_URL = '/benchmark/sse/stop'
+
+# interval (seconds) to check whether all listeners are connected or received the last event
+POLLING_INTERVAL = 0.1
+
+# max bytes read from a stream at once
+RECEIVE_BYTES = 65536
+
+
+class BenchmarkConfig(BaseModel):
+    clients: int = 500
+    events: int = 600
+    # events per second, 0 to publish all events at once
+    rate: float = 20
+    # share of progress events
+    progress_ratio: float = 0.5
+    # jobs of progress events, progress events of the same job are coalesced
+    jobs: int = 10
+    # waitress threads, same as `main.py`. Listeners are served by `SSEDispatcher` and do not hold them
+    server_threads: int = 20
+    # seconds to wait for listeners to connect and to receive the last event
+    timeout: float = 120
+    seed: int = 0
+
+
+class Listener:
+    """Client of one browser, its event stream is read by `read_listeners`"""
+
+    def __init__(self, port: int):
+        self.uuid = str(uuid.uuid4())
+        self.socket = socket.create_connection((BENCHMARK_HOST, port))
+        self.buffer = b''
+        self.event: Optional[str] = None
+        self.plain_sequences: list[int] = []
+        self.latencies: list[float] = []
+        self.last_progress: dict[int, int] = {}
+        self.progress_messages = 0
+        # received the last event
+        self.completed = False
+        self.error: Optional[str] = None
+
+        # same as `EventSource` of browser, other responses are buffered by `after_request` to add etag
+        request = (
+            f'GET {LISTEN_URL.format(self.uuid)} HTTP/1.1\r\n'
+            f'Host: {BENCHMARK_HOST}:{port}\r\n'
+            'Accept: text/event-stream\r\n\r\n'
+        )
+        self.socket.sendall(request.encode())
+
+    def feed(self, data: bytes, received_at: float):
+        """
+        Parse received bytes by lines. Each chunk of the response has whole messages,
+        so header and chunk size lines are simply skipped
+        """
+        *lines, self.buffer = (self.buffer + data).split(b'\n')
+        for line in lines:
+            line = line.decode().rstrip('\r')
+            if line.startswith('event: '):
+                self.event = line[len('event: ') :]
+            elif line.startswith('data: '):
+                self.receive(self.event, json.loads(line[len('data: ') :]), received_at)
+                self.event = None
+
+    def receive(self, event: str, data: dict, received_at: float):
+        if data.get('is_last'):
+            self.completed = True
+            return
+
+        if event == 'JOB_RUN':
+            self.progress_messages += 1
+            self.last_progress[data['job_id']] = data['sequence']
+            return
+
+        self.plain_sequences.append(data['sequence'])
+        self.latencies.append(received_at - data['published_at'])
+
+    def close(self):
+        self.socket.close()
+
+
+def read_listeners(listeners: list[Listener], stopped: threading.Event):
+    """
+    Read streams of all listeners in one thread,
+    hundreds of reading threads would spend more CPU on switching than the server spends on sending
+    """
+    selector = selectors.DefaultSelector()
+    for listener in listeners:
+        selector.register(listener.socket, selectors.EVENT_READ, listener)
+
+    while not stopped.is_set() and selector.get_map():
+        for key, _ in selector.select(timeout=POLLING_INTERVAL):
+            listener = key.data
+            try:
+                data = listener.socket.recv(RECEIVE_BYTES)
+            except OSError as e:
+                data = b''
+                listener.error = f'{type(e).__name__}: {e}'
+
+            if data:
+                listener.feed(data, time.time())
+            else:
+                selector.unregister(listener.socket)
+
+    selector.close()
+
+
+def request_json(port: int, method: str, url: str, timeout: Optional[float] = None) -> dict:
+    connection = http.client.HTTPConnection(BENCHMARK_HOST, port, timeout=timeout)
+    try:
+        connection.request(method, url)
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def wait_until(condition, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(POLLING_INTERVAL)
+    return True
+
+
+def publish_events(config: BenchmarkConfig) -> dict:
+    """
+    Announce plain and progress events, then the last event
+    :return: sequences of plain events, last progress sequence of each job
+    """
+    from ap.common.constants import AnnounceEvent
+    from ap.common.multiprocess_sharing import EventBackgroundAnnounce
+    from ap.common.services.sse import MessageAnnouncer
+
+    rng = np.random.default_rng(config.seed)
+    is_progress = rng.random(config.events) < config.progress_ratio
+    job_ids = rng.integers(0, config.jobs, config.events)
+    plain_sequences = []
+    last_progress = {}
+    start = time.perf_counter()
+    for sequence in range(config.events):
+        if config.rate:
+            # keep the pace, without sleeping for each event
+            delay = start + sequence / config.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        data = {'sequence': sequence, 'published_at': time.time()}
+        if is_progress[sequence]:
+            job_id = int(job_ids[sequence])
+            data['job_id'] = job_id
+            last_progress[job_id] = sequence
+            event = EventBackgroundAnnounce(data=data, event=AnnounceEvent.JOB_RUN, job_id=job_id)
+        else:
+            plain_sequences.append(sequence)
+            event = EventBackgroundAnnounce(data=data, event=AnnounceEvent.TRANSACTION_UPDATED)
+        MessageAnnouncer.announce(event)
+
+    last_event = EventBackgroundAnnounce(data={'is_last': True}, event=AnnounceEvent.TRANSACTION_UPDATED)
+    MessageAnnouncer.announce(last_event)
+    return {
+        'plain_sequences': plain_sequences,
+        'last_progress': list(last_progress.items()),
+        'publish_seconds': time.perf_counter() - start,
+    }
+
+
+def run_server(config: BenchmarkConfig):
+    """Run inside the scratch working directory, serve app until stop is requested"""
+    from flask import jsonify
+    from waitress.server import create_server
+
+    from ap import create_app
+    from ap.common.services.sse import MessageAnnouncer
+
+    app = create_app('config.ProdConfig')
+    app.config['IS_SEND_GOOGLE_ANALYTICS'] = False
+    MessageAnnouncer.start_background_cleanup_streamers()
+
+    stopped = threading.Event()
+
+    def stop():
+        stopped.set()
+        return jsonify({}), 200
+
+    app.add_url_rule(
+        PUBLISH_URL, 'benchmark_sse_publish', lambda: (jsonify(publish_events(config)), 200), methods=['POST']
+    )
+    app.add_url_rule(STOP_URL, 'benchmark_sse_stop', stop, methods=['POST'])
+
+    # select() can not watch more than 1024 sockets
+    server = create_server(
+        app,
+        host=BENCHMARK_HOST,
+        port=0,
+        threads=config.server_threads,
+        asyncore_use_poll=True,
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    print(server.effective_port, flush=True)
+
+    stopped.wait()
+    with MessageAnnouncer.streamer_lock:
+        for streamer_uuid in list(MessageAnnouncer.streamers):
+            MessageAnnouncer.remove_streamer(streamer_uuid)
+    # stopped streamers return their threads after waiting for messages
+    wait_until(lambda: server.task_dispatcher.active_count == 0, config.timeout)
+    server.close()
+
+
+def run_benchmark(config: BenchmarkConfig, port: int) -> dict:
+    """Connect listeners to server, let it publish events and wait until they are delivered"""
+    listeners = [Listener(port) for _ in range(config.clients)]
+    stopped = threading.Event()
+    reader = threading.Thread(target=read_listeners, args=(listeners, stopped), daemon=True)
+    start = time.perf_counter()
+    reader.start()
+
+    # streamer of a listener is created when its request is handled
+    wait_until(
+        lambda: request_json(port, 'GET', STATS_URL, config.timeout)['connected_clients'] >= config.clients,
+        config.timeout,
+    )
+    connect_seconds = time.perf_counter() - start
+    stats_before = request_json(port, 'GET', STATS_URL, config.timeout)
+
+    start = time.perf_counter()
+    published = request_json(port, 'POST', PUBLISH_URL)
+    wait_until(lambda: all(listener.completed or listener.error for listener in listeners), config.timeout)
+    delivery_seconds = time.perf_counter() - start
+
+    stats = request_json(port, 'GET', STATS_URL, config.timeout)
+    request_json(port, 'POST', STOP_URL, config.timeout)
+    stopped.set()
+    reader.join()
+    for listener in listeners:
+        listener.close()
+
+    plain_sequences = set(published['plain_sequences'])
+    missing_messages = sum(
+        len(plain_sequences - set(listener.plain_sequences)) for listener in listeners if not listener.error
+    )
+    missing_last_progress = sum(
+        sum(listener.last_progress.get(job_id) != sequence for job_id, sequence in published['last_progress'])
+        for listener in listeners
+        if not listener.error
+    )
+    latencies = np.concatenate([listener.latencies for listener in listeners] + [[]]) * 1000
+    completed_clients = sum(listener.completed for listener in listeners)
+
+    result = {
+        'clients': config.clients,
+        'connected_clients': stats_before['connected_clients'],
+        'completed_clients': completed_clients,
+        'connect_seconds': round(connect_seconds, 4),
+        'publish_seconds': round(published['publish_seconds'], 4),
+        'delivery_seconds': round(delivery_seconds, 4),
+        'published_messages': stats['published_messages'] - stats_before['published_messages'],
+        'delivered_messages': int(sum(len(listener.latencies) + listener.progress_messages for listener in listeners)),
+        'coalesced_messages': stats['coalesced_messages'] - stats_before['coalesced_messages'],
+        'dropped_messages': stats['dropped_messages'] - stats_before['dropped_messages'],
+        'missing_messages': missing_messages,
+        'missing_last_progress': missing_last_progress,
+        'latency_ms': {
+            f'p{percentile}': round(float(np.percentile(latencies, percentile)), 2) if len(latencies) else None
+            for percentile in (50, 95, 99, 100)
+        },
+        'errors': [listener.error for listener in listeners if listener.error][:10],
+    }
+    logger.info(f'[BENCHMARK] {result}')
+
+    return {
+        'config': config.model_dump(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_at': datetime.now().isoformat(),
+        },
+        'result': result,
+        'ok': completed_clients == config.clients and missing_messages == 0 and missing_last_progress == 0,
+    }
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    defaults = BenchmarkConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=defaults.clients, help='concurrent listeners')
+    parser.add_argument('--events', type=int, default=defaults.events, help='announced events')
+    parser.add_argument('--rate', type=float, default=defaults.rate, help='events per second, 0 for a single burst')
+    parser.add_argument('--progress-ratio', type=float, default=defaults.progress_ratio)
+    parser.add_argument('--jobs', type=int, default=defaults.jobs, help='jobs of progress events')
+    parser.add_argument(
+        '--server-threads',
+        type=int,
+        default=defaults.server_threads,
+        help='waitress threads, same as main.py by default',
+    )
+    parser.add_argument('--timeout', type=float, default=defaults.timeout)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--workdir', help='scratch working directory, a temporary one is used by default')
+    parser.add_argument('--output', help='json result file, printed to stdout by default')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    if args.worker:
+        run_server(BenchmarkConfig.model_validate_json(args.worker))
+        return
+
+    config = BenchmarkConfig(
+        clients=args.clients,
+        events=args.events,
+        rate=args.rate,
+        progress_ratio=args.progress_ratio,
+        jobs=args.jobs,
+        server_threads=args.server_threads,
+        timeout=args.timeout,
+        seed=args.seed,
+    )
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ap_benchmark_')
+    prepare_workdir(workdir)
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [APP_ROOT, env.get('PYTHONPATH')]))
+    server = subprocess.Popen(
+        [sys.executable, '-m', __spec__.name, '--worker', config.model_dump_json()],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        # server prints its port when it is ready
+        port = int(server.stdout.readline())
+        result = run_benchmark(config, port)
+        server.wait(config.timeout)
+        # both processes share the CPUs, listeners reading hundreds of streams are not free
+        times = os.times()
+        result['result']['listener_cpu_seconds'] = round(times.user + times.system, 2)
+        result['result']['server_cpu_seconds'] = round(times.children_user + times.children_system, 2)
+    finally:
+        if server.poll() is None:
+            server.kill()
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+    if not result['ok']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
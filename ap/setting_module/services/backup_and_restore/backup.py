@@ -1,86 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import pandas as pd
 
-from ap.api.setting_module.services.data_import import save_proc_data_count_multiple_dfs
-from ap.common.constants import AnnounceEvent
+from ap.api.setting_module.services.data_import import gen_proc_data_count_multiple_dfs, save_proc_data_count_df
+from ap.common.constants import DATE_FORMAT_FOR_ONE_HOUR, AnnounceEvent
 from ap.common.multiprocess_sharing import EventBackgroundAnnounce, EventQueue
 from ap.common.pydn.dblib.db_proxy import DbProxy, gen_data_source_of_universal_db
-from ap.setting_module.services.backup_and_restore.backup_file_manager import BackupKey, BackupKeysManager
+from ap.setting_module.services.backup_and_restore.backup_file_manager import (
+    FILE_WORKERS,
+    BackupKey,
+    BackupKeysManager,
+    iter_in_executor,
+)
 from ap.setting_module.services.backup_and_restore.duplicated_check import (
     get_df_insert_and_duplicated_ids,
+    get_drop_duplicated_columns,
     remove_unused_columns_and_add_missing_columns,
 )
 from ap.trace_data.transaction_model import TransactionData
 
 
 def backup_db_data(process_id: int, start_time: str, end_time: str):
+    """Move data of each day from transaction table to its backup file.
+    Database is only accessed from this thread, day files are merged and written by `FILE_WORKERS` threads meanwhile,
+    together with changes of data count, so that this thread only reads, deletes and commits.
+    Rows of a day are deleted only after its backup file was replaced, so an interruption never loses data.
+    Data count moves deleted rows to the file side, except the ones which were already in backup file and counted there,
+    so that data count of file never exceeds its rows, also when an interrupted backup is resumed.
+    Importing jobs cannot run at the same time, they conflict with backup job.
+    """
     backup_keys_manager = BackupKeysManager(process_id=process_id, start_time=start_time, end_time=end_time)
 
-    # TODO: get min max date in database before running this
-    backup_keys = backup_keys_manager.get_backup_keys_by_day()
+    # create transaction outside to avoid looping, we only modify `t_table` so this is fine
+    transaction_data = TransactionData(process_id)
+
+    # only days between the first and the last data in range are backed up
+    with DbProxy(gen_data_source_of_universal_db(proc_id=process_id), True) as db_instance:
+        min_time, max_time = transaction_data.get_min_max_time_by_time_range(
+            db_instance,
+            pd.to_datetime(backup_keys_manager.start_time, utc=True),
+            pd.to_datetime(backup_keys_manager.end_time, utc=True),
+        )
+    backup_keys = backup_keys_manager.get_backup_keys_by_day(min_time, max_time) if min_time is not None else []
     total_backup_keys = len(backup_keys)
 
     if total_backup_keys == 0:
         # nothing to do
         yield 100
 
-    # create transaction outside to avoid looping, we only modify `t_table` so this is fine
-    transaction_data = TransactionData(process_id)
-    for i, backup_key in enumerate(backup_keys):
-        backup_db_data_from_key(transaction_data, backup_keys_manager, backup_key)
-        yield (i + 1) * 100 / total_backup_keys
+    get_date_col = transaction_data.getdate_column.bridge_column_name
+    drop_duplicated_columns = get_drop_duplicated_columns(transaction_data)
+
+    def read_days():
+        for backup_key in backup_keys:
+            df_from_db = get_backup_data_from_db(transaction_data, backup_keys_manager, backup_key)
+            yield backup_key, df_from_db, get_file_data_count(transaction_data, backup_key)
+
+    def write_day(day):
+        backup_key, df_from_db, dic_file_count = day
+        return write_backup_file(backup_key, df_from_db, get_date_col, drop_duplicated_columns, dic_file_count)
+
+    with ThreadPoolExecutor(max_workers=FILE_WORKERS) as executor:
+        for i, ((backup_key, *_), count_df) in enumerate(iter_in_executor(executor, write_day, read_days())):
+            if count_df is not None:
+                remove_backup_data_from_db(transaction_data, backup_keys_manager, backup_key, count_df)
+            yield (i + 1) * 100 / total_backup_keys
 
     EventQueue.put(EventBackgroundAnnounce(data=True, event=AnnounceEvent.BACKUP_DATA_FINISHED))
 
 
-def backup_db_data_from_key(
+def get_backup_data_from_db(
     transaction_data: TransactionData,
     backup_keys_manager: BackupKeysManager,
     backup_key: BackupKey,
-):
-    with DbProxy(
-        gen_data_source_of_universal_db(proc_id=transaction_data.process_id),
-        True,
-    ) as db_instance:
-        get_date_col = transaction_data.getdate_column.bridge_column_name
-        df_from_db: pd.DataFrame = transaction_data.get_transaction_by_time_range(
+) -> pd.DataFrame:
+    with DbProxy(gen_data_source_of_universal_db(proc_id=transaction_data.process_id), True) as db_instance:
+        return transaction_data.get_transaction_by_time_range(
             db_instance,
             backup_keys_manager.get_start_time(backup_key),
             backup_keys_manager.get_end_time(backup_key),
         )
-        if df_from_db.empty:
-            return
 
-        # remove data in transaction table
-        transaction_data.remove_transaction_by_time_range(
+
+def get_file_data_count(transaction_data: TransactionData, backup_key: BackupKey) -> dict[str, int]:
+    """Data count of backup file of the day, by hour"""
+    with DbProxy(gen_data_source_of_universal_db(proc_id=transaction_data.process_id), True) as db_instance:
+        _, rows = transaction_data.select_data_count(
             db_instance,
-            backup_keys_manager.get_start_time(backup_key),
-            backup_keys_manager.get_end_time(backup_key),
+            backup_key.start_time.strftime(DATE_FORMAT_FOR_ONE_HOUR),
+            backup_key.end_time.strftime(DATE_FORMAT_FOR_ONE_HOUR),
+            count_in_file=True,
         )
+    return {hour: count for hour, count in rows}
 
-        df_file = backup_key.read_file()
-        # overwrite columns from database to file
-        df_file = remove_unused_columns_and_add_missing_columns(df_file, df_from_db.columns)
 
-        df_insert = get_df_insert_and_duplicated_ids(
-            transaction_data,
-            df_insert=df_from_db,
-            df_old=df_file,
-        )
+def write_backup_file(
+    backup_key: BackupKey,
+    df_from_db: pd.DataFrame,
+    get_date_col: str,
+    drop_duplicated_columns: list[str],
+    dic_file_count: dict[str, int],
+) -> Optional[pd.DataFrame]:
+    """
+    Merge data from database into backup file of the day, run in file worker thread
+    :return: changes of data count, None if there is nothing to back up
+    """
+    if df_from_db.empty:
+        return None
 
-        df_file_overwrite = pd.concat(
-            [
-                # remove duplicated ids in `df_file`
-                df_file,
-                df_insert,
-            ],
-        )
+    df_file = backup_key.read_file()
+    # overwrite columns from database to file
+    df_file = remove_unused_columns_and_add_missing_columns(df_file, df_from_db.columns)
+
+    df_insert = get_df_insert_and_duplicated_ids(
+        get_date_col,
+        drop_duplicated_columns,
+        df_insert=df_from_db,
+        df_old=df_file,
+    )
+
+    df_file_overwrite = pd.concat(
+        [
+            # remove duplicated ids in `df_file`
+            df_file,
+            df_insert,
+        ],
+    )
+    backup_key.write_file(df_file_overwrite)
+
+    return gen_proc_data_count_multiple_dfs(
+        get_date_col=get_date_col,
+        dfs_pop_from_db=df_from_db,
+        dfs_push_to_file=[
+            df_insert,
+            get_uncounted_rows(df_file, df_from_db.drop(index=df_insert.index), get_date_col, dic_file_count),
+        ],
+    )
+
+
+def get_uncounted_rows(
+    df_file: pd.DataFrame,
+    df_duplicated: pd.DataFrame,
+    get_date_col: str,
+    dic_file_count: dict[str, int],
+) -> pd.DataFrame:
+    """
+    Rows from database which are already in backup file, but are not counted in data count of file.
+    They are left by a backup which was interrupted after writing file, before deleting them from database.
+    Rows of an hour are uncounted only as many as the file has more rows than its data count.
+    """
+    if df_duplicated.empty:
+        return df_duplicated
+
+    file_hours = pd.to_datetime(df_file[get_date_col], errors='coerce').dt.strftime(DATE_FORMAT_FOR_ONE_HOUR)
+    uncounted = file_hours.value_counts().sub(pd.Series(dic_file_count, dtype='int64'), fill_value=0).clip(lower=0)
+
+    hours = pd.to_datetime(df_duplicated[get_date_col], errors='coerce').dt.strftime(DATE_FORMAT_FOR_ONE_HOUR)
+    is_uncounted = hours.groupby(hours).cumcount() < hours.map(uncounted).fillna(0)
+    return df_duplicated[is_uncounted.to_numpy()]
 
-        save_proc_data_count_multiple_dfs(
+
+def remove_backup_data_from_db(
+    transaction_data: TransactionData,
+    backup_keys_manager: BackupKeysManager,
+    backup_key: BackupKey,
+    count_df: pd.DataFrame,
+):
+    """Remove backed up rows from transaction table, deleting and data count are committed together"""
+    with DbProxy(gen_data_source_of_universal_db(proc_id=transaction_data.process_id), True) as db_instance:
+        transaction_data.remove_transaction_by_time_range(
             db_instance,
-            proc_id=backup_key.process_id,
-            get_date_col=get_date_col,
-            dfs_pop_from_db=df_from_db,
-            dfs_push_to_file=df_insert,
+            backup_keys_manager.get_start_time(backup_key),
+            backup_keys_manager.get_end_time(backup_key),
         )
 
-        backup_key.write_file(df_file_overwrite)
+        save_proc_data_count_df(db_instance, proc_id=backup_key.process_id, count_df=count_df)
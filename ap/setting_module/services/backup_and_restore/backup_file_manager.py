@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import contextlib
+import os
+from collections import deque
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, ClassVar
+from typing import Any, Callable, ClassVar, Iterable, Iterator, TypeVar
 
 import pandas as pd
 from pydantic import BaseModel
@@ -15,6 +18,12 @@ from ap.common.common_utils import (
 from ap.common.constants import UNDER_SCORE, CsvDelimiter, FileExtension
 from ap.common.path_utils import get_backup_data_folder
 
+# number of day files which are read or written at the same time
+FILE_WORKERS = 4
+
+T = TypeVar('T')
+R = TypeVar('R')
+
 
 class BackupKey(BaseModel):
     FIlE_EXTENSION: ClassVar[str] = FileExtension.Parquet.value
@@ -56,12 +65,26 @@ class BackupKey(BaseModel):
             return pd.DataFrame()
         return read_parquet_file(str(self.filename))
 
+    @property
+    def temp_filename(self) -> Path:
+        # not a valid backup file name, so that it is never read as a backup file
+        return self.filename.with_name(f'.{self.filename.name}.tmp')
+
     def write_file(self, dataframe: pd.DataFrame) -> None:
+        """Replace backup file atomically, the old file is kept if writing is interrupted"""
         if dataframe.empty:
             self.delete_file()
-        else:
-            self.make_backup_dir()
-            write_parquet_file(dataframe, str(self.filename))
+            return
+
+        self.make_backup_dir()
+        temp_filename = self.temp_filename
+        try:
+            temp_filename = Path(write_parquet_file(dataframe, str(temp_filename)))
+            with open(temp_filename, 'rb+') as f:
+                os.fsync(f.fileno())
+            os.replace(temp_filename, self.filename)
+        finally:
+            temp_filename.unlink(missing_ok=True)
 
 
 class BackupKeysManager(BaseModel):
@@ -81,12 +104,20 @@ class BackupKeysManager(BaseModel):
     def get_end_time(self, backup_key: BackupKey) -> datetime:
         return pd.to_datetime(min(self.end_time, backup_key.end_time), utc=True)
 
-    def get_backup_keys_by_day(self) -> list[BackupKey]:
-        """Get all non-overlap separated by day backup keys"""
+    def get_backup_keys_by_day(self, min_time=None, max_time=None) -> list[BackupKey]:
+        """Get all non-overlap separated by day backup keys
+        :param min_time: time of the first existing data, days before it are skipped
+        :param max_time: time of the last existing data, days after it are skipped
+        """
         backup_keys = []
 
         current_date = self.start_time.date()
         end_date = self.end_time.date()
+        if min_time is not None:
+            current_date = max(current_date, pd.to_datetime(min_time, utc=True).date())
+        if max_time is not None:
+            end_date = min(end_date, pd.to_datetime(max_time, utc=True).date())
+
         while current_date <= end_date:
             next_date = current_date + timedelta(days=1)
             backup_keys.append(
@@ -99,3 +130,25 @@ class BackupKeysManager(BaseModel):
             current_date = next_date
 
         return backup_keys
+
+
+def iter_in_executor(
+    executor: Executor,
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    window: int = FILE_WORKERS,
+) -> Iterator[tuple[T, R]]:
+    """Run `fn` for each item in executor, yield results in order of items.
+    Items are taken lazily, at most `window` of them are running or waiting to be consumed,
+    so that memory stays bounded however long the range is.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, executor.submit(fn, item)))
+        if len(pending) >= window:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
@@ -1,34 +1,134 @@
 from __future__ import annotations
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import infer_dtype, is_datetime64_any_dtype, is_integer_dtype, is_numeric_dtype
 
 from ap.setting_module.models import CfgProcessColumn
 from ap.trace_data.transaction_model import TransactionData
 
 
 def get_df_insert_and_duplicated_ids(
-    transaction_data: TransactionData,
+    get_date_col: str,
+    drop_duplicated_columns: list[str],
     *,
     df_insert: pd.DataFrame,
     df_old: pd.DataFrame,
 ) -> pd.DataFrame:
-    """Should return inserting dataframe"""
+    """Should return inserting dataframe.
+    It only takes column names, so that it can run in file worker threads, where config models must not be loaded.
+    """
     if df_old.empty or df_insert.empty:
         return df_insert
 
     # convert datetime columns (because edge server handle datetime column as string)
-    get_date_col = transaction_data.getdate_column.bridge_column_name
     df_insert[get_date_col] = pd.to_datetime(df_insert[get_date_col])
     df_old[get_date_col] = pd.to_datetime(df_old[get_date_col])
 
-    drop_duplicated_columns = get_drop_duplicated_columns(transaction_data)
-    df_insert_indexes = df_insert.set_index(drop_duplicated_columns).index
-    df_old_indexes = df_old.set_index(drop_duplicated_columns).index
+    df_insert_keys, df_old_keys = get_row_keys(df_insert, df_old, drop_duplicated_columns)
+    insert_hashes, old_hashes = hash_rows(df_insert_keys), hash_rows(df_old_keys)
 
-    df_insert = df_insert[~df_insert_indexes.isin(df_old_indexes)]
+    is_duplicated = np.isin(insert_hashes, old_hashes)
+    if is_duplicated.any():
+        # different keys may have the same hash, confirm by comparing keys of rows with the same hashes
+        df_old_keys = df_old_keys[np.isin(old_hashes, insert_hashes[is_duplicated])]
+        is_duplicated[is_duplicated] = pd.MultiIndex.from_frame(df_insert_keys[is_duplicated]).isin(
+            pd.MultiIndex.from_frame(df_old_keys),
+        )
+
+    df_insert = df_insert[~is_duplicated]
     return df_insert
 
 
+# missing value of text key columns, it must not be equal to any real text
+NA_TEXT_KEY = '\x00'
+
+# missing value of integer key columns
+NA_INTEGER_KEY = np.iinfo(np.int64).min
+
+INTEGER_INFERRED_TYPES = ('integer', 'boolean')
+NUMBER_INFERRED_TYPES = (*INTEGER_INFERRED_TYPES, 'floating', 'mixed-integer-float', 'decimal')
+DATETIME_INFERRED_TYPES = ('datetime', 'datetime64', 'date')
+
+
+def get_key_type(series: pd.Series) -> str | None:
+    """Kind of values of a key column, None if there is no value"""
+    if is_datetime64_any_dtype(series):
+        return 'datetime'
+
+    if is_integer_dtype(series) or series.dtype == bool:
+        return 'integer'
+
+    if is_numeric_dtype(series):
+        return 'number'
+
+    inferred_type = infer_dtype(series, skipna=True)
+    if inferred_type == 'empty':
+        return None
+    if inferred_type in INTEGER_INFERRED_TYPES:
+        return 'integer'
+    if inferred_type in NUMBER_INFERRED_TYPES:
+        return 'number'
+    if inferred_type in DATETIME_INFERRED_TYPES:
+        return 'datetime'
+    return 'text'
+
+
+def get_key_values(series: pd.Series, key_type: str) -> np.ndarray:
+    """Values of a key column in a canonical numpy dtype, so that equal values have the same hash in both frames"""
+    if key_type == 'datetime':
+        values = pd.to_datetime(series, utc=True).to_numpy(dtype='datetime64[ns]')
+        return values.view(np.int64)
+
+    if key_type == 'integer':
+        values = pd.to_numeric(series, dtype_backend='numpy_nullable')
+        return values.to_numpy(dtype=np.int64, na_value=NA_INTEGER_KEY)
+
+    if key_type == 'number':
+        values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        # -0.0 and 0.0 are equal, but their bits are different
+        values = values + 0.0
+        values[np.isnan(values)] = np.nan
+        return values
+
+    return np.where(series.isna(), NA_TEXT_KEY, series.astype(str)).astype(object)
+
+
+def get_row_keys(
+    df_left: pd.DataFrame,
+    df_right: pd.DataFrame,
+    columns: list[str],
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Key columns of each row in canonical types.
+    Database data is read as objects while file data has typed columns,
+    so each key column is converted to the same canonical type in both dataframes.
+    :return: key columns of left and right dataframes
+    """
+    dic_left = {}
+    dic_right = {}
+    for column in columns:
+        left, right = df_left[column], df_right[column]
+        key_types = {key_type for key_type in (get_key_type(left), get_key_type(right)) if key_type}
+        if not key_types:
+            key_type = 'text'
+        elif len(key_types) == 1:
+            key_type = key_types.pop()
+        elif key_types == {'integer', 'number'}:
+            key_type = 'number'
+        else:
+            key_type = 'text'
+
+        dic_left[column] = get_key_values(left, key_type)
+        dic_right[column] = get_key_values(right, key_type)
+
+    return pd.DataFrame(dic_left, copy=False), pd.DataFrame(dic_right, copy=False)
+
+
+def hash_rows(df_keys: pd.DataFrame) -> np.ndarray:
+    """64 bits hash of each row, rows with equal keys have equal hashes but different rows may collide"""
+    return pd.util.hash_pandas_object(df_keys, index=False).to_numpy()
+
+
 def remove_unused_columns_and_add_missing_columns(
     df: pd.DataFrame,
     required_columns: list[str] | pd.Index,
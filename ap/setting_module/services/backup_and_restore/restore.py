@@ -1,27 +1,46 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
 import pandas as pd
 
 from ap.api.setting_module.services.data_import import (
     gen_bulk_insert_sql,
+    gen_proc_data_count_multiple_dfs,
     get_insert_params,
     insert_data,
-    save_proc_data_count_multiple_dfs,
+    save_proc_data_count_df,
 )
 from ap.common.constants import DATE_FORMAT_STR, AnnounceEvent
 from ap.common.multiprocess_sharing import EventBackgroundAnnounce, EventQueue
 from ap.common.pydn.dblib.db_proxy import DbProxy, gen_data_source_of_universal_db
-from ap.setting_module.services.backup_and_restore.backup_file_manager import BackupKey, BackupKeysManager
+from ap.setting_module.services.backup_and_restore.backup_file_manager import (
+    FILE_WORKERS,
+    BackupKey,
+    BackupKeysManager,
+    iter_in_executor,
+)
 from ap.setting_module.services.backup_and_restore.duplicated_check import (
     get_df_insert_and_duplicated_ids,
+    get_drop_duplicated_columns,
     remove_unused_columns_and_add_missing_columns,
 )
 from ap.trace_data.transaction_model import TransactionData
 
 
 def restore_db_data(process_id, start_time, end_time):
+    """Move data of each day from its backup file back to transaction table.
+    Day files are read, counted and rewritten by `FILE_WORKERS` threads, database is only accessed from this thread.
+    Restored rows are committed before their backup file is rewritten,
+    if it is interrupted in between, those rows are dropped as duplicated by the next restore.
+    Data count moves only inserted rows from the file side, so that those dropped rows are not counted again.
+    """
     backup_keys_manager = BackupKeysManager(process_id=process_id, start_time=start_time, end_time=end_time)
 
-    # TODO: get min max date in database before running this
-    backup_keys = backup_keys_manager.get_backup_keys_by_day()
+    # only days which have backup file are restored
+    backup_keys = [
+        backup_key for backup_key in backup_keys_manager.get_backup_keys_by_day() if backup_key.filename.exists()
+    ]
     total_backup_keys = len(backup_keys)
 
     if total_backup_keys == 0:
@@ -30,39 +49,84 @@ def restore_db_data(process_id, start_time, end_time):
 
     # create transaction outside to avoid looping, we only modify `t_table` so this is fine
     transaction_data = TransactionData(process_id)
-    for i, backup_key in enumerate(backup_keys):
-        restore_db_data_from_file(transaction_data, backup_keys_manager, backup_key)
-        yield (i + 1) * 100 / total_backup_keys
+    get_date_col = transaction_data.getdate_column.bridge_column_name
+    drop_duplicated_columns = get_drop_duplicated_columns(transaction_data)
+
+    def read_day(backup_key):
+        return read_restore_file(backup_keys_manager, backup_key, get_date_col)
+
+    write_futures: list[Future] = []
+    with ThreadPoolExecutor(max_workers=FILE_WORKERS) as executor:
+        for i, (backup_key, restore_file) in enumerate(iter_in_executor(executor, read_day, backup_keys)):
+            if restore_file is None:
+                write_futures.append(executor.submit(backup_key.delete_file))
+            elif not restore_file.df_restore.empty:
+                restore_db_data_from_file(
+                    transaction_data,
+                    backup_keys_manager,
+                    backup_key,
+                    restore_file,
+                    drop_duplicated_columns,
+                )
+                write_futures.append(executor.submit(backup_key.write_file, restore_file.df_remaining))
+
+            # raise error of writing as soon as possible
+            for future in [future for future in write_futures if future.done()]:
+                write_futures.remove(future)
+                future.result()
+
+            yield (i + 1) * 100 / total_backup_keys
+
+        for future in write_futures:
+            future.result()
 
     EventQueue.put(EventBackgroundAnnounce(data=True, event=AnnounceEvent.RESTORE_DATA_FINISHED))
 
 
-def restore_db_data_from_file(
-    transaction_data: TransactionData,
+@dataclass
+class RestoreFile:
+    # rows in restoring time range
+    df_restore: pd.DataFrame
+    # rows out of restoring time range, they are kept in backup file
+    df_remaining: pd.DataFrame
+
+
+def read_restore_file(
     backup_keys_manager: BackupKeysManager,
     backup_key: BackupKey,
-):
+    get_date_col: str,
+) -> Optional[RestoreFile]:
+    """
+    Read backup file of the day, run in file worker thread
+    :return: rows to restore and rows to keep, None if backup file is empty
+    """
     df_file = backup_key.read_file()
-
     if df_file.empty:
-        backup_key.delete_file()
-        return
+        return None
+
+    df_file[get_date_col] = pd.to_datetime(df_file[get_date_col])
+
+    is_between = (df_file[get_date_col] >= backup_keys_manager.get_start_time(backup_key)) & (
+        df_file[get_date_col] < backup_keys_manager.get_end_time(backup_key)
+    )
+    return RestoreFile(df_restore=df_file[is_between], df_remaining=df_file[~is_between])
+
 
+def restore_db_data_from_file(
+    transaction_data: TransactionData,
+    backup_keys_manager: BackupKeysManager,
+    backup_key: BackupKey,
+    restore_file: RestoreFile,
+    drop_duplicated_columns: list[str],
+):
+    """Insert rows of backup file which are not in transaction table yet, committed together with data count.
+    Rows which are already in transaction table were restored by an interrupted restore, their data count was moved.
+    """
     with DbProxy(
         gen_data_source_of_universal_db(proc_id=transaction_data.process_id),
         True,
     ) as db_instance:
         get_date_col = transaction_data.getdate_column.bridge_column_name
-        df_file[get_date_col] = pd.to_datetime(df_file[get_date_col])
-
-        is_between = (df_file[get_date_col] >= backup_keys_manager.get_start_time(backup_key)) & (
-            df_file[get_date_col] < backup_keys_manager.get_end_time(backup_key)
-        )
-
-        df_insert = df_file[is_between]
-        if df_insert.empty:
-            # nothing to insert
-            return
 
         # get data from db to drop duplicates
         df_from_db: pd.DataFrame = transaction_data.get_transaction_by_time_range(
@@ -72,14 +136,20 @@ def restore_db_data_from_file(
         )
 
         # overwrite columns from database to file
-        df_insert = remove_unused_columns_and_add_missing_columns(df_insert, df_from_db.columns)
+        df_insert = remove_unused_columns_and_add_missing_columns(restore_file.df_restore, df_from_db.columns)
 
         df_insert = get_df_insert_and_duplicated_ids(
-            transaction_data,
+            get_date_col,
+            drop_duplicated_columns,
             df_insert=df_insert,
             df_old=df_from_db,
         )
 
+        count_df = gen_proc_data_count_multiple_dfs(
+            get_date_col=get_date_col,
+            dfs_push_to_db=df_insert,
+            dfs_pop_from_file=df_insert,
+        )
         if not df_insert.empty:
             sql_params = get_insert_params(df_insert.columns)
             sql_insert = gen_bulk_insert_sql(transaction_data.table_name, *sql_params)
@@ -87,13 +157,4 @@ def restore_db_data_from_file(
             df_insert[get_date_col] = df_insert[get_date_col].dt.strftime(DATE_FORMAT_STR)
             insert_data(db_instance, sql_insert, df_insert.to_numpy().tolist())
 
-        save_proc_data_count_multiple_dfs(
-            db_instance,
-            proc_id=backup_key.process_id,
-            get_date_col=get_date_col,
-            dfs_push_to_db=df_insert,
-            dfs_pop_from_file=df_file[is_between],
-        )
-
-        df_file_remaining = df_file[~is_between]
-        backup_key.write_file(df_file_remaining)
+        save_proc_data_count_df(db_instance, proc_id=backup_key.process_id, count_df=count_df)
@@ -896,6 +896,18 @@ WHERE type = 'index'
 
         yield from data
 
+    def get_min_max_time_by_time_range(self, db_instance: Union[SQLite3], start_time, end_time):
+        time_col = self.getdate_column.bridge_column_name
+        sql = f"""
+            SELECT MIN({time_col}), MAX({time_col})
+            FROM {self.table_name}
+            WHERE  {time_col} >= {SQL_PARAM_SYMBOL}
+                AND {time_col} < {SQL_PARAM_SYMBOL}
+        """
+        params = [start_time, end_time]
+        _, rows = db_instance.run_sql(sql, row_is_dict=False, params=params)
+        return rows[0][0], rows[0][1]
+
     def get_transaction_by_time_range(self, db_instance: Union[SQLite3], start_time, end_time, limit=1_000_000):
         sql = f"""
             SELECT *